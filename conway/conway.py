@@ -6,29 +6,250 @@ A simple Python/matplotlib implementation of Conway's Game of Life.
 Author: Mahesh Venkitachalam
 """
 
-import sys, argparse
+import sys, os, argparse, time, struct, zlib
 import numpy as np
-import matplotlib.pyplot as plt 
-import matplotlib.animation as animation
+from hashlife import HashLife
 
 ON = 255
 OFF = 0
 vals = [ON, OFF]
 
-def randomGrid(N):
+# about this many cells/words are processed at once by the packed grid,
+# which bounds the temporary memory for very large grids
+BAND_SIZE = 1 << 22
+
+class PackedGrid:
+    """
+    an NxN ON/OFF grid stored as 64 cells per uint64 word:
+    cell (i, j) is bit j%64 of words[i, j//64]. bits past column N-1 are always 0.
+    """
+    def __init__(self, N, words=None):
+        self.N = N
+        self.nwords = (N + 63) // 64
+        if words is None:
+            words = np.zeros((N, self.nwords), dtype=np.uint64)
+        self.words = words
+        # position of column N-1 in the last word, and the mask of its valid bits
+        self.lastBit = np.uint64((N - 1) % 64)
+        self.lastMask = np.uint64((1 << ((N - 1) % 64 + 1)) - 1)
+
+    @classmethod
+    def fromArray(cls, grid):
+        """packs an ON/OFF array"""
+        return cls(grid.shape[0], packRows(grid == ON, (grid.shape[1] + 63) // 64))
+
+    def toArray(self):
+        """unpacks into an NxN uint8 ON/OFF array"""
+        bits = np.unpackbits(self.words.astype('<u8').view(np.uint8), axis=1,
+                             bitorder='little')[:, :self.N]
+        return bits * np.uint8(ON)
+
+    def setBlock(self, i, j, block):
+        """copies an ON/OFF pattern with top left cell at (i, j)"""
+        for r, c in np.ndindex(block.shape):
+            word, bit = divmod(j + c, 64)
+            mask = np.uint64(1 << bit)
+            if block[r, c] == ON:
+                self.words[i + r, word] |= mask
+            else:
+                self.words[i + r, word] &= ~mask
+
+    def population(self):
+        """returns the number of ON cells"""
+        # popcount of the packed words, a band of rows at a time
+        total = 0
+        band = max(1, BAND_SIZE // self.nwords)
+        for r0 in range(0, self.N, band):
+            total += int(popcount(self.words[r0:r0 + band]).sum(dtype=np.int64))
+        return total
+
+    def west(self, rows):
+        """bit j of the result is cell j-1 (with wrap around)"""
+        out = (rows << ONE) | (np.roll(rows, 1, axis=1) >> SHIFT63)
+        out[:, 0] = (rows[:, 0] << ONE) | ((rows[:, -1] >> self.lastBit) & ONE)
+        return out
+
+    def east(self, rows):
+        """bit j of the result is cell j+1 (with wrap around)"""
+        out = (rows >> ONE) | (np.roll(rows, -1, axis=1) << SHIFT63)
+        out[:, -1] = (rows[:, -1] >> ONE) | ((rows[:, 0] & ONE) << self.lastBit)
+        return out
+
+    def nextRows(self, rows):
+        """
+        returns the next generation of rows[1:-1], rows[0] and rows[-1]
+        being the rows just above and below them
+        """
+        # bit-sliced counting: every bit position is an independent cell.
+        # 2-bit sums of the 3 cells of each row, and of the 2 side cells
+        # for the middle row (the cell itself is not a neighbor)
+        w = self.west(rows)
+        e = self.east(rows)
+        we = w ^ e
+        h0 = we ^ rows
+        h1 = (w & e) | (rows & we)
+        a0, a1 = h0[:-2], h1[:-2]
+        b0, b1 = we[1:-1], (w & e)[1:-1]
+        c0, c1 = h0[2:], h1[2:]
+        # full adder of the 1s bits, the carry has weight 2
+        ab0 = a0 ^ b0
+        s0 = ab0 ^ c0
+        carry = (a0 & b0) | (c0 & ab0)
+        # the count is s0 + 2*k, k being the number of the 4 weight-2 bits set:
+        # odd k gives the 2s bit, k >= 2 means 4 or more neighbors
+        x = a1 ^ b1
+        y = c1 ^ carry
+        twos = x ^ y
+        many = (a1 & b1) | (c1 & carry) | (x & y)
+        # apply Conway's rules: 3 neighbors, or 2 neighbors and ON
+        new = twos & ~many & (s0 | rows[1:-1])
+        new[:, -1] &= self.lastMask
+        return new
+
+    def next(self):
+        """returns the next generation as a new PackedGrid"""
+        N = self.N
+        newWords = np.empty_like(self.words)
+        band = max(1, BAND_SIZE // self.nwords)
+        for r0 in range(0, N, band):
+            r1 = min(N, r0 + band)
+            # rows r0-1 .. r1 using toroidal boundary conditions
+            rows = self.words[np.arange(r0 - 1, r1 + 1) % N]
+            newWords[r0:r1] = self.nextRows(rows)
+        return PackedGrid(N, newWords)
+
+    def advance(self, generations=1):
+        """replaces the grid by its state the given number of generations later"""
+        for _ in range(generations):
+            self.words = self.next().words
+
+ONE = np.uint64(1)
+SHIFT63 = np.uint64(63)
+# number of set bits of every byte value
+BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def popcount(words):
+    """returns the number of set bits of every uint64 word"""
+    if hasattr(np, 'bitwise_count'):
+        # numpy >= 2.0
+        return np.bitwise_count(words)
+    return BYTE_BITS[np.ascontiguousarray(words).view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1)
+
+def packRows(alive, nwords):
+    """packs a boolean array row by row into nwords uint64 words per row"""
+    rows = alive.shape[0]
+    packed = np.zeros((rows, nwords * 8), dtype=np.uint8)
+    packedBytes = np.packbits(alive, axis=1, bitorder='little')
+    packed[:, :packedBytes.shape[1]] = packedBytes
+    return packed.view('<u8').astype(np.uint64)
+
+class SparseGrid:
+    """
+    an ON/OFF grid that only recomputes the tiles where something can change:
+    the tiles that changed in the last generation and their 8 neighbors.
+    after each generation, changed holds the (row, col) of the cells that flipped.
+    """
+    def __init__(self, grid, tileSize=64):
+        self.cells = grid
+        self.N = grid.shape[0]
+        self.tileSize = tileSize
+        self.tiles = (self.N + tileSize - 1) // tileSize
+        self.changed = np.empty((0, 2), dtype=np.intp)
+        # only tiles with live cells (and their neighbors) can change at first
+        ti, tj = np.nonzero(grid == ON)
+        self.active = self.neighborTiles(ti // tileSize, tj // tileSize)
+
+    def neighborTiles(self, ti, tj):
+        """flat indices of the given tiles and their neighbors (with wrap around)"""
+        nt = self.tiles
+        flat = [((ti + di) % nt) * nt + (tj + dj) % nt
+                for di in (-1, 0, 1) for dj in (-1, 0, 1)]
+        return np.unique(np.concatenate(flat))
+
+    def setBlock(self, i, j, block):
+        """copies an ON/OFF pattern with top left cell at (i, j)"""
+        h, w = block.shape
+        self.cells[i:i+h, j:j+w] = block
+        T = self.tileSize
+        ti, tj = np.meshgrid(np.arange(i // T, (i + h - 1) // T + 1),
+                             np.arange(j // T, (j + w - 1) // T + 1), indexing='ij')
+        self.active = np.union1d(self.active, self.neighborTiles(ti.ravel(), tj.ravel()))
+
+    def toArray(self):
+        """returns the ON/OFF array (not a copy)"""
+        return self.cells
+
+    def advance(self, generations=1):
+        """advances the grid in place by the given number of generations"""
+        for _ in range(generations):
+            self.advanceOne()
+
+    def advanceOne(self):
+        N, T = self.N, self.tileSize
+        ti, tj = np.divmod(self.active, self.tiles)
+        if not len(ti):
+            self.changed = np.empty((0, 2), dtype=np.intp)
+            return
+        # every active tile with a 1-cell border, using toroidal boundary
+        # conditions at tile borders too
+        offsets = np.arange(-1, T + 1)
+        rows = (ti[:, None] * T + offsets) % N
+        cols = (tj[:, None] * T + offsets) % N
+        block = (self.cells[rows[:, :, None], cols[:, None, :]] == ON).view(np.uint8)
+        # 8-neighbor sums of the tile interiors
+        colSums = block[:, :-2] + block[:, 1:-1] + block[:, 2:]
+        alive = block[:, 1:-1, 1:-1]
+        total = colSums[:, :, :-2] + colSums[:, :, 1:-1] + colSums[:, :, 2:] - alive
+        # apply Conway's rules
+        born = (total == 3) | ((total == 2) & (alive == 1))
+        flipped = born != (alive == 1)
+        # cells of the last tiles past N-1 are wrapped copies of other cells
+        if N % T:
+            inside = np.arange(T) < N % T
+            flipped[ti == self.tiles - 1] &= inside[:, None]
+            flipped[tj == self.tiles - 1] &= inside[None, :]
+        t, a, b = np.nonzero(flipped)
+        r = rows[t, a + 1]
+        c = cols[t, b + 1]
+        self.cells[r, c] = np.where(born[t, a, b], ON, OFF)
+        self.changed = np.stack([r, c], axis=1)
+        # tiles with flipped cells and their neighbors are active next
+        changedTiles = np.unique(t)
+        self.active = self.neighborTiles(ti[changedTiles], tj[changedTiles])
+
+def emptyGrid(N, packed=False):
+    """returns an NxN grid with all cells OFF"""
+    if packed:
+        return PackedGrid(N)
+    return np.zeros((N, N), dtype=np.uint8)
+
+def randomGrid(N, packed=False):
     """returns a grid of NxN random values"""
-    return np.random.choice(vals, N*N, p=[0.2, 0.8]).reshape(N, N)
+    if packed:
+        # the same random stream as below, drawn a band of rows at a time
+        # so that the full NxN grid is never materialized
+        grid = PackedGrid(N)
+        band = max(1, BAND_SIZE // N)
+        for r0 in range(0, N, band):
+            r1 = min(N, r0 + band)
+            grid.words[r0:r1] = packRows(np.random.random_sample((r1 - r0, N)) < 0.2,
+                                         grid.nwords)
+        return grid
+    return np.random.choice(vals, N*N, p=[0.2, 0.8]).astype(np.uint8).reshape(N, N)
 
 def addGlider(i, j, grid):
     """adds a glider with top left cell at (i, j)"""
     glider = np.array([[0,    0, 255], 
                        [255,  0, 255], 
                        [0,  255, 255]])
-    grid[i:i+3, j:j+3] = glider
+    if isinstance(grid, (PackedGrid, SparseGrid)):
+        grid.setBlock(i, j, glider)
+    else:
+        grid[i:i+3, j:j+3] = glider
 
 def addGosperGliderGun(i, j, grid):
     """adds a Gosper Glider Gun with top left cell at (i, j)"""
-    gun = np.zeros(11*38).reshape(11, 38)
+    gun = np.zeros((11, 38), dtype=np.uint8)
 
     gun[5][1] = gun[5][2] = 255
     gun[6][1] = gun[6][2] = 255
@@ -52,33 +273,122 @@ def addGosperGliderGun(i, j, grid):
     gun[3][35] = gun[3][36] = 255
     gun[4][35] = gun[4][36] = 255
 
-    grid[i:i+11, j:j+38] = gun
+    if isinstance(grid, (PackedGrid, SparseGrid)):
+        grid.setBlock(i, j, gun)
+    else:
+        grid[i:i+11, j:j+38] = gun
+
+def neighborCount(alive):
+    """returns the number of live neighbors of every cell of a 0/1 uint8 grid"""
+    # using toroidal boundary conditions - x and y wrap around 
+    # so that the simulaton takes place on a toroidal surface.
+    # sum each 3-row column first, then 3 columns of those sums,
+    # which is 4 rolls instead of 8
+    cols = alive + np.roll(alive, 1, axis=0) + np.roll(alive, -1, axis=0)
+    total = cols + np.roll(cols, 1, axis=1) + np.roll(cols, -1, axis=1)
+    # the 3x3 sum includes the cell itself
+    return total - alive
+
+def step(grid):
+    """returns the next generation of an ON/OFF grid"""
+    if isinstance(grid, PackedGrid):
+        return grid.next()
+    alive = (grid == ON).view(np.uint8)
+    total = neighborCount(alive)
+    # apply Conway's rules: a cell is ON next if it has 3 neighbors,
+    # or if it is ON and has 2 neighbors
+    born = (total == 3) | ((total == 2) & (alive == 1))
+    newGrid = np.full_like(grid, OFF)
+    newGrid[born] = ON
+    return newGrid
 
 def update(frameNum, img, grid, N):
-    # copy grid since we require 8 neighbors for calculation
-    # and we go line by line 
-    newGrid = grid.copy()
-    for i in range(N):
-        for j in range(N):
-            # compute 8-neghbor sum
-            # using toroidal boundary conditions - x and y wrap around 
-            # so that the simulaton takes place on a toroidal surface.
-            total = int((grid[i, (j-1)%N] + grid[i, (j+1)%N] + 
-                         grid[(i-1)%N, j] + grid[(i+1)%N, j] + 
-                         grid[(i-1)%N, (j-1)%N] + grid[(i-1)%N, (j+1)%N] + 
-                         grid[(i+1)%N, (j-1)%N] + grid[(i+1)%N, (j+1)%N])/255)
-            # apply Conway's rules
-            if grid[i, j]  == ON:
-                if (total < 2) or (total > 3):
-                    newGrid[i, j] = OFF
-            else:
-                if total == 3:
-                    newGrid[i, j] = ON
+    if isinstance(grid, (PackedGrid, SparseGrid, HashLife)):
+        grid.advance(1)
+        img.set_data(grid.toArray())
+        return img,
+    # compute the whole next generation at once
+    newGrid = step(grid)
     # update data
     img.set_data(newGrid)
     grid[:] = newGrid[:]
     return img,
 
+def writePNG(fileName, grid):
+    """writes an ON/OFF grid as an 8-bit grayscale PNG (no matplotlib needed)"""
+    height, width = grid.shape
+    # each scanline starts with filter type 0 (none)
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = grid
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+    with open(fileName, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes())))
+        f.write(chunk(b'IEND', b''))
+
+def saveSnapshot(grid, gen, snapshotDir, snapshotFormat):
+    """saves the grid of generation gen as gen<gen>.npz or gen<gen>.png"""
+    fileName = os.path.join(snapshotDir, 'gen%08d.%s' % (gen, snapshotFormat))
+    if isinstance(grid, PackedGrid):
+        if snapshotFormat == 'npz':
+            # keep the 64x smaller packed words
+            np.savez_compressed(fileName, words=grid.words, N=grid.N, generation=gen)
+            return fileName
+        grid = grid.toArray()
+    elif isinstance(grid, (SparseGrid, HashLife)):
+        # HashLife exports the window of the imported grid
+        grid = grid.toArray()
+    if snapshotFormat == 'npz':
+        np.savez_compressed(fileName, grid=grid, generation=gen)
+    elif snapshotFormat == 'png':
+        writePNG(fileName, grid)
+    else:
+        raise ValueError("unknown snapshot format: %s" % snapshotFormat)
+    return fileName
+
+def run(grid, generations, snapshotEvery=0, snapshotDir='.', snapshotFormat='npz'):
+    """
+    advances grid in place by the given number of generations without rendering,
+    saving a snapshot every snapshotEvery generations (0 = never).
+    returns timing stats; snapshot writing is not counted in the rates.
+    """
+    if snapshotEvery:
+        os.makedirs(snapshotDir, exist_ok=True)
+    packed = isinstance(grid, (PackedGrid, SparseGrid))
+    hashlife = isinstance(grid, HashLife)
+    if packed:
+        cells = grid.N * grid.N
+    elif hashlife:
+        cells = grid.shape[0] * grid.shape[1]
+    else:
+        cells = grid.size
+    elapsed = 0.0
+    gen = 0
+    while gen < generations:
+        count = 1
+        if hashlife:
+            # HashLife jumps straight to the next snapshot (or the end)
+            count = generations - gen
+            if snapshotEvery:
+                count = min(count, snapshotEvery - gen % snapshotEvery)
+        start = time.perf_counter()
+        if hashlife:
+            grid.advance(count)
+        elif packed:
+            grid.advance()
+        else:
+            grid[:] = step(grid)
+        elapsed += time.perf_counter() - start
+        gen += count
+        if snapshotEvery and gen % snapshotEvery == 0:
+            saveSnapshot(grid, gen, snapshotDir, snapshotFormat)
+    rate = generations / elapsed if elapsed > 0 else float('inf')
+    return {'generations': generations, 'seconds': elapsed,
+            'gensPerSec': rate, 'cellsPerSec': rate * cells}
+
 # main() function
 def main():
     # Command line args are in sys.argv[1], sys.argv[2] ..
@@ -91,6 +401,22 @@ def main():
     parser.add_argument('--interval', dest='interval', required=False)
     parser.add_argument('--glider', action='store_true', required=False)
     parser.add_argument('--gosper', action='store_true', required=False)
+    # headless batch mode
+    parser.add_argument('--generations', dest='generations', type=int, required=False,
+                        help='run this many generations without rendering and report the speed')
+    parser.add_argument('--snapshot-every', dest='snapshotEvery', type=int, default=0,
+                        help='save the grid every k generations (batch mode)')
+    parser.add_argument('--snapshot-dir', dest='snapshotDir', default='.')
+    parser.add_argument('--snapshot-format', dest='snapshotFormat', choices=['npz', 'png'],
+                        default='npz')
+    parser.add_argument('--seed', dest='seed', type=int, required=False)
+    parser.add_argument('--packed', action='store_true', required=False,
+                        help='store 64 cells per uint64 word')
+    parser.add_argument('--sparse', action='store_true', required=False,
+                        help='only recompute the tiles where cells changed')
+    parser.add_argument('--tile-size', dest='tileSize', type=int, default=64)
+    parser.add_argument('--hashlife', action='store_true', required=False,
+                        help='use the HashLife engine (unbounded plane, no wrap around)')
     args = parser.parse_args()
     
     # set grid size
@@ -103,22 +429,43 @@ def main():
     if args.interval:
         updateInterval = int(args.interval)
 
+    if args.seed is not None:
+        np.random.seed(args.seed)
+
     # declare grid
     grid = np.array([])
     # check if "glider" demo flag is specified
     if args.glider:
-        grid = np.zeros(N*N).reshape(N, N)
+        grid = emptyGrid(N, args.packed)
         addGlider(1, 1, grid)
     elif args.gosper:
-        grid = np.zeros(N*N).reshape(N, N)
+        grid = emptyGrid(N, args.packed)
         addGosperGliderGun(10, 10, grid)
     else:
         # populate grid with random on/off - more off than on
-        grid = randomGrid(N)
+        grid = randomGrid(N, args.packed)
+
+    if args.hashlife:
+        grid = HashLife.fromArray(grid.toArray() if args.packed else grid)
+    elif args.sparse:
+        grid = SparseGrid(grid.toArray() if args.packed else grid, args.tileSize)
+
+    if args.generations is not None:
+        stats = run(grid, args.generations, args.snapshotEvery,
+                    args.snapshotDir, args.snapshotFormat)
+        print('%d generations of %dx%d in %.3f s: %.1f gens/sec, %.3g cells/sec' %
+              (stats['generations'], N, N, stats['seconds'],
+               stats['gensPerSec'], stats['cellsPerSec']))
+        return
+
+    # matplotlib is only needed for the animation
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
 
     # set up animation
     fig, ax = plt.subplots()
-    img = ax.imshow(grid, interpolation='nearest')
+    img = ax.imshow(grid.toArray() if args.packed or args.hashlife or args.sparse else grid,
+                    interpolation='nearest')
     ani = animation.FuncAnimation(fig, update, fargs=(img, grid, N, ),
                                   frames = 10,
                                   interval=updateInterval,
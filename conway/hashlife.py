@@ -0,0 +1,281 @@
+"""
+hashlife.py
+
+A HashLife engine for conway.py: the plane is a quadtree of canonical
+(hash-consed) nodes, and the future of every node is memoized, so regular
+patterns like glider guns can be advanced by 2^k generations in one step.
+
+Unlike the numpy engines in conway.py, HashLife works on the unbounded plane:
+cells that leave the imported grid keep going instead of wrapping around.
+"""
+
+import numpy as np
+
+class Node:
+    """a 2^level x 2^level square made of 4 children (level 0: a single cell)"""
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'population')
+
+    def __init__(self, level, nw, ne, sw, se, population):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.population = population
+
+OFF_CELL = Node(0, None, None, None, None, 0)
+ON_CELL = Node(0, None, None, None, None, 1)
+
+class HashLife:
+    """
+    HashLife universe. (top, left) are the plane coordinates of the root's
+    top left cell; grid cell (i, j) of an imported array is at (i, j).
+    when more than maxNodes nodes exist, nodes not reachable from the root
+    (or from a node being evolved) are dropped, with the memoized results that
+    refer to them; this is checked inside successor(), so a single big step
+    stays bounded too. If the live nodes alone fill the cache, the next
+    collection waits until their count doubles.
+    """
+    def __init__(self, maxNodes=1 << 20):
+        self.maxNodes = maxNodes
+        # canonical nodes by children, and memoized results by (node, j)
+        self.nodes = {}
+        self.results = {}
+        self.empties = [OFF_CELL]
+        self.root = self.empty(3)
+        self.top = 0
+        self.left = 0
+        self.shape = (0, 0)
+        self.generation = 0
+        self.gcRuns = 0
+        self.gcLimit = maxNodes
+        # nodes whose successor is being computed, kept alive by gc()
+        self.working = []
+
+    def join(self, nw, ne, sw, se):
+        """returns the canonical node with these 4 children"""
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is None:
+            node = Node(nw.level + 1, nw, ne, sw, se,
+                        nw.population + ne.population + sw.population + se.population)
+            self.nodes[key] = node
+        return node
+
+    def empty(self, level):
+        """returns the empty node of this level"""
+        while len(self.empties) <= level:
+            e = self.empties[-1]
+            self.empties.append(self.join(e, e, e, e))
+        return self.empties[level]
+
+    def center(self, node):
+        """the centered square of half the size"""
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def expand(self, node):
+        """the same pattern in the middle of an empty square of twice the size"""
+        e = self.empty(node.level - 1)
+        return self.join(self.join(e, e, e, node.nw), self.join(e, e, node.ne, e),
+                         self.join(e, node.sw, e, e), self.join(node.se, e, e, e))
+
+    # import / export
+
+    @classmethod
+    def fromArray(cls, grid, maxNodes=1 << 20):
+        """imports an ON/OFF (or 0/1) grid, nonzero cells being alive"""
+        life = cls(maxNodes)
+        alive = np.asarray(grid) != 0
+        life.shape = alive.shape
+        level = 3
+        while (1 << level) < max(alive.shape):
+            level += 1
+        size = 1 << level
+        padded = np.zeros((size, size), dtype=bool)
+        padded[:alive.shape[0], :alive.shape[1]] = alive
+        life.root = life.build(padded, level)
+        return life
+
+    def build(self, alive, level):
+        """quadtree of a 2^level square boolean array"""
+        if not alive.any():
+            return self.empty(level)
+        if level == 0:
+            return ON_CELL
+        half = 1 << (level - 1)
+        return self.join(self.build(alive[:half, :half], level - 1),
+                         self.build(alive[:half, half:], level - 1),
+                         self.build(alive[half:, :half], level - 1),
+                         self.build(alive[half:, half:], level - 1))
+
+    def toArray(self, shape=None, top=0, left=0, on=255):
+        """
+        exports the window of the plane with top left cell (top, left) as a
+        uint8 array of on/0 values; by default the window of the imported grid
+        """
+        if shape is None:
+            shape = self.shape
+        grid = np.zeros(shape, dtype=np.uint8)
+        self.paint(grid, self.root, self.top - top, self.left - left, on)
+        return grid
+
+    def paint(self, grid, node, i, j, on):
+        """sets the cells of node, whose top left cell is grid[i, j]"""
+        size = 1 << node.level
+        if (node.population == 0 or i >= grid.shape[0] or j >= grid.shape[1] or
+                i + size <= 0 or j + size <= 0):
+            return
+        if node.level == 0:
+            grid[i, j] = on
+            return
+        half = size >> 1
+        self.paint(grid, node.nw, i, j, on)
+        self.paint(grid, node.ne, i, j + half, on)
+        self.paint(grid, node.sw, i + half, j, on)
+        self.paint(grid, node.se, i + half, j + half, on)
+
+    def population(self):
+        """returns the number of live cells"""
+        return self.root.population
+
+    # evolution
+
+    def successor(self, node, j):
+        """
+        the centered square of half the size of node, 2^j generations later
+        (j <= node.level - 2)
+        """
+        if node.population == 0:
+            return self.empty(node.level - 1)
+        key = (node, j)
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        if len(self.nodes) > self.gcLimit:
+            self.gc()
+        if node.level == 2:
+            result = self.lifeStep(node)
+        else:
+            # every node held here is kept alive by gc() until the result is known
+            held = [node]
+            self.working.append(held)
+            # 9 overlapping squares of half the size
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            squares = (nw, self.join(nw.ne, ne.nw, nw.se, ne.sw), ne,
+                       self.join(nw.sw, nw.se, sw.nw, sw.ne), self.center(node),
+                       self.join(ne.sw, ne.se, se.nw, se.ne),
+                       sw, self.join(sw.ne, se.nw, sw.se, se.sw), se)
+            held.extend(squares)
+            if j == node.level - 2:
+                # full speed: 2^(j-1) generations in each of the two stages
+                s = []
+                for square in squares:
+                    s.append(self.successor(square, j - 1))
+                    held.append(s[-1])
+                k = j - 1
+            else:
+                s = [self.center(square) for square in squares]
+                held.extend(s)
+                k = j
+            quarters = []
+            for a, b, c, d in ((0, 1, 3, 4), (1, 2, 4, 5), (3, 4, 6, 7), (4, 5, 7, 8)):
+                quarter = self.join(s[a], s[b], s[c], s[d])
+                held.append(quarter)
+                quarters.append(self.successor(quarter, k))
+                held.append(quarters[-1])
+            result = self.join(*quarters)
+            self.working.pop()
+        self.results[key] = result
+        return result
+
+    def lifeStep(self, node):
+        """the center 2x2 of a 4x4 node after one generation"""
+        cells = [[0] * 4 for _ in range(4)]
+        for qi, quad in ((0, node.nw), (1, node.ne), (2, node.sw), (3, node.se)):
+            i, j = (qi >> 1) * 2, (qi & 1) * 2
+            cells[i][j] = quad.nw.population
+            cells[i][j + 1] = quad.ne.population
+            cells[i + 1][j] = quad.sw.population
+            cells[i + 1][j + 1] = quad.se.population
+        new = []
+        for i in (1, 2):
+            for j in (1, 2):
+                total = (sum(cells[i - 1][j - 1:j + 2]) + sum(cells[i + 1][j - 1:j + 2]) +
+                         cells[i][j - 1] + cells[i][j + 1])
+                # apply Conway's rules
+                alive = total == 3 or (total == 2 and cells[i][j])
+                new.append(ON_CELL if alive else OFF_CELL)
+        return self.join(*new)
+
+    def step(self, j):
+        """advances the universe by 2^j generations"""
+        root = self.root
+        top, left = self.top, self.left
+        # the pattern must sit in the center quarter of a root of level >= j+2
+        # so that 2^j generations of growth stay inside the result
+        while (root.level < j + 2 or
+               self.center(root).population != root.population):
+            half = 1 << (root.level - 1)
+            root = self.expand(root)
+            top -= half
+            left -= half
+        half = 1 << (root.level - 1)
+        root = self.expand(root)
+        top -= half
+        left -= half
+        root = self.successor(root, j)
+        # the result is the center of the expanded root
+        top += 1 << (root.level - 1)
+        left += 1 << (root.level - 1)
+        # crop empty borders so that the root does not keep growing
+        while root.level > 3 and self.center(root).population == root.population:
+            root = self.center(root)
+            top += 1 << (root.level - 1)
+            left += 1 << (root.level - 1)
+        self.root, self.top, self.left = root, top, left
+        self.generation += 1 << j
+        if len(self.nodes) > self.gcLimit:
+            self.gc()
+
+    def advance(self, generations):
+        """advances the universe by any number of generations"""
+        j = 0
+        while generations:
+            if generations & 1:
+                self.step(j)
+            generations >>= 1
+            j += 1
+
+    def gc(self):
+        """
+        drops the nodes not reachable from the root or a working node, and
+        the memoized results whose node or result was dropped
+        """
+        nodes = {}
+        pending = [self.root] + self.empties[1:]
+        for held in self.working:
+            pending.extend(held)
+        while pending:
+            node = pending.pop()
+            if node.level == 0:
+                continue
+            key = (node.nw, node.ne, node.sw, node.se)
+            if key not in nodes:
+                nodes[key] = node
+                pending.extend(key)
+        self.results = {key: result for key, result in self.results.items()
+                        if self.alive(nodes, key[0]) and self.alive(nodes, result)}
+        self.nodes = nodes
+        self.gcLimit = max(self.maxNodes, 2 * len(nodes))
+        self.gcRuns += 1
+
+    @staticmethod
+    def alive(nodes, node):
+        """True if node is still the canonical node of its children"""
+        return node.level == 0 or nodes.get((node.nw, node.ne, node.sw, node.se)) is node
+
+    def stats(self):
+        """returns the cache sizes"""
+        return {'nodes': len(self.nodes), 'results': len(self.results),
+                'gcRuns': self.gcRuns, 'level': self.root.level,
+                'generation': self.generation, 'population': self.root.population}
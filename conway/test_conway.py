@@ -0,0 +1,286 @@
+"""
+test_conway.py
+
+Checks the fast engines of conway.py against the original cell by cell
+update loop.
+
+Run: python -m pytest -q conway/test_conway.py
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+import numpy as np
+
+import conway
+from conway import ON, OFF, PackedGrid, SparseGrid
+from hashlife import HashLife
+
+def referenceStep(grid):
+    """the original update() loop: one generation of an NxN ON/OFF grid"""
+    N = grid.shape[0]
+    grid = grid.astype(np.int64)
+    newGrid = grid.copy()
+    for i in range(N):
+        for j in range(N):
+            # compute 8-neghbor sum
+            # using toroidal boundary conditions - x and y wrap around
+            total = int((grid[i, (j-1)%N] + grid[i, (j+1)%N] +
+                         grid[(i-1)%N, j] + grid[(i+1)%N, j] +
+                         grid[(i-1)%N, (j-1)%N] + grid[(i-1)%N, (j+1)%N] +
+                         grid[(i+1)%N, (j-1)%N] + grid[(i+1)%N, (j+1)%N])/255)
+            # apply Conway's rules
+            if grid[i, j] == ON:
+                if (total < 2) or (total > 3):
+                    newGrid[i, j] = OFF
+            else:
+                if total == 3:
+                    newGrid[i, j] = ON
+    return newGrid.astype(np.uint8)
+
+def randomCells(N, seed):
+    np.random.seed(seed)
+    return conway.randomGrid(N)
+
+def addWrapped(i, j, grid):
+    """adds a glider with top left cell at (i, j), wrapping around the edges"""
+    N = grid.shape[0]
+    rows, cols = np.nonzero(np.array([[0, 0, 1], [1, 0, 1], [0, 1, 1]]))
+    grid[(rows + i) % N, (cols + j) % N] = ON
+
+class StepTest(unittest.TestCase):
+    SIZES = (3, 4, 8, 17, 32)
+
+    def testMatchesReference(self):
+        for N in self.SIZES:
+            for seed in range(3):
+                with self.subTest(N=N, seed=seed):
+                    start = grid = randomCells(N, 100 * N + seed)
+                    original = start.copy()
+                    for gen in range(5):
+                        expected = referenceStep(grid)
+                        result = conway.step(grid)
+                        self.assertEqual(result.dtype, grid.dtype)
+                        np.testing.assert_array_equal(result, expected, 'generation %d' % gen)
+                        grid = result
+                    # step returns a new grid and leaves its input alone
+                    np.testing.assert_array_equal(start, original)
+
+    def testWrapEdges(self):
+        for N in (8, 17):
+            with self.subTest(N=N, pattern='border'):
+                # random cells only on the outer rows and columns
+                grid = randomCells(N, N)
+                grid[2:-2, 2:-2] = OFF
+                for gen in range(6):
+                    expected = referenceStep(grid)
+                    grid = conway.step(grid)
+                    np.testing.assert_array_equal(grid, expected, 'generation %d' % gen)
+            with self.subTest(N=N, pattern='gliders'):
+                # gliders crossing the corner and the right/left edge
+                grid = conway.emptyGrid(N)
+                addWrapped(N - 2, N - 2, grid)
+                addWrapped(N // 2, N - 1, grid)
+                for gen in range(2 * N):
+                    expected = referenceStep(grid)
+                    grid = conway.step(grid)
+                    np.testing.assert_array_equal(grid, expected, 'generation %d' % gen)
+
+def readPNG(fileName):
+    """decodes the 8-bit grayscale PNGs written by writePNG"""
+    with open(fileName, 'rb') as f:
+        data = f.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, pos = {}, 8
+    while pos < len(data):
+        length, = struct.unpack('>I', data[pos:pos + 4])
+        tag, body = data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]
+        crc, = struct.unpack('>I', data[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(tag + body) & 0xffffffff
+        chunks[tag] = body
+        pos += 12 + length
+    width, height, depth, colorType = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    assert (depth, colorType) == (8, 0) and b'IEND' in chunks
+    raw = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width + 1)
+    # every scanline uses filter type 0 (none)
+    assert not raw[:, 0].any()
+    return raw[:, 1:]
+
+class RunTest(unittest.TestCase):
+    def testHeadlessRun(self):
+        N, generations = 20, 8
+        grid = conway.emptyGrid(N)
+        conway.addGlider(2, 3, grid)
+        addWrapped(N - 2, N - 2, grid)
+        expected = [grid.copy()]
+        for _ in range(generations):
+            expected.append(referenceStep(expected[-1]))
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshotDir = os.path.join(tmp, 'snapshots')
+            stats = conway.run(grid, generations, snapshotEvery=4, snapshotDir=snapshotDir,
+                               snapshotFormat='png')
+            self.assertEqual(sorted(os.listdir(snapshotDir)), ['gen00000004.png', 'gen00000008.png'])
+            for gen in (4, 8):
+                image = readPNG(os.path.join(snapshotDir, 'gen%08d.png' % gen))
+                np.testing.assert_array_equal(image, expected[gen], 'generation %d' % gen)
+        self.assertEqual(stats['generations'], generations)
+        self.assertGreater(stats['gensPerSec'], 0)
+        self.assertAlmostEqual(stats['cellsPerSec'] / stats['gensPerSec'], N * N)
+        # run advances the grid in place; two gliders keep 10 cells
+        np.testing.assert_array_equal(grid, expected[-1])
+        self.assertEqual(int((grid == ON).sum()), 10)
+
+    def testHeadlessRunPacked(self):
+        grid = randomCells(70, 3)
+        packed = PackedGrid.fromArray(grid)
+        with tempfile.TemporaryDirectory() as tmp:
+            conway.run(packed, 5, snapshotEvery=5, snapshotDir=tmp, snapshotFormat='png')
+            image = readPNG(os.path.join(tmp, 'gen00000005.png'))
+        for _ in range(5):
+            grid = referenceStep(grid)
+        np.testing.assert_array_equal(packed.toArray(), grid)
+        np.testing.assert_array_equal(image, grid)
+        self.assertEqual(packed.population(), int((grid == ON).sum()))
+
+    def testWritePNG(self):
+        # not square, so width and height cannot be swapped
+        grid = conway.emptyGrid(12)[:5]
+        grid[0, 0] = grid[4, 11] = grid[2, 7] = ON
+        with tempfile.TemporaryDirectory() as tmp:
+            fileName = os.path.join(tmp, 'grid.png')
+            conway.writePNG(fileName, grid)
+            image = readPNG(fileName)
+        self.assertEqual(image.shape, (5, 12))
+        np.testing.assert_array_equal(image, grid)
+
+class PackedGridTest(unittest.TestCase):
+    # widths that are not a multiple of 64, so the last word is partly used
+    SIZES = (3, 5, 63, 65, 70, 129)
+
+    def testMatchesReference(self):
+        for N in self.SIZES:
+            with self.subTest(N=N):
+                grid = randomCells(N, N)
+                packed = PackedGrid.fromArray(grid)
+                for gen in range(6):
+                    grid = referenceStep(grid)
+                    packed.advance()
+                    np.testing.assert_array_equal(packed.toArray(), grid, 'generation %d' % gen)
+                    self.assertEqual(packed.population(), int((grid == ON).sum()))
+
+    def testWrapAround(self):
+        # gliders crossing the right/left and bottom/top edges
+        for N in (65, 70):
+            with self.subTest(N=N):
+                grid = conway.emptyGrid(N)
+                addWrapped(N - 2, N - 2, grid)
+                addWrapped(N // 2, N - 1, grid)
+                packed = conway.emptyGrid(N, packed=True)
+                packed.setBlock(0, 0, grid)
+                for gen in range(12):
+                    grid = referenceStep(grid)
+                    packed.advance()
+                    np.testing.assert_array_equal(packed.toArray(), grid, 'generation %d' % gen)
+
+    def testSmallBands(self):
+        # several bands of rows per generation
+        grid = randomCells(70, 1)
+        expected = referenceStep(referenceStep(grid))
+        band = conway.BAND_SIZE
+        conway.BAND_SIZE = 8
+        try:
+            packed = PackedGrid.fromArray(grid)
+            packed.advance(2)
+            self.assertEqual(packed.population(), int((expected == ON).sum()))
+        finally:
+            conway.BAND_SIZE = band
+        np.testing.assert_array_equal(packed.toArray(), expected)
+
+class SparseGridTest(unittest.TestCase):
+    def grids(self, N, tileSize):
+        """gliders crossing tile borders and the wrap edges, and a random patch"""
+        grid = conway.emptyGrid(N)
+        addWrapped(N - 2, N - 2, grid)
+        addWrapped(tileSize - 2, 2 * tileSize - 1, grid)
+        addWrapped(N // 2, N - 1, grid)
+        soup = grid.copy()
+        soup[:12, tileSize - 6:tileSize + 6] = randomCells(12, N)
+        return {'gliders': grid, 'soup': soup}
+
+    def testMatchesDenseStep(self):
+        # the last tile is partly outside the grid when N % tileSize != 0
+        for N, tileSize in ((64, 16), (70, 16), (67, 8)):
+            for name, grid in self.grids(N, tileSize).items():
+                with self.subTest(N=N, tileSize=tileSize, pattern=name):
+                    sparse = SparseGrid(grid.copy(), tileSize)
+                    for gen in range(40):
+                        previous = grid
+                        grid = conway.step(grid)
+                        sparse.advance()
+                        np.testing.assert_array_equal(sparse.toArray(), grid, 'generation %d' % gen)
+                        # changed lists each flipped cell once
+                        changed = sorted(map(tuple, sparse.changed.tolist()))
+                        self.assertEqual(changed, sorted(zip(*np.nonzero(previous != grid))))
+
+    def testSetBlock(self):
+        N, tileSize = 70, 16
+        grid = conway.emptyGrid(N)
+        sparse = SparseGrid(grid.copy(), tileSize)
+        sparse.advance(3)
+        self.assertEqual(len(sparse.changed), 0)
+        # a glider straddling a tile border, added to an idle grid
+        conway.addGlider(tileSize - 1, 2 * tileSize - 2, grid)
+        conway.addGlider(tileSize - 1, 2 * tileSize - 2, sparse)
+        for gen in range(2 * tileSize):
+            grid = conway.step(grid)
+            sparse.advance()
+            np.testing.assert_array_equal(sparse.toArray(), grid, 'generation %d' % gen)
+
+class HashLifeTest(unittest.TestCase):
+    def patterns(self):
+        """grids whose live cells stay away from the wrap edges for 128 generations"""
+        gun = conway.emptyGrid(200)
+        conway.addGosperGliderGun(10, 10, gun)
+        soup = conway.emptyGrid(200)
+        soup[90:110, 90:110] = randomCells(20, 2)
+        return {'gun': gun, 'soup': soup}
+
+    def dense(self, grid, generations):
+        for _ in range(generations):
+            grid = conway.step(grid)
+        return grid
+
+    def testMatchesDenseStep(self):
+        for name, grid in self.patterns().items():
+            for generations in (1, 7, 30, 64):
+                with self.subTest(pattern=name, generations=generations):
+                    life = HashLife.fromArray(grid)
+                    life.advance(generations)
+                    expected = self.dense(grid, generations)
+                    np.testing.assert_array_equal(life.toArray(), expected)
+                    self.assertEqual(life.population(), int((expected == ON).sum()))
+                    self.assertEqual(life.generation, generations)
+
+    def testCollectionDuringStep(self):
+        # 64 generations are a single step(6): every collection happens inside it
+        working = []
+        for name, grid in self.patterns().items():
+            with self.subTest(pattern=name):
+                life = HashLife.fromArray(grid, maxNodes=500)
+                gc = life.gc
+                def countingGc():
+                    working.append(len(life.working))
+                    gc()
+                life.gc = countingGc
+                life.advance(64)
+                self.assertGreater(life.gcRuns, 0)
+                self.assertTrue(any(working))
+                np.testing.assert_array_equal(life.toArray(), self.dense(grid, 64))
+                # advancing again reuses what survived the collections
+                life.advance(64)
+                np.testing.assert_array_equal(life.toArray(), self.dense(grid, 128))
+
+if __name__ == '__main__':
+    unittest.main()
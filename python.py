@@ -1,13 +1,226 @@
+import io
 import sys
+import asyncio
+import os
 import re
+import json
+import time
 import copy
+import array
+import pickle
+import hashlib
+import operator
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# Các lệnh mở đầu một khối kết thúc bằng END
+BLOCK_COMMANDS = ('FOR', 'FOR_LINES', 'IF', 'WHILE', 'DEF_CREATE', 'LOAD_PARALLEL')
+
+INPUT_PATTERN = re.compile(r'--input\s+(\w+)')
+SAVE_PATTERN = re.compile(r'--save\s+(\w+)')
+
+CONDITION_TOKEN = re.compile(r'\w+|[><=!]=|[><()]')
+NUMBER_LITERAL = re.compile(r'^\d+$')
+COMPARISON_OPERATORS = {
+    '>': operator.gt, '<': operator.lt, '>=': operator.ge,
+    '<=': operator.le, '==': operator.eq, '!=': operator.ne,
+}
+
+# Mảng có kiểu (ARR --create ... --type): kiểu phần tử -> mã kiểu của array.array
+ARRAY_TYPECODES = {'int': 'q', 'float': 'd'}
+ARRAY_ELEMENT_TYPES = {'q': 'int', 'd': 'float'}
+ARRAY_CASTS = {'q': int, 'd': float}
+INT64_RANGE = range(-(1 << 63), 1 << 63)  # Giá trị hợp lệ của phần tử mảng int (typecode 'q')
+ARRAY_REDUCTIONS = {'sum': sum, 'min': min, 'max': max}
+
+# Phép toán số học và kiểu biến đầu ra được hỗ trợ bởi đường nhanh (Arithmetic) và CALC
+ARITHMETIC_OPERATORS = {'SUM': operator.add, 'SUBTRACT': operator.sub,
+                        'MULTIPLY': operator.mul, 'DIVIDE': operator.truediv}
+ARITHMETIC_CASTS = {'int': int, 'float': float}
+EXPRESSION_TOKEN = re.compile(r'\d+\.\d*|\.\d+|\d+|\w+|\S')
+
+# Bộ nhớ đệm trên đĩa cho tập tin IMP/LOAD đã biên dịch
+CACHE_VERSION = 5
+CACHE_SUFFIX = '.ppc'
+
+# Tập tin mở bằng FILE --open: chế độ -> chế độ của open(), kích thước bộ đệm
+FILE_MODES = {'read': 'r', 'write': 'w', 'append': 'a'}
+FILE_BUFFER_SIZE = 1 << 20
+
+# Mức độ chi tiết của thông báo chẩn đoán
+VERBOSITY_LEVELS = ('silent', 'errors', 'trace')
+
+# Mẫu thông báo trạng thái ở chế độ trace: sự kiện -> chuỗi định dạng
+TRACE_MESSAGES = {
+    'var': "Declared variable: {0} {1} = {2}",
+    'arithmetic': "{0} result stored in {1} = {2}",
+    'mem_release': "Released variable '{0}' from memory",
+    'array_create': "Đã tạo mảng '{0}' với kích thước {1}",
+    'array_set': "Đã gán giá trị '{0}' vào vị trí {1} của mảng '{2}'",
+    'array_get': "Đã lấy giá trị '{0}' từ vị trí {1} của mảng '{2}' và lưu vào '{3}'",
+    'array_fill': "Đã điền giá trị '{0}' vào toàn bộ mảng '{1}'",
+    'array_copy': "Đã sao chép {0} phần tử từ mảng '{1}' sang mảng '{2}'",
+    'array_sort': "Đã sắp xếp mảng '{0}'",
+    'array_elementwise': "{0} result stored in array {1} ({2} elements)",
+    'file_read': "Đã đọc dữ liệu từ '{0}' và lưu vào biến '{1}'",
+    'file_save': "Đã lưu dữ liệu từ biến '{0}' vào tập tin '{1}'",
+    'file_open': "Đã mở tập tin '{0}' ({1}) với biến '{2}'",
+    'file_chunk': "Đã đọc {0} ký tự từ '{1}' vào biến '{2}'",
+    'file_line': "Đã đọc một dòng từ '{0}' vào biến '{1}'",
+    'file_write': "Đã ghi {0} ký tự từ biến '{1}' vào '{2}'",
+    'import': "Function '{0}' has been imported from file '{1}'",
+    'def_create': "Đã định nghĩa hàm: {0}",
+    'def_return': "Function '{0}' returned value {1} assigned to '{2}'",
+    'load_class': "Loaded ClassDefinition: {0!r}",
+    'load_done': "Class '{0}' executed and outputs saved to variables: {1}",
+}
+
+# Mã lệnh của máy ảo bytecode (Interpreter(use_vm=True))
+OP_EXEC = 0        # Gọi handler của một lệnh đơn
+OP_JUMP = 1        # Nhảy tới vị trí toán hạng
+OP_FOR_INIT = 2    # Tính start/end/step, mở phạm vi vòng lặp
+OP_FOR_TEST = 3    # Thoát vòng FOR (tới toán hạng) khi hết lặp
+OP_FOR_STEP = 4    # Tăng biến lặp và quay lại FOR_TEST
+OP_IF_TEST = 5     # Mở phạm vi nếu điều kiện đúng, ngược lại nhảy tới toán hạng
+OP_WHILE_TEST = 6  # Nhảy tới toán hạng khi điều kiện sai
+OP_PUSH_SCOPE = 7
+OP_POP_SCOPE = 8
+OP_DEF = 9         # DEF --create
+OP_CALL = 10       # DEF --call: đẩy khung mới lên ngăn xếp lời gọi
+OP_RETURN = 11     # Trả về từ khung hiện tại
+OP_IMP = 12
+OP_LOAD = 13
+OP_RAISE = 14      # Báo lỗi với thông báo ở toán hạng
+OP_LINES_INIT = 15 # FOR --in: mở phạm vi, lấy iterator dòng của tập tin
+OP_LINES_NEXT = 16 # Gán dòng kế tiếp cho biến lặp, hết dòng thì nhảy tới toán hạng
+OP_LOAD_PARALLEL = 17
+OP_EXEC_IO = 18    # Lệnh đơn đọc/ghi tập tin: chạy trong luồng riêng khi thực thi bất đồng bộ
+
+# Lệnh đơn có I/O chặn, được chuyển sang asyncio.to_thread trong interpret_async
+BLOCKING_COMMANDS = ('FILE_READ', 'FILE_SAVE')
+
+# Mẫu biểu thức chính quy của từng lệnh (biên dịch một lần cho mọi Interpreter)
+COMMAND_PATTERNS = {
+    'VAR': re.compile(
+        r'^VAR\s+--type\s+(?P<type>\w+)\s+--name\s+(?P<name>\w+)(?:\s+--set\s+(?P<set>.+))?$'
+    ),
+    'SUM': re.compile(
+        r'^SUM(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
+    ),
+    'SUBTRACT': re.compile(
+        r'^SUBTRACT(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
+    ),
+    'MULTIPLY': re.compile(
+        r'^MULTIPLY(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
+    ),
+    'DIVIDE': re.compile(
+        r'^DIVIDE(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
+    ),
+    'CALC': re.compile(
+        r'^CALC\s+--expr\s+"(?P<expr>[^"]+)"\s+--output\s+(?P<output>\w+)$'
+    ),
+    'FOR': re.compile(
+        r'^FOR(?:\s+--var\s+(?P<var>\w+))?\s+--start\s+(?P<start>\w+)\s+--end\s+(?P<end>\w+)\s+--step\s+(?P<step>\w+)$'
+    ),
+    'FOR_LINES': re.compile(
+        r'^FOR\s+--var\s+(?P<var>\w+)\s+--in\s+(?P<handle>\w+)$'
+    ),
+    'IF': re.compile(
+        r'^IF\s+(?P<condition>.+)$'
+    ),
+    'ELSE': re.compile(
+        r'^ELSE$'
+    ),
+    'WHILE': re.compile(
+        r'^WHILE\s+(?P<condition>.+)$'
+    ),
+    'END': re.compile(
+        r'^END$'
+    ),
+    'MEM_RELEASE': re.compile(
+        r'^MEM\s+--release\s+(?P<name>\w+)$'
+    ),
+    'MEM_STATS': re.compile(
+        r'^MEM\s+--stats$'
+    ),
+    'PRI_PRINT': re.compile(
+        r'^PRI\s+--print\s+(?P<var>\w+)$'
+    ),
+    'DEF_CREATE': re.compile(
+        r'^DEF\s+--create\s+(?P<name_def>\w+)(?:\s+--input\s+(?P<inputs>\w+))*(?:\s+--memo(?P<memo>\s+\d+)?(?P<pure>))?\s*$'
+    ),
+    'DEF_CALL': re.compile(
+        r'^DEF\s+--call\s+(?P<name_def>\w+)(?:\s+--input\s+(?P<inputs>\w+))*\s+--save\s+(?P<save>\w+)$'
+    ),
+    'RETURN': re.compile(
+        r'^RETURN\s+(?P<var>\w+)$'
+    ),
+    'FILE_READ': re.compile(
+        r'^FILE\s+--read\s+(?P<path>\S+)\s+--save\s+(?P<save>\w+)$'
+    ),
+    'FILE_SAVE': re.compile(
+        r'^FILE\s+--save\s+(?P<data>\w+)\s+--to\s+(?P<path>\S+)$'
+    ),
+    'FILE_OPEN': re.compile(
+        r'^FILE\s+--open\s+(?P<path>\S+)\s+--mode\s+(?P<mode>read|write|append)\s+--save\s+(?P<save>\w+)$'
+    ),
+    'FILE_READ_CHUNK': re.compile(
+        r'^FILE\s+--read_chunk\s+(?P<handle>\w+)\s+--size\s+(?P<size>\w+)\s+--save\s+(?P<save>\w+)$'
+    ),
+    'FILE_READ_LINE': re.compile(
+        r'^FILE\s+--read_line\s+(?P<handle>\w+)\s+--save\s+(?P<save>\w+)(?:\s+--eof\s+(?P<eof>\w+))?$'
+    ),
+    'FILE_WRITE': re.compile(
+        r'^FILE\s+--write\s+(?P<data>\w+)\s+--to\s+(?P<handle>\w+)(?P<newline>\s+--newline)?$'
+    ),
+    'IMP': re.compile(
+        r'^IMP\s+--from\s+(?P<path>\S+)\s+--import\s+(?P<name_def>\w+)$'
+    ),
+    'ARR_CREATE': re.compile(
+        r'^ARR\s+--array\s+--create\s+(?P<name>\w+)\s+--max\s+(?P<max>\d+)(?:\s+--type\s+(?P<type>\w+))?$'
+    ),
+    'ARR_SET_DATA': re.compile(
+        r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--set_data\s+(?P<variable>\w+)\s+--pos\s+(?P<pos>\d+)$'
+    ),
+    'ARR_GET_DATA': re.compile(
+        r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--get_data\s+(?P<index>\d+)\s+--save\s+(?P<save>\w+)$'
+    ),
+    'ARR_FILL': re.compile(
+        r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--fill\s+(?P<value>-?[\w.]+)$'
+    ),
+    'ARR_COPY': re.compile(
+        r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--copy\s+(?P<target>\w+)\s+--start\s+(?P<start>\w+)\s+--count\s+(?P<count>\w+)(?:\s+--pos\s+(?P<pos>\w+))?$'
+    ),
+    'ARR_REDUCE': re.compile(
+        r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--reduce\s+(?P<op>sum|min|max)\s+--save\s+(?P<save>\w+)$'
+    ),
+    'ARR_SORT': re.compile(
+        r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--sort(?P<reverse>\s+--reverse)?$'
+    ),
+    'LOAD': re.compile(
+        r'^LOAD\s+--from\s+(?P<path>\S+)(?:\s+--input\s+(?P<inputs>\w+))*\s*(?:\s+--save\s+(?P<saves>\w+))*\s*$'
+    ),
+    'LOAD_PARALLEL': re.compile(
+        r'^LOAD\s+--parallel(?:\s+--workers\s+(?P<workers>\d+))?$'
+    ),
+}
+
+# Nhóm các mẫu theo từ khóa đầu dòng để parse_line không phải thử lần lượt mọi mẫu
+PATTERNS_BY_KEYWORD = {}
+for _command, _pattern in COMMAND_PATTERNS.items():
+    PATTERNS_BY_KEYWORD.setdefault(_command.split('_')[0], []).append((_command, _pattern))
+del _command, _pattern
 
 class InterpreterError(Exception):
     """Custom exception class for Interpreter errors."""
     pass
 
 class FunctionReturn(Exception):
-    """Custom exception to handle return statements within functions."""
+    """
+    Carries a top-level RETURN value out of interpret(in_function=True) to an outside caller.
+    DEF --call does not use it: both engines hand the value back through Interpreter.return_value.
+    """
     def __init__(self, value):
         self.value = value
 
@@ -15,6 +228,8 @@ class Variable:
     """
     Đại diện cho một biến với kiểu dữ liệu, tên và giá trị.
     """
+    __slots__ = ('type', 'name', 'value')
+
     def __init__(self, var_type, name, value=None):
         self.type = var_type.lower()
         self.name = name
@@ -24,18 +239,441 @@ class Variable:
         return f"{self.type} {self.name} = {self.value}"
 
 
+class Instruction:
+    """
+    Một lệnh đã được phân tích sẵn, cùng với các khối lệnh con (nếu có).
+    """
+    def __init__(self, command, args, lineno, body=None, else_body=None, end_lineno=None, source_line=None):
+        self.command = command
+        self.args = args
+        self.lineno = lineno  # Số dòng trong đoạn mã chứa lệnh
+        self.source_line = source_line  # Số dòng tuyệt đối trong mã nguồn (dùng cho profiler)
+        self.body = body  # Danh sách Instruction của khối lệnh (FOR/IF/WHILE/DEF)
+        self.else_body = else_body  # Danh sách Instruction của nhánh ELSE
+        self.end_lineno = end_lineno  # Số dòng của END tương ứng
+
+    def __repr__(self):
+        return f"Instruction({self.command}, line={self.lineno})"
+
+
+class InstructionList(list):
+    """
+    Danh sách Instruction đã biên dịch (một đoạn mã hoặc thân khối), giữ kèm bytecode
+    đã hạ của chính nó. Bytecode chỉ chứa tên lệnh, không chứa phương thức của một
+    Interpreter cụ thể, nên dùng chung được giữa các bản fork; nó không được tuần tự hóa.
+    """
+    __slots__ = ('bytecode',)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.bytecode = None
+
+    def __reduce__(self):
+        return (InstructionList, (list(self),))
+
+
+class Condition:
+    """
+    Điều kiện IF/WHILE đã được biên dịch thành closure.
+    Biến được đọc qua bảng liên kết của Interpreter tại thời điểm đánh giá,
+    hỗ trợ AND/OR/NOT (đánh giá ngắn mạch) và dấu ngoặc.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.tokens = CONDITION_TOKEN.findall(source)
+        self.pos = 0
+        try:
+            self.evaluate = self._parse_or()
+            if self.pos != len(self.tokens):
+                raise ValueError(source)
+        except (ValueError, IndexError):
+            self.evaluate = self._invalid
+        del self.tokens, self.pos
+
+    def __reduce__(self):
+        # Closure không tuần tự hóa được: biên dịch lại từ mã nguồn
+        return (Condition, (self.source,))
+
+    def __repr__(self):
+        return f"Condition({self.source!r})"
+
+    def _invalid(self, bindings):
+        raise InterpreterError(f"Error: Invalid condition '{self.source}'")
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _parse_or(self):
+        left = self._parse_and()
+        while self._peek() == 'OR':
+            self.pos += 1
+            left = self._or(left, self._parse_and())
+        return left
+
+    def _parse_and(self):
+        left = self._parse_not()
+        while self._peek() == 'AND':
+            self.pos += 1
+            left = self._and(left, self._parse_not())
+        return left
+
+    def _parse_not(self):
+        if self._peek() == 'NOT':
+            self.pos += 1
+            operand = self._parse_not()
+            return lambda bindings: not operand(bindings)
+        return self._parse_comparison()
+
+    def _parse_comparison(self):
+        first = self._parse_operand()
+        chain = []
+        while self._peek() in COMPARISON_OPERATORS:
+            op = COMPARISON_OPERATORS[self.tokens[self.pos]]
+            self.pos += 1
+            chain.append((op, self._parse_operand()))
+        if not chain:
+            return first
+        if len(chain) == 1:
+            op, second = chain[0]
+            return lambda bindings: op(first(bindings), second(bindings))
+
+        def compare_chain(bindings):
+            left = first(bindings)
+            for op, operand in chain:
+                right = operand(bindings)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+        return compare_chain
+
+    def _parse_operand(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if token == '(':
+            inner = self._parse_or()
+            if self._peek() != ')':
+                raise ValueError(self.source)
+            self.pos += 1
+            return inner
+        if token in COMPARISON_OPERATORS or token in (')', 'AND', 'OR', 'NOT'):
+            raise ValueError(self.source)
+        return self._operand(token)
+
+    @staticmethod
+    def _or(left, right):
+        return lambda bindings: left(bindings) or right(bindings)
+
+    @staticmethod
+    def _and(left, right):
+        return lambda bindings: left(bindings) and right(bindings)
+
+    @staticmethod
+    def _operand(token):
+        # Không phải biến thì coi là số hoặc chuỗi
+        if NUMBER_LITERAL.match(token):
+            literal = int(token)
+        else:
+            literal = token
+
+        def read(bindings):
+            stack = bindings.get(token)
+            if not stack:
+                return literal
+            var = stack[-1]
+            if var.type in ('int', 'float', 'str'):
+                return var.value
+            raise InterpreterError(f"Error: Unsupported variable type '{var.type}' in condition")
+        return read
+
+
+class Arithmetic:
+    """
+    Đường nhanh của SUM/SUBTRACT/MULTIPLY/DIVIDE, được tạo một lần khi phân tích dòng lệnh:
+    closure chuyên biệt theo phép toán và số toán hạng, đọc/ghi biến trực tiếp qua bảng liên kết.
+    Kiểu biến chỉ biết được lúc chạy (phạm vi động) nên được kiểm tra một lần; mọi trường hợp
+    khác (biến chưa có, mảng, chia cho 0, lỗi ép kiểu) trả về None để chạy đường đầy đủ.
+    """
+    def __init__(self, command, inputs, output):
+        self.command = command
+        self.inputs = tuple(inputs)
+        self.output = output
+        self.evaluate = self._compile()
+
+    def __reduce__(self):
+        # Closure không tuần tự hóa được: biên dịch lại từ các tham số
+        return (Arithmetic, (self.command, self.inputs, self.output))
+
+    def __repr__(self):
+        return f"Arithmetic({self.command}, {list(self.inputs)}, {self.output})"
+
+    def _compile(self):
+        inputs = self.inputs
+        output = self.output
+        command = self.command
+        divide = command == 'DIVIDE'
+
+        if len(inputs) == 2:
+            first, second = inputs
+            if command == 'SUM':
+                combine = lambda x, y: 0 + x + y  # Giống SUM đầy đủ: cộng dồn từ 0
+            elif command == 'MULTIPLY':
+                combine = lambda x, y: 1 * x * y
+            else:
+                combine = ARITHMETIC_OPERATORS[command]
+
+            def evaluate(bindings):
+                stack_a = bindings.get(first)
+                stack_b = bindings.get(second)
+                stack_out = bindings.get(output)
+                if not (stack_a and stack_b and stack_out):
+                    return None
+                var_a = stack_a[-1]
+                var_b = stack_b[-1]
+                out = stack_out[-1]
+                cast = ARITHMETIC_CASTS.get(out.type)
+                if cast is None or var_a.type not in ARITHMETIC_CASTS or var_b.type not in ARITHMETIC_CASTS:
+                    return None
+                y = var_b.value
+                if divide and y == 0:
+                    return None
+                try:
+                    value = cast(combine(var_a.value, y))
+                except (ValueError, OverflowError):
+                    return None
+                out.value = value
+                return value
+            return evaluate
+
+        combine = ARITHMETIC_OPERATORS[command]
+        start = {'SUM': 0, 'MULTIPLY': 1}.get(command)
+
+        def evaluate(bindings):
+            stack_out = bindings.get(output)
+            if not stack_out:
+                return None
+            out = stack_out[-1]
+            cast = ARITHMETIC_CASTS.get(out.type)
+            if cast is None:
+                return None
+            values = []
+            for name in inputs:
+                stack = bindings.get(name)
+                if not stack or stack[-1].type not in ARITHMETIC_CASTS:
+                    return None
+                values.append(stack[-1].value)
+            if start is None:
+                result = values[0]
+                values = values[1:]
+            else:
+                result = start
+            for value in values:
+                if divide and value == 0:
+                    return None
+                result = combine(result, value)
+            try:
+                value = cast(result)
+            except (ValueError, OverflowError):
+                return None
+            out.value = value
+            return value
+        return evaluate
+
+
+class Expression:
+    """
+    Biểu thức số học của CALC --expr, biên dịch thành closure: + - * /, dấu ngoặc,
+    dấu trừ một ngôi, số nguyên/số thực và tên biến (đọc qua bảng liên kết khi đánh giá).
+    """
+    def __init__(self, source):
+        self.source = source
+        self.tokens = EXPRESSION_TOKEN.findall(source)
+        self.pos = 0
+        try:
+            if ''.join(self.tokens) != ''.join(source.split()):
+                raise ValueError(source)
+            self.evaluate = self._parse_sum()
+            if self.pos != len(self.tokens):
+                raise ValueError(source)
+        except (ValueError, IndexError):
+            raise InterpreterError(f"Error: Invalid expression '{source}'")
+        finally:
+            del self.tokens, self.pos
+
+    def __reduce__(self):
+        return (Expression, (self.source,))
+
+    def __repr__(self):
+        return f"Expression({self.source!r})"
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _parse_sum(self):
+        left = self._parse_product()
+        while self._peek() in ('+', '-'):
+            op = ARITHMETIC_OPERATORS['SUM' if self.tokens[self.pos] == '+' else 'SUBTRACT']
+            self.pos += 1
+            left = self._binary(op, left, self._parse_product())
+        return left
+
+    def _parse_product(self):
+        left = self._parse_unary()
+        while self._peek() in ('*', '/'):
+            token = self.tokens[self.pos]
+            self.pos += 1
+            right = self._parse_unary()
+            left = self._binary(operator.mul, left, right) if token == '*' else self._divide(left, right)
+        return left
+
+    def _parse_unary(self):
+        if self._peek() == '-':
+            self.pos += 1
+            operand = self._parse_unary()
+            return lambda bindings: -operand(bindings)
+        if self._peek() == '+':
+            self.pos += 1
+            return self._parse_unary()
+        return self._parse_operand()
+
+    def _parse_operand(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if token == '(':
+            inner = self._parse_sum()
+            if self._peek() != ')':
+                raise ValueError(self.source)
+            self.pos += 1
+            return inner
+        if token[0].isdigit() or token[0] == '.':
+            literal = float(token) if '.' in token else int(token)
+            return lambda bindings: literal
+        if not (token[0].isalpha() or token[0] == '_'):
+            raise ValueError(self.source)
+        return self._variable(token)
+
+    @staticmethod
+    def _binary(op, left, right):
+        return lambda bindings: op(left(bindings), right(bindings))
+
+    @staticmethod
+    def _divide(left, right):
+        def divide(bindings):
+            dividend = left(bindings)
+            divisor = right(bindings)
+            if divisor == 0:
+                raise InterpreterError("Error: Division by zero")
+            return dividend / divisor
+        return divide
+
+    @staticmethod
+    def _variable(name):
+        def read(bindings):
+            stack = bindings.get(name)
+            if not stack:
+                raise InterpreterError(f"Error: Variable '{name}' not defined")
+            var = stack[-1]
+            if var.type not in ARITHMETIC_CASTS:
+                raise InterpreterError(f"Error: Variable '{name}' is not a number for CALC operation")
+            return var.value
+        return read
+
+
 class Function:
     """
     Đại diện cho một hàm với tên, tham số đầu vào, mã lệnh và nguồn dữ liệu.
     """
-    def __init__(self, name, parameters, code, source="direct"):
+    def __init__(self, name, parameters, code, source="direct", memo=None):
         self.name = name
         self.parameters = parameters  # Danh sách các tham số đầu vào
-        self.code = code  # Danh sách các dòng mã lệnh
+        self.code = code  # Danh sách các lệnh đã biên dịch (Instruction)
         self.source = source  # Nguồn dữ liệu của hàm, mặc định là 'direct'
+        self.memo = memo  # MemoCache nếu hàm được đánh dấu thuần (DEF --create ... --memo)
 
     def __repr__(self):
-        return (f"Function(name={self.name}, parameters={self.parameters}, source={self.source})")
+        memo = f", memo={self.memo.maxsize}" if self.memo is not None else ""
+        return (f"Function(name={self.name}, parameters={self.parameters}, source={self.source}{memo})")
+
+
+class MemoCache:
+    """
+    Bộ nhớ đệm LRU có giới hạn cho hàm DEF --memo: giá trị các tham số -> giá trị trả về.
+    Lần gọi trúng bộ nhớ đệm không thực thi thân hàm (kể cả PRI hay FILE bên trong).
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(local_scope):
+        """
+        Khóa từ (kiểu, giá trị) của các tham số; None nếu có giá trị không băm được (mảng).
+        """
+        key = tuple((var.type, var.value) for var in local_scope.values())
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        """
+        Trả về (True, giá trị) nếu trúng, ngược lại (False, None).
+        """
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return True, entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        entries = self.entries
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def copy(self):
+        memo = MemoCache(self.maxsize)
+        memo.entries = self.entries.copy()
+        memo.hits, memo.misses = self.hits, self.misses
+        return memo
+
+
+class CodeCache(OrderedDict):
+    """
+    Bộ nhớ đệm LRU có giới hạn cho mã đã biên dịch (mã nguồn, tập tin).
+    Được dùng chung giữa các bản fork, nên phải có giới hạn khi mỗi yêu cầu chạy một kịch bản khác.
+    """
+    def __init__(self, maxsize=256):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
 
 class ClassDefinition:
     def __init__(self, name, inputs, outputs, code, functions=None, lib_code=None):
@@ -62,98 +700,380 @@ class ClassDefinition:
                 f"lib_code={self.lib_code}){interaction_msg}")
 
 
+class FileHandle:
+    """
+    Tập tin đang mở, được lưu trong biến kiểu 'file' (FILE --open).
+    """
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode  # 'read', 'write' hoặc 'append'
+        self.file = open(path, FILE_MODES[mode], encoding="utf8", buffering=FILE_BUFFER_SIZE)
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self):
+        state = ", closed" if self.file.closed else ""
+        return f"FileHandle(path={self.path}, mode={self.mode}{state})"
+
+
+class OutputBuffer:
+    """
+    Bộ đệm đầu ra: gom các chuỗi được ghi và chuyển ra luồng theo lô.
+    """
+    def __init__(self, stream=None, limit=65536):
+        self.stream = stream  # None: dùng sys.stdout tại thời điểm flush
+        self.limit = limit    # Số ký tự tối đa được giữ trước khi tự động flush
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.limit:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+
+
+class Snapshot:
+    """
+    Trạng thái đã khởi động của Interpreter: biến toàn cục, hàm, lớp và bộ nhớ đệm biên dịch.
+    Mã đã biên dịch, hàm và lớp không đổi sau khi tạo nên được dùng chung giữa các bản
+    fork/restore; chỉ biến (và bộ nhớ đệm DEF --memo) được sao chép, không cần copy.deepcopy.
+    """
+    def __init__(self, options, global_variables, functions, classes, caches):
+        self.options = options                    # Đối số khởi tạo Interpreter
+        self.global_variables = global_variables  # Danh sách Variable (bản sao riêng của snapshot)
+        self.functions = functions
+        self.classes = classes
+        self.caches = caches                      # (compiled, file_cache)
+
+    @staticmethod
+    def copy_variables(variables):
+        """
+        Sao chép các Variable; mảng được sao chép một lần cho mỗi đối tượng
+        để các biến cùng tham chiếu tới một mảng vẫn dùng chung bản sao mới.
+        """
+        arrays = {}
+        copies = []
+        for var in variables:
+            value = var.value
+            if isinstance(value, (list, array.array)):
+                value = arrays.get(id(value))
+                if value is None:
+                    value = arrays[id(var.value)] = copy.copy(var.value)
+            copies.append(Variable(var.type, var.name, value))
+        return copies
+
+    @staticmethod
+    def copy_functions(functions):
+        return {name: function if function.memo is None else
+                Function(function.name, function.parameters, function.code, function.source, function.memo.copy())
+                for name, function in functions.items()}
+
+    def __repr__(self):
+        return (f"Snapshot(variables={len(self.global_variables)}, functions={len(self.functions)}, "
+                f"classes={len(self.classes)})")
+
+
+class ExecutionLimits:
+    """
+    Giới hạn thực thi của interpret_async: nhường vòng lặp sự kiện sau mỗi yield_every lệnh,
+    số lệnh tối đa và thời hạn (giây). Được kiểm tra trong vòng lặp của máy ảo.
+    """
+    def __init__(self, yield_every=1000, max_instructions=None, timeout=None):
+        self.yield_every = max(1, yield_every)
+        self.max_instructions = max_instructions
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.executed = 0
+        self.window = self._next_window()  # Số lệnh cho tới lần kiểm tra kế tiếp
+        # Số lệnh còn lại của cửa sổ hiện tại, dùng chung với các lần chạy IMP/LOAD lồng bên trong
+        self.countdown = self.window
+
+    def _next_window(self):
+        if self.max_instructions is None:
+            return self.yield_every
+        return max(1, min(self.yield_every, self.max_instructions - self.executed))
+
+    def tick(self):
+        """
+        Gọi ngay trước lệnh cuối cùng của một cửa sổ (lệnh đó đã được tính vào executed);
+        báo lỗi nếu lệnh này vượt giới hạn, trả về cửa sổ kế tiếp.
+        """
+        self.executed += self.window
+        if self.max_instructions is not None and self.executed > self.max_instructions:
+            raise InterpreterError(f"Error: Instruction budget of {self.max_instructions} exceeded")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise InterpreterError(f"Error: Time budget of {self.timeout}s exceeded")
+        self.window = self._next_window()
+        return self.window
+
+
+class Profiler:
+    """
+    Bộ đo của Interpreter(profile=True): số lần chạy, thời gian tích lũy và thời gian riêng
+    theo dòng, theo lệnh (handler execute_*) và theo hàm/lớp, cùng thời gian biên dịch.
+    """
+    SORT_KEYS = {'count': 0, 'cumulative': 1, 'self': 2}
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.lines = {}     # (đơn vị, số dòng trong mã nguồn, lệnh) -> [số lần, tích lũy, riêng]
+        self.commands = {}  # lệnh -> [số lần, tích lũy, riêng]
+        self.units = {}     # ('DEF' | 'LOAD' | 'IMP', tên) -> [số lần, tích lũy, riêng]
+        self.phases = {}    # 'parse' | 'exec' -> [số lần, tích lũy, riêng]
+        self.stacks = {}    # chuỗi khung -> thời gian riêng (định dạng collapsed-stack)
+        self.active = {}    # (id bảng, khóa) -> số khung đang mở, tránh cộng trùng khi đệ quy
+        self.stack = []     # khung đang mở: [các (bảng, khóa), đường dẫn, bắt đầu, thời gian con]
+        self.unit_names = ['<main>']
+
+    def _enter(self, targets, label):
+        parent = self.stack[-1][1] if self.stack else ()
+        for table, key in targets:
+            stats = table.get(key)
+            if stats is None:
+                stats = table[key] = [0, 0.0, 0.0]
+            stats[0] += 1
+            active_key = (id(table), key)
+            self.active[active_key] = self.active.get(active_key, 0) + 1
+        self.stack.append([targets, parent + (label,), self.clock(), 0.0])
+
+    def leave(self):
+        targets, path, start, child = self.stack.pop()
+        elapsed = self.clock() - start
+        own = elapsed - child
+        for table, key in targets:
+            stats = table[key]
+            stats[2] += own
+            active_key = (id(table), key)
+            self.active[active_key] -= 1
+            if not self.active[active_key]:
+                # Chỉ khung ngoài cùng được cộng vào thời gian tích lũy
+                stats[1] += elapsed
+        self.stacks[path] = self.stacks.get(path, 0.0) + own
+        if self.stack:
+            self.stack[-1][3] += elapsed
+
+    def enter_phase(self, phase):
+        self._enter([(self.phases, phase)], f"({phase})")
+
+    def enter_line(self, instruction):
+        """
+        Mở khung cho một Instruction; DEF --call, IMP và LOAD mở thêm khung đơn vị.
+        Trả về số khung cần đóng bằng leave().
+        """
+        command = instruction.command
+        unit = self.unit_names[-1]
+        # Số dòng tuyệt đối: lineno tính theo khối chứa lệnh nên các dòng khác nhau có thể trùng
+        line = instruction.source_line
+        self._enter([(self.lines, (unit, line, command)), (self.commands, command)],
+                    f"{unit}:{line}:{command}")
+        if command == 'DEF_CALL':
+            kind, name = 'DEF', instruction.args.get('name_def')
+        elif command in ('IMP', 'LOAD'):
+            kind, name = command, instruction.args.get('path')
+        else:
+            return 1
+        self._enter([(self.units, (kind, name))], f"{kind}:{name}")
+        self.unit_names.append(name)
+        return 2
+
+    def leave_line(self, frames):
+        if frames == 2:
+            self.unit_names.pop()
+            self.leave()
+        self.leave()
+
+    @property
+    def parse_time(self):
+        return self.phases.get('parse', [0, 0.0, 0.0])[1]
+
+    @property
+    def exec_time(self):
+        return self.phases.get('exec', [0, 0.0, 0.0])[1]
+
+    def _sorted(self, table, sort, limit):
+        index = self.SORT_KEYS.get(sort)
+        if index is None:
+            raise InterpreterError(f"Error: Unsupported sort key '{sort}'")
+        rows = sorted(table.items(), key=lambda item: item[1][index], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def to_dict(self, sort='self', limit=None):
+        """
+        Báo cáo dạng dict (dùng cho JSON), mỗi bảng được sắp xếp theo sort.
+        """
+        def row(stats, **fields):
+            fields.update(count=stats[0], cumulative=stats[1], self=stats[2])
+            return fields
+
+        return {
+            'parse_time': self.parse_time,
+            'exec_time': self.exec_time,
+            'lines': [row(stats, unit=unit, line=lineno, command=command)
+                      for (unit, lineno, command), stats in self._sorted(self.lines, sort, limit)],
+            'commands': [row(stats, command=command)
+                         for command, stats in self._sorted(self.commands, sort, limit)],
+            'units': [row(stats, kind=kind, name=name)
+                      for (kind, name), stats in self._sorted(self.units, sort, limit)],
+        }
+
+    def report(self, sort='self', limit=20):
+        """
+        Báo cáo dạng văn bản.
+        """
+        out = [f"parse: {self.parse_time:.6f}s  exec: {self.exec_time:.6f}s"]
+        header = f"{'count':>10} {'cumulative':>12} {'self':>12}  "
+        sections = [
+            ("lines", self.lines, lambda key: f"{key[0]}:{key[1]} {key[2]}"),
+            ("commands", self.commands, str),
+            ("DEF/class", self.units, lambda key: f"{key[0]} {key[1]}"),
+        ]
+        for title, table, name in sections:
+            out.append(f"\n{title}\n{header}name")
+            for key, stats in self._sorted(table, sort, limit):
+                out.append(f"{stats[0]:>10} {stats[1]:>12.6f} {stats[2]:>12.6f}  {name(key)}")
+        return '\n'.join(out) + '\n'
+
+    def dump_json(self, path, sort='self', limit=None):
+        with open(path, 'w', encoding="utf8") as file:
+            json.dump(self.to_dict(sort, limit), file, indent=2)
+
+    def dump_collapsed(self, path):
+        """
+        Ghi thời gian riêng theo ngăn xếp khung (micro giây) cho các công cụ flamegraph.
+        """
+        with open(path, 'w', encoding="utf8") as file:
+            for frames, own in sorted(self.stacks.items()):
+                file.write(f"{';'.join(frames)} {max(int(own * 1e6), 0)}\n")
+
+    def reset(self):
+        self.__init__(self.clock)
+
+
 class Interpreter:
     """
     Trình thông dịch cho ngôn ngữ kịch bản tùy chỉnh với hỗ trợ hàm và cấu trúc lớp.
     """
-    def __init__(self):
+    def __init__(self, use_vm=False, verbosity='trace', output=None, trace_handler=None, trace_batch_size=1000,
+                 cache_dir=None, profile=False, max_call_depth=1000, memo_size=128, memory_limit=None,
+                 code_cache_size=256):
+        if verbosity not in VERBOSITY_LEVELS:
+            raise InterpreterError(f"Error: Unsupported verbosity '{verbosity}'")
+        self.use_vm = use_vm            # Thực thi bằng máy ảo bytecode thay cho duyệt cây
+        # 'silent': không có thông báo chẩn đoán; 'errors': ghi thông báo lỗi làm dừng kịch bản;
+        # 'trace': ghi trạng thái của từng lệnh (lỗi vẫn chỉ được ném ra như trước).
+        # PRI --print luôn được ghi ra.
+        self.verbosity = verbosity
+        self.tracing = verbosity == 'trace'
+        self.output = output if output is not None else OutputBuffer()
+        # Nếu có trace_handler, trạng thái được gửi theo lô dạng (sự kiện, giá trị)
+        # thay vì định dạng thành chuỗi
+        self.trace_handler = trace_handler
+        self.trace_batch_size = trace_batch_size
+        self.trace_records = []
+        self.running = 0                # Độ sâu lồng nhau của interpret() (IMP/LOAD gọi lại)
         self.global_variables = {}      # Biến toàn cục
         self.variables = [self.global_variables]  # Ngăn xếp phạm vi biến
+        # Liên kết nông: tên -> danh sách biến cùng tên theo thứ tự phạm vi,
+        # giúp get_variable không phải duyệt ngược toàn bộ ngăn xếp phạm vi
+        self.bindings = {}
         self.functions = {}             # Lưu trữ định nghĩa hàm
         self.classes = {}               # Lưu trữ định nghĩa lớp
-        self.command_patterns = {
-            'VAR': re.compile(
-                r'^VAR\s+--type\s+(?P<type>\w+)\s+--name\s+(?P<name>\w+)(?:\s+--set\s+(?P<set>.+))?$'
-            ),
-            'SUM': re.compile(
-                r'^SUM(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
-            ),
-            'SUBTRACT': re.compile(
-                r'^SUBTRACT(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
-            ),
-            'MULTIPLY': re.compile(
-                r'^MULTIPLY(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
-            ),
-            'DIVIDE': re.compile(
-                r'^DIVIDE(?:\s+--input\s+(?P<input>\w+))+\s+--output\s+(?P<output>\w+)$'
-            ),
-            'FOR': re.compile(
-                r'^FOR(?:\s+--var\s+(?P<var>\w+))?\s+--start\s+(?P<start>\w+)\s+--end\s+(?P<end>\w+)\s+--step\s+(?P<step>\w+)$'
-            ),
-            'IF': re.compile(
-                r'^IF\s+(?P<condition>.+)$'
-            ),
-            'ELSE': re.compile(
-                r'^ELSE$'
-            ),
-            'WHILE': re.compile(
-                r'^WHILE\s+(?P<condition>.+)$'
-            ),
-            'END': re.compile(
-                r'^END$'
-            ),
-            'MEM_RELEASE': re.compile(
-                r'^MEM\s+--release\s+(?P<name>\w+)$'
-            ),
-            'PRI_PRINT': re.compile(
-                r'^PRI\s+--print\s+(?P<var>\w+)$'
-            ),
-            'DEF_CREATE': re.compile(
-                r'^DEF\s+--create\s+(?P<name_def>\w+)(?:\s+--input\s+(?P<inputs>\w+))*\s*$'
-            ),
-            'DEF_CALL': re.compile(
-                r'^DEF\s+--call\s+(?P<name_def>\w+)(?:\s+--input\s+(?P<inputs>\w+))*\s+--save\s+(?P<save>\w+)$'
-            ),
-            'RETURN': re.compile(
-                r'^RETURN\s+(?P<var>\w+)$'
-            ),
-            'FILE_READ': re.compile(
-                r'^FILE\s+--read\s+(?P<path>\S+)\s+--save\s+(?P<save>\w+)$'
-            ),
-            'FILE_SAVE': re.compile(
-                r'^FILE\s+--save\s+(?P<data>\w+)\s+--to\s+(?P<path>\S+)$'
-            ),
-            'IMP': re.compile(
-                r'^IMP\s+--from\s+(?P<path>\S+)\s+--import\s+(?P<name_def>\w+)$'
-            ),
-            'ARR_CREATE': re.compile(
-                r'^ARR\s+--array\s+--create\s+(?P<name>\w+)\s+--max\s+(?P<max>\d+)$'
-            ),
-            'ARR_SET_DATA': re.compile(
-                r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--set_data\s+(?P<variable>\w+)\s+--pos\s+(?P<pos>\d+)$'
-            ),
-            'ARR_GET_DATA': re.compile(
-                r'^ARR\s+--array\s+--name\s+(?P<name>\w+)\s+--get_data\s+(?P<index>\d+)\s+--save\s+(?P<save>\w+)$'
-            ),
-            'LOAD': re.compile(
-                r'^LOAD\s+--from\s+(?P<path>\S+)(?:\s+--input\s+(?P<inputs>\w+))*\s*(?:\s+--save\s+(?P<saves>\w+))*\s*$'
-            ),
+        # Các bộ nhớ đệm biên dịch, mỗi cái giữ tối đa code_cache_size mục gần nhất.
+        # Điều kiện IF/WHILE được biên dịch vào Instruction nên không cần bộ nhớ đệm riêng.
+        self.compiled = CodeCache(code_cache_size)    # Mã nguồn -> InstructionList
+        self.file_cache = CodeCache(code_cache_size)  # (đường dẫn thực, loại) -> ((mtime, kích thước), nội dung đã biên dịch)
+        self.cache_dir = cache_dir      # Thư mục lưu bộ nhớ đệm trên đĩa (None: tắt)
+        self.open_files = []            # FileHandle mở bằng FILE --open, được flush khi kết thúc kịch bản
+        # Ngăn xếp lời gọi DEF --call (tên hàm) và thanh ghi giá trị RETURN của bộ duyệt cây.
+        # Độ sâu tối đa được kiểm tra ở cả hai bộ máy. Thân hàm luôn chạy trên máy ảo (trừ khi profile),
+        # nên độ sâu không phụ thuộc giới hạn đệ quy của Python.
+        self.call_stack = []
+        self.max_call_depth = max_call_depth
+        self.return_value = None
+        self.memo_size = memo_size      # Kích thước mặc định của bộ nhớ đệm DEF --memo
+        self.limits = None              # ExecutionLimits của interpret_async đang chạy
+        # Giới hạn (byte) cho tổng kích thước ước lượng của các biến; None: không giới hạn
+        self.memory_limit = memory_limit
+        # Khi có giới hạn, tổng được cộng/trừ dần khi biến được đặt và loại bỏ thay vì duyệt
+        # lại mọi biến ở mỗi lần cấp phát. Giá trị dùng chung giữa nhiều biến chỉ tính một lần.
+        self.memory_used = 0
+        self.memory_vars = {}    # id(Variable) -> (Variable, giá trị đã được tính)
+        self.memory_values = {}  # id(giá trị) -> [số biến tham chiếu, kích thước]
+        # Đối số khởi tạo, dùng lại khi fork() (output và trace_handler có thể truyền riêng)
+        self.options = {'use_vm': use_vm, 'verbosity': verbosity, 'trace_handler': trace_handler,
+                        'trace_batch_size': trace_batch_size, 'cache_dir': cache_dir, 'profile': profile,
+                        'max_call_depth': max_call_depth, 'memo_size': memo_size, 'memory_limit': memory_limit,
+                        'code_cache_size': code_cache_size}
+        # Profiler (nếu bật) đo từng Instruction; chế độ này luôn dùng bộ duyệt cây
+        self.profiler = Profiler() if profile else None
+        if profile:
+            self.execute_block = self._execute_block_profiled
+        # Các mẫu lệnh được biên dịch một lần ở cấp module và dùng chung giữa các Interpreter
+        self.command_patterns = COMMAND_PATTERNS
+        self.patterns_by_keyword = PATTERNS_BY_KEYWORD
+
+        # Bảng phân phối các lệnh đơn: tên lệnh -> phương thức xử lý
+        self.handlers = {
+            'VAR': self.execute_var,
+            'SUM': self.execute_sum,
+            'SUBTRACT': self.execute_subtract,
+            'MULTIPLY': self.execute_multiply,
+            'DIVIDE': self.execute_divide,
+            'CALC': self.execute_calc,
+            'MEM_RELEASE': self.execute_mem_release,
+            'MEM_STATS': self.execute_mem_stats,
+            'PRI_PRINT': self.execute_print,
+            'FILE_READ': self.execute_file_read,
+            'FILE_SAVE': self.execute_file_save,
+            'FILE_OPEN': self.execute_file_open,
+            'FILE_READ_CHUNK': self.execute_file_read_chunk,
+            'FILE_READ_LINE': self.execute_file_read_line,
+            'FILE_WRITE': self.execute_file_write,
+            'ARR_CREATE': self.execute_array_create,
+            'ARR_SET_DATA': self.execute_array_set_data,
+            'ARR_GET_DATA': self.execute_array_get_data,
+            'ARR_FILL': self.execute_array_fill,
+            'ARR_COPY': self.execute_array_copy,
+            'ARR_REDUCE': self.execute_array_reduce,
+            'ARR_SORT': self.execute_array_sort,
         }
-    
+
     # Các phương thức liên quan đến mảng
     def execute_array_create(self, args):
         # Nội dung như trước
         name = args.get('name')
         max_size = int(args.get('max'))
+        element_type = args.get('type')
 
         if not name or max_size <= 0:
             raise InterpreterError("Lỗi: Lệnh ARR --create cần một tên và số phần tử lớn hơn 0")
 
-        # Tạo mảng dưới dạng danh sách với kích thước xác định
-        array = [0] * max_size
-        var = Variable('array', name, array)
+        if self.memory_limit is not None:
+            itemsize = 8 if element_type is None else array.array(ARRAY_TYPECODES.get(element_type.lower(), 'q')).itemsize
+            self._reserve_memory(itemsize * max_size, f"ARR --create {name}")
+
+        if element_type is None:
+            # Tạo mảng dưới dạng danh sách với kích thước xác định
+            values = [0] * max_size
+        else:
+            # Mảng có kiểu: lưu liền khối bằng array.array (int64/float64)
+            typecode = ARRAY_TYPECODES.get(element_type.lower())
+            if typecode is None:
+                raise InterpreterError(f"Lỗi: Kiểu mảng '{element_type}' không được hỗ trợ (int, float)")
+            values = array.array(typecode, [0]) * max_size
+        var = Variable('array', name, values)
         self.set_variable(var)
-        print(f"Đã tạo mảng '{name}' với kích thước {max_size}")
+        if self.tracing:
+            self.trace('array_create', name, max_size)
 
     def execute_array_set_data(self, args):
         # Nội dung như trước
@@ -162,9 +1082,7 @@ class Interpreter:
         pos = int(args.get('pos'))
 
         # Kiểm tra mảng có tồn tại không
-        array_var = self.get_variable(name)
-        if array_var is None or array_var.type != 'array':
-            raise InterpreterError(f"Lỗi: Mảng '{name}' không tồn tại")
+        array_var = self._get_array(name)
 
         # Kiểm tra vị trí có hợp lệ không
         if pos < 0 or pos >= len(array_var.value):
@@ -176,9 +1094,10 @@ class Interpreter:
             raise InterpreterError(f"Lỗi: Biến '{variable_name}' không tồn tại")
 
         # Gán giá trị vào mảng
-        array_var.value[pos] = data_var.value
-        print(f"Đã gán giá trị '{data_var.value}' vào vị trí {pos} của mảng '{name}'")
-        
+        array_var.value[pos] = self._array_element(array_var, data_var.value)
+        if self.tracing:
+            self.trace('array_set', data_var.value, pos, name)
+
     def execute_array_get_data(self, args):
         # Nội dung như trước
         name = args.get('name')
@@ -186,9 +1105,7 @@ class Interpreter:
         save_var_name = args.get('save')
 
         # Kiểm tra mảng có tồn tại không
-        array_var = self.get_variable(name)
-        if array_var is None or array_var.type != 'array':
-            raise InterpreterError(f"Lỗi: Mảng '{name}' không tồn tại")
+        array_var = self._get_array(name)
 
         # Kiểm tra vị trí có hợp lệ không
         if index < 0 or index >= len(array_var.value):
@@ -199,30 +1116,215 @@ class Interpreter:
         if data is None:
             raise InterpreterError(f"Lỗi: Mảng '{name}' tại vị trí {index} không có giá trị")
 
-        # Lưu giá trị vào biến mới
-        save_var = Variable('auto', save_var_name, data)
+        # Lưu giá trị vào biến mới; phần tử của mảng có kiểu giữ nguyên kiểu số
+        element_type = self._array_type(array_var.value) or 'auto'
+        save_var = Variable(element_type, save_var_name, data)
         self.set_variable(save_var)
-        print(f"Đã lấy giá trị '{data}' từ vị trí {index} của mảng '{name}' và lưu vào '{save_var_name}'")
+        if self.tracing:
+            self.trace('array_get', data, index, name, save_var_name)
+
+    def execute_array_fill(self, args):
+        name = args.get('name')
+        array_var = self._get_array(name)
+        value = self._array_element(array_var, self._resolve_value(args.get('value')))
+
+        # Ghi đè tại chỗ để các biến cùng tham chiếu tới mảng thấy thay đổi
+        values = array_var.value
+        if isinstance(values, array.array):
+            values[:] = array.array(values.typecode, [value]) * len(values)
+        else:
+            values[:] = [value] * len(values)
+        if self.tracing:
+            self.trace('array_fill', value, name)
+
+    def execute_array_copy(self, args):
+        name = args.get('name')
+        target_name = args.get('target')
+        source = self._get_array(name)
+        target = self._get_array(target_name)
+        start = self._resolve_index(args.get('start'))
+        count = self._resolve_index(args.get('count'))
+        pos = self._resolve_index(args.get('pos') or '0')
+
+        if start < 0 or count < 0 or start + count > len(source.value):
+            raise InterpreterError(f"Lỗi: Đoạn [{start}, {start + count}) nằm ngoài phạm vi của mảng '{name}'")
+        if pos < 0 or pos + count > len(target.value):
+            raise InterpreterError(f"Lỗi: Đoạn [{pos}, {pos + count}) nằm ngoài phạm vi của mảng '{target_name}'")
+
+        chunk = source.value[start:start + count]
+        target_values = target.value
+        if isinstance(target_values, array.array) and (
+                not isinstance(chunk, array.array) or chunk.typecode != target_values.typecode):
+            chunk = array.array(target_values.typecode, (self._array_element(target, v) for v in chunk))
+        elif not isinstance(target_values, array.array):
+            chunk = list(chunk)
+        target_values[pos:pos + count] = chunk
+        if self.tracing:
+            self.trace('array_copy', count, name, target_name)
+
+    def execute_array_reduce(self, args):
+        name = args.get('name')
+        operation = args.get('op')
+        save_var_name = args.get('save')
+        array_var = self._get_array(name)
+
+        if not array_var.value and operation != 'sum':
+            raise InterpreterError(f"Lỗi: Mảng '{name}' rỗng")
+        try:
+            result = ARRAY_REDUCTIONS[operation](array_var.value)
+        except TypeError:
+            raise InterpreterError(f"Lỗi: Mảng '{name}' chứa phần tử không phải số")
+
+        default_type = 'float' if isinstance(result, float) else 'int'
+        self._assign_output(save_var_name, result, operation.upper(), default_type=default_type)
+
+    def execute_array_sort(self, args):
+        name = args.get('name')
+        array_var = self._get_array(name)
+        values = array_var.value
+        try:
+            ordered = sorted(values, reverse=args.get('reverse') is not None)
+        except TypeError:
+            raise InterpreterError(f"Lỗi: Không thể sắp xếp mảng '{name}'")
+        values[:] = array.array(values.typecode, ordered) if isinstance(values, array.array) else ordered
+        if self.tracing:
+            self.trace('array_sort', name)
+
+    def _elementwise(self, inputs, output, combine, command_name):
+        """
+        SUM/MULTIPLY trên mảng: tính theo từng phần tử, biến số được phát tán (broadcast).
+        """
+        operands = []
+        length = None
+        is_float = False
+        for var_name in inputs:
+            var = self.get_variable(var_name)
+            if var is None:
+                raise InterpreterError(f"Error: Variable '{var_name}' not defined")
+            if var.type == 'array':
+                if length is None:
+                    length = len(var.value)
+                elif len(var.value) != length:
+                    raise InterpreterError(f"Error: Arrays for {command_name} operation must have the same length")
+                element_type = self._array_type(var.value)
+                if element_type is None:
+                    # Mảng danh sách: kiểu phần tử suy ra từ các giá trị
+                    is_float = is_float or any(isinstance(value, float) for value in var.value)
+                else:
+                    is_float = is_float or element_type == 'float'
+                operands.append(var.value)
+            elif var.type in ['int', 'float']:
+                is_float = is_float or isinstance(var.value, float)
+                operands.append(itertools.repeat(var.value))
+            else:
+                raise InterpreterError(f"Error: Variable '{var_name}' is not a number for {command_name} operation")
+
+        typecode = 'd' if is_float else 'q'
+        output_var = self.get_variable(output)
+        if output_var is None:
+            # Kiểm tra giới hạn bộ nhớ trước khi cấp phát mảng kết quả
+            self._reserve_memory(length * array.array(typecode).itemsize, f"{command_name} {output}")
+
+        result = operands[0]
+        for operand in operands[1:]:
+            result = map(combine, result, operand)
+        try:
+            values = array.array(typecode, itertools.islice(result, length))
+        except TypeError:
+            raise InterpreterError(f"Error: Arrays for {command_name} operation must contain only numbers")
+        except OverflowError:
+            raise InterpreterError(f"Error: {command_name} result does not fit in a 64-bit integer array")
+
+        if output_var is None:
+            self.set_variable(Variable('array', output, values))
+        elif output_var.type != 'array':
+            raise InterpreterError(f"Error: Output variable '{output}' is not an array for {command_name} operation")
+        elif len(output_var.value) != length:
+            raise InterpreterError(f"Error: Output array '{output}' must have {length} elements for {command_name} operation")
+        else:
+            # Ghi tại chỗ, theo kiểu phần tử của mảng đầu ra
+            target = output_var.value
+            if isinstance(target, array.array):
+                if target.typecode != values.typecode:
+                    try:
+                        values = array.array(target.typecode, map(ARRAY_CASTS[target.typecode], values))
+                    except (ValueError, OverflowError):
+                        raise InterpreterError(f"Error: {command_name} result does not fit in array '{output}'")
+                target[:] = values
+            else:
+                target[:] = values.tolist()
+        if self.tracing:
+            self.trace('array_elementwise', command_name.capitalize(), output, length)
+
+    def _get_array(self, name):
+        array_var = self.get_variable(name)
+        if array_var is None or array_var.type != 'array':
+            raise InterpreterError(f"Lỗi: Mảng '{name}' không tồn tại")
+        return array_var
+
+    @staticmethod
+    def _array_type(values):
+        """
+        Kiểu phần tử ('int'/'float') của mảng có kiểu, None với mảng danh sách.
+        """
+        if isinstance(values, array.array):
+            return ARRAY_ELEMENT_TYPES[values.typecode]
+        return None
+
+    def _array_element(self, array_var, value):
+        """
+        Chuyển giá trị về kiểu phần tử của mảng có kiểu.
+        """
+        values = array_var.value
+        if not isinstance(values, array.array):
+            return value
+        try:
+            element = ARRAY_CASTS[values.typecode](value)
+        except (TypeError, ValueError, OverflowError):
+            # OverflowError: inf không chuyển được sang int
+            raise InterpreterError(f"Lỗi: Giá trị '{value}' không phù hợp với kiểu phần tử của mảng '{array_var.name}'")
+        if values.typecode == 'q' and element not in INT64_RANGE:
+            raise InterpreterError(f"Lỗi: Giá trị '{value}' vượt quá phạm vi int64 của mảng '{array_var.name}'")
+        return element
+
+    def _resolve_value(self, token):
+        """
+        Giá trị của biến nếu tồn tại, ngược lại là hằng số nguyên/thực.
+        """
+        var = self.get_variable(token)
+        if var is not None:
+            return var.value
+        try:
+            return int(token)
+        except ValueError:
+            try:
+                return float(token)
+            except ValueError:
+                raise InterpreterError(f"Error: Variable '{token}' not defined")
+
+    def _resolve_index(self, token):
+        value = self._resolve_value(token)
+        if not isinstance(value, int):
+            raise InterpreterError(f"Lỗi: Chỉ số '{token}' phải là số nguyên")
+        return value
 
     # Các phương thức khác
     def execute_imp(self, args, local_functions=None):
+        for _ in self._imp_steps(args, local_functions):
+            pass
+
+    def _imp_steps(self, args, local_functions=None, resumable=False):
         path = args.get('path')
         name_def = args.get('name_def')
 
         if not path or not name_def:
             raise InterpreterError("Error: IMP command requires --from and --import arguments")
 
-        # Read content from file
-        try:
-            with open(path, 'r', encoding="utf8") as file:
-                file_content = file.read()
-        except FileNotFoundError:
-            raise InterpreterError(f"Error: File '{path}' not found")
-        except IOError:
-            raise InterpreterError(f"Error: Cannot read file '{path}'")
+        # Read and compile the file (cached until the file changes)
+        instructions = self.load_source(path, 'script')
 
         # Execute the content of the file to load functions into memory
-        self.interpret(file_content, local_functions=local_functions)
+        yield from self._nested_steps(instructions, resumable, local_functions=local_functions)
 
         # Check if the function has been added to the functions dictionary
         functions_dict = local_functions if local_functions is not None else self.functions
@@ -230,7 +1332,8 @@ class Interpreter:
         if name_def not in functions_dict:
             raise InterpreterError(f"Error: Function '{name_def}' not found in file '{path}'")
 
-        print(f"Function '{name_def}' has been imported from file '{path}'")
+        if self.tracing:
+            self.trace('import', name_def, path)
 
 
     def execute_file_read(self, args):
@@ -243,6 +1346,8 @@ class Interpreter:
 
         # Đọc nội dung từ file
         try:
+            if self.memory_limit is not None:
+                self._reserve_memory(os.path.getsize(path), f"FILE --read {path}")
             with open(path, 'r') as file:
                 data = file.read()
         except FileNotFoundError:
@@ -253,7 +1358,8 @@ class Interpreter:
         # Lưu nội dung vào biến (dưới dạng chuỗi)
         var = Variable('str', save_var_name, data)
         self.set_variable(var)
-        print(f"Đã đọc dữ liệu từ '{path}' và lưu vào biến '{save_var_name}'")
+        if self.tracing:
+            self.trace('file_read', path, save_var_name)
 
     def execute_file_save(self, args):
         # Nội dung như trước
@@ -278,7 +1384,120 @@ class Interpreter:
         except IOError:
             raise InterpreterError(f"Lỗi: Không thể ghi vào tập tin '{path}'")
 
-        print(f"Đã lưu dữ liệu từ biến '{data_var_name}' vào tập tin '{path}'")
+        if self.tracing:
+            self.trace('file_save', data_var_name, path)
+
+    def execute_file_open(self, args):
+        path = args.get('path')
+        mode = args.get('mode')
+        save_var_name = args.get('save')
+
+        try:
+            handle = FileHandle(path, mode)
+        except FileNotFoundError:
+            raise InterpreterError(f"Lỗi: Tập tin '{path}' không tìm thấy")
+        except IOError:
+            raise InterpreterError(f"Lỗi: Không thể mở tập tin '{path}'")
+
+        self.open_files.append(handle)
+        self.set_variable(Variable('file', save_var_name, handle))
+        if self.tracing:
+            self.trace('file_open', path, mode, save_var_name)
+
+    def execute_file_read_chunk(self, args):
+        handle_name = args.get('handle')
+        save_var_name = args.get('save')
+        size = self._resolve_index(args.get('size'))
+        if size <= 0:
+            raise InterpreterError("Lỗi: Lệnh FILE --read_chunk cần kích thước lớn hơn 0")
+
+        handle = self._get_file(handle_name, 'read')
+        self._reserve_memory(size, f"FILE --read_chunk {handle_name}")
+        data = handle.file.read(size)
+        # Chuỗi rỗng nghĩa là đã đọc hết tập tin
+        self.set_variable(Variable('str', save_var_name, data))
+        if self.tracing:
+            self.trace('file_chunk', len(data), handle.path, save_var_name)
+
+    def execute_file_read_line(self, args):
+        handle_name = args.get('handle')
+        save_var_name = args.get('save')
+
+        handle = self._get_file(handle_name, 'read')
+        if self.memory_limit is None:
+            line = handle.file.readline()
+        else:
+            # Đọc không quá phần bộ nhớ còn lại (cộng một ký tự): dòng quá dài bị từ chối
+            # mà không phải nạp hết vào bộ nhớ
+            allowed = max(0, self.memory_limit - self.memory_used - sys.getsizeof(''))
+            line = handle.file.readline(allowed + 1)
+            self._reserve_memory(sys.getsizeof(line), f"FILE --read_line {handle_name}")
+        self.set_variable(Variable('str', save_var_name, line.rstrip('\r\n')))
+        # Biến --eof (nếu có) nhận 1 khi đã đọc hết tập tin
+        if args.get('eof'):
+            self.set_variable(Variable('int', args['eof'], 0 if line else 1))
+        if self.tracing:
+            self.trace('file_line', handle.path, save_var_name)
+
+    def execute_file_write(self, args):
+        data_var_name = args.get('data')
+        handle_name = args.get('handle')
+
+        var = self.get_variable(data_var_name)
+        if var is None:
+            raise InterpreterError(f"Lỗi: Biến '{data_var_name}' không tồn tại")
+        if var.type not in ['str', 'int', 'float']:
+            raise InterpreterError(f"Lỗi: Biến '{data_var_name}' phải là chuỗi hoặc số để ghi vào tập tin")
+
+        handle = self._get_file(handle_name, 'write')
+        data = str(var.value)
+        if args.get('newline'):
+            data += '\n'
+        try:
+            handle.file.write(data)
+        except IOError:
+            raise InterpreterError(f"Lỗi: Không thể ghi vào tập tin '{handle.path}'")
+        if self.tracing:
+            self.trace('file_write', len(data), data_var_name, handle.path)
+
+    def execute_for_lines(self, args, block_commands, in_function=False, local_functions=None, class_scope=None):
+        loop_var = args.get('var')
+        handle = self._get_file(args.get('handle'), 'read')
+
+        # Thêm một phạm vi mới cho vòng lặp; các dòng được đọc dần, không nạp cả tập tin
+        self.push_scope()
+        try:
+            for line in handle.file:
+                self.set_variable(Variable('str', loop_var, line.rstrip('\r\n')))
+                if self.execute_block(block_commands, in_function, local_functions, class_scope):
+                    return True
+        finally:
+            self.pop_scope()
+        return False
+
+    def _get_file(self, name, access):
+        """
+        Lấy FileHandle đang mở từ biến, kiểm tra quyền đọc ('read') hoặc ghi ('write').
+        """
+        var = self.get_variable(name)
+        if var is None or var.type != 'file':
+            raise InterpreterError(f"Lỗi: Biến '{name}' không phải là tập tin đang mở")
+        handle = var.value
+        if handle.file.closed:
+            raise InterpreterError(f"Lỗi: Tập tin '{handle.path}' đã được đóng")
+        if (access == 'read') != (handle.mode == 'read'):
+            action = "đọc" if access == 'read' else "ghi"
+            raise InterpreterError(f"Lỗi: Tập tin '{handle.path}' không được mở để {action}")
+        return handle
+
+    def flush_files(self):
+        """
+        Đẩy dữ liệu trong bộ đệm của các tập tin đang mở để ghi.
+        """
+        self.open_files = [handle for handle in self.open_files if not handle.file.closed]
+        for handle in self.open_files:
+            if handle.mode != 'read':
+                handle.file.flush()
 
     def execute_print(self, args):
         # Nội dung như trước
@@ -290,7 +1509,7 @@ class Interpreter:
             raise InterpreterError(f"Lỗi: Biến '{var_name}' không tồn tại.")
 
         # In giá trị của biến ra màn hình
-        print(f"{var.name}: {var.value}")
+        self.output.write(f"{var.name}: {var.value}\n")
 
     def parse_line(self, line):
         """
@@ -301,21 +1520,27 @@ class Interpreter:
         if not line:
             return None, {}
 
-        for command, pattern in self.command_patterns.items():
+        # Chỉ thử các mẫu ứng với từ khóa đầu dòng (VAR, SUM, DEF, ARR, ...)
+        keyword = line.split(None, 1)[0]
+        for command, pattern in self.patterns_by_keyword.get(keyword, ()):
             match = pattern.match(line)
             if match:
                 args = match.groupdict()
-                # Xử lý nhiều tham số --input
-                if 'input' in args and args['input'] is not None:
-                    inputs = re.findall(r'--input\s+(\w+)', line)
-                    args['input'] = inputs
-                elif 'inputs' in args and args['inputs'] is not None:
-                    inputs = re.findall(r'--input\s+(\w+)', line)
-                    args['inputs'] = inputs
-                if 'saves' in args and args['saves'] is not None:
-                    saves = re.findall(r'--save\s+(\w+)', line)
-                    args['saves'] = saves
-                return command.upper(), args
+                # Xử lý nhiều tham số --input / --save
+                if 'input' in args:
+                    args['input'] = INPUT_PATTERN.findall(line)
+                elif 'inputs' in args:
+                    args['inputs'] = INPUT_PATTERN.findall(line)
+                if 'saves' in args:
+                    args['saves'] = SAVE_PATTERN.findall(line)
+                # Biên dịch trước phép toán số học, biểu thức CALC và điều kiện IF/WHILE
+                if command in ARITHMETIC_OPERATORS and len(args['input']) >= 2:
+                    args['fast'] = Arithmetic(command, args['input'], args['output'])
+                elif command == 'CALC':
+                    args['expression'] = Expression(args['expr'])
+                elif command in ('IF', 'WHILE'):
+                    args['test'] = Condition(args['condition'])
+                return command, args
 
         raise InterpreterError(f"Error: Unable to parse line: '{line}'")
 
@@ -324,17 +1549,62 @@ class Interpreter:
         Lấy biến từ phạm vi hiện tại hoặc phạm vi được cung cấp.
         Phạm vi hiện tại (cục bộ) được ưu tiên.
         """
-        scopes = scopes or self.variables
-        for scope in reversed(scopes):
-            if name in scope:
-                return scope[name]
-        return None
+        if scopes:
+            for scope in reversed(scopes):
+                if name in scope:
+                    return scope[name]
+            return None
+        # Đỉnh của danh sách liên kết chính là biến trong phạm vi gần nhất
+        stack = self.bindings.get(name)
+        return stack[-1] if stack else None
 
     def set_variable(self, var):
         """
         Đặt biến vào phạm vi hiện tại.
         """
-        self.variables[-1][var.name] = var
+        scope = self.variables[-1]
+        stack = self.bindings.setdefault(var.name, [])
+        if var.name in scope:
+            if self.memory_limit is not None:
+                self._release_memory(scope[var.name])
+            stack[-1] = var
+        else:
+            stack.append(var)
+        scope[var.name] = var
+        if self.memory_limit is not None:
+            self._account_memory(var)
+
+    def push_scope(self, scope=None):
+        """
+        Thêm một phạm vi mới vào ngăn xếp biến.
+        """
+        scope = {} if scope is None else scope
+        self.variables.append(scope)
+        for name, var in scope.items():
+            self.bindings.setdefault(name, []).append(var)
+            if self.memory_limit is not None:
+                self._account_memory(var)
+        return scope
+
+    def pop_scope(self):
+        """
+        Loại bỏ phạm vi trên cùng và các liên kết tên -> biến của nó.
+        """
+        scope = self.variables.pop()
+        bindings = self.bindings
+        for name in scope:
+            bindings[name].pop()
+        if self.memory_limit is not None:
+            for var in scope.values():
+                self._release_memory(var)
+        return scope
+
+    def pop_scopes(self, depth):
+        """
+        Loại bỏ các phạm vi cho tới khi ngăn xếp còn `depth` phạm vi.
+        """
+        while len(self.variables) > depth:
+            self.pop_scope()
 
     def execute_var(self, args):
         # Nội dung như trước
@@ -360,7 +1630,8 @@ class Interpreter:
 
         var = Variable(var_type, name, value)
         self.set_variable(var)
-        print(f"Declared variable: {var}")
+        if self.tracing:
+            self.trace('var', var.type, name, value)
 
     def execute_mem_release(self, args):
         # Nội dung như trước
@@ -371,15 +1642,139 @@ class Interpreter:
         # Tìm kiếm và xóa biến trong phạm vi hiện tại hoặc toàn cục
         for scope in reversed(self.variables):
             if var_name in scope:
-                del scope[var_name]
-                print(f"Released variable '{var_name}' from memory")
+                var = scope.pop(var_name)
+                self.bindings[var_name].pop()
+                if self.memory_limit is not None:
+                    self._release_memory(var)
+                if var.type == 'file':
+                    # Giải phóng biến tập tin sẽ ghi nốt bộ đệm và đóng tập tin
+                    var.value.close()
+                if self.tracing:
+                    self.trace('mem_release', var_name)
                 return
 
         # Nếu không tìm thấy biến
         raise InterpreterError(f"Error: Variable '{var_name}' not found")
 
+    def execute_mem_stats(self, args):
+        """
+        MEM --stats: ghi số biến và kích thước ước lượng theo từng phạm vi.
+        """
+        stats = self.memory_stats()
+        write = self.output.write
+        write(f"Memory: {stats['variables']} variables, {stats['bytes']} bytes")
+        if self.memory_limit is not None:
+            write(f" (limit {self.memory_limit})")
+        write("\n")
+        for scope in stats['scopes']:
+            label = "global" if scope['depth'] == 0 else f"scope {scope['depth']}"
+            write(f"  {label}: {scope['variables']} variables, {scope['bytes']} bytes\n")
+        for var_type, entry in sorted(stats['types'].items()):
+            write(f"  {var_type}: {entry['variables']} variables, {entry['bytes']} bytes\n")
+        for name, var_type, size in stats['largest']:
+            write(f"  largest: {name} ({var_type}) {size} bytes\n")
+
+    def memory_stats(self, largest=5):
+        """
+        Thống kê bộ nhớ của các biến: số biến và số byte ước lượng theo phạm vi và theo kiểu,
+        cùng các biến lớn nhất. Mảng dùng chung giữa nhiều biến chỉ được tính một lần.
+        """
+        seen = set()
+        scopes = []
+        types = {}
+        sizes = []
+        for depth, scope in enumerate(self.variables):
+            scope_bytes = 0
+            for var in scope.values():
+                size = self._variable_size(var, seen)
+                scope_bytes += size
+                entry = types.setdefault(var.type, {'variables': 0, 'bytes': 0})
+                entry['variables'] += 1
+                entry['bytes'] += size
+                sizes.append((var.name, var.type, size))
+            scopes.append({'depth': depth, 'variables': len(scope), 'bytes': scope_bytes})
+        sizes.sort(key=lambda item: item[2], reverse=True)
+        return {
+            'variables': sum(scope['variables'] for scope in scopes),
+            'bytes': sum(scope['bytes'] for scope in scopes),
+            'scopes': scopes,
+            'types': types,
+            'largest': sizes[:largest],
+        }
+
+    @staticmethod
+    def _variable_size(var, seen):
+        """
+        Kích thước ước lượng (byte) của giá trị biến; sys.getsizeof của mảng đã gồm vùng đệm
+        phần tử, tập tin đang mở được tính bằng kích thước bộ đệm.
+        """
+        value = var.value
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        if var.type == 'file':
+            return FILE_BUFFER_SIZE if not value.file.closed else 0
+        return sys.getsizeof(value)
+
+    def memory_in_use(self):
+        """
+        Tổng kích thước ước lượng (byte) của mọi biến đang tồn tại. Với memory_limit, đây là
+        tổng được cập nhật dần (kích thước của mỗi giá trị tại thời điểm biến được đặt).
+        """
+        if self.memory_limit is not None:
+            return self.memory_used
+        seen = set()
+        return sum(self._variable_size(var, seen) for scope in self.variables for var in scope.values())
+
+    def _account_memory(self, var):
+        """
+        Cộng kích thước giá trị của biến vào memory_used (chỉ gọi khi có memory_limit).
+        """
+        if id(var) in self.memory_vars:
+            self._release_memory(var)
+        value = var.value
+        self.memory_vars[id(var)] = (var, value)
+        entry = self.memory_values.get(id(value))
+        if entry is not None:
+            entry[0] += 1
+        else:
+            size = self._variable_size(var, set())
+            self.memory_values[id(value)] = [1, size]
+            self.memory_used += size
+
+    def _release_memory(self, var):
+        """
+        Trừ phần của biến khỏi memory_used khi biến bị loại bỏ.
+        """
+        accounted = self.memory_vars.pop(id(var), None)
+        if accounted is None:
+            return
+        entry = self.memory_values[id(accounted[1])]
+        entry[0] -= 1
+        if not entry[0]:
+            del self.memory_values[id(accounted[1])]
+            self.memory_used -= entry[1]
+
+    def _reserve_memory(self, size, what):
+        """
+        Báo InterpreterError nếu cấp thêm size byte sẽ vượt memory_limit.
+        """
+        if self.memory_limit is None:
+            return
+        total = self.memory_used + size
+        if total > self.memory_limit:
+            raise InterpreterError(f"Error: Memory limit of {self.memory_limit} bytes exceeded by {what} "
+                                   f"({total} bytes)")
+
     def execute_sum(self, args):
-        # Nội dung như trước
+        fast = args.get('fast')
+        if fast is not None:
+            value = fast.evaluate(self.bindings)
+            if value is not None:
+                if self.tracing:
+                    self.trace('arithmetic', 'Sum', args['output'], value)
+                return
+
         inputs = args.get('input', [])
         output = args.get('output')
 
@@ -392,12 +1787,21 @@ class Interpreter:
         total = 0
         for var_name in inputs:
             var = self.get_variable(var_name)
+            if var is not None and var.type == 'array':
+                return self._elementwise(inputs, output, operator.add, 'SUM')
             total += self._get_numeric_value(var, var_name, 'SUM')
 
         self._assign_output(output, total, 'SUM')
 
     def execute_subtract(self, args):
-        # Nội dung như trước
+        fast = args.get('fast')
+        if fast is not None:
+            value = fast.evaluate(self.bindings)
+            if value is not None:
+                if self.tracing:
+                    self.trace('arithmetic', 'Subtract', args['output'], value)
+                return
+
         inputs = args.get('input', [])
         output = args.get('output')
 
@@ -418,7 +1822,14 @@ class Interpreter:
         self._assign_output(output, result, 'SUBTRACT')
 
     def execute_multiply(self, args):
-        # Nội dung như trước
+        fast = args.get('fast')
+        if fast is not None:
+            value = fast.evaluate(self.bindings)
+            if value is not None:
+                if self.tracing:
+                    self.trace('arithmetic', 'Multiply', args['output'], value)
+                return
+
         inputs = args.get('input', [])
         output = args.get('output')
 
@@ -431,13 +1842,22 @@ class Interpreter:
         result = 1
         for var_name in inputs:
             var = self.get_variable(var_name)
+            if var is not None and var.type == 'array':
+                return self._elementwise(inputs, output, operator.mul, 'MULTIPLY')
             value = self._get_numeric_value(var, var_name, 'MULTIPLY')
             result *= value
 
         self._assign_output(output, result, 'MULTIPLY')
 
     def execute_divide(self, args):
-        # Nội dung như trước
+        fast = args.get('fast')
+        if fast is not None:
+            value = fast.evaluate(self.bindings)
+            if value is not None:
+                if self.tracing:
+                    self.trace('arithmetic', 'Divide', args['output'], value)
+                return
+
         inputs = args.get('input', [])
         output = args.get('output')
 
@@ -459,25 +1879,89 @@ class Interpreter:
 
         self._assign_output(output, result, 'DIVIDE')
 
-    def execute_def_create(self, args, code_lines, local_functions=None):
+    def execute_calc(self, args):
+        """
+        CALC --expr "a*b+c" --output r: tính biểu thức đã biên dịch và gán vào biến đầu ra.
+        """
+        expression = args.get('expression') or Expression(args.get('expr'))
+        value = expression.evaluate(self.bindings)
+        self._assign_output(args.get('output'), value, 'CALC',
+                            default_type='float' if isinstance(value, float) else 'int')
+
+    def execute_def_create(self, args, code, local_functions=None):
         name_def = args.get('name_def')
         inputs = args.get('inputs', [])
         parameters = inputs if inputs else []
 
-        function = Function(name_def, parameters, code_lines, source="direct")
+        memo = None
+        if args.get('pure') is not None:
+            # --memo [kích thước]: hàm thuần, kết quả được lưu đệm theo giá trị tham số
+            size = args.get('memo')
+            memo = MemoCache(int(size) if size else self.memo_size)
+
+        function = Function(name_def, parameters, code, source="direct", memo=memo)
 
         if local_functions is not None:
             local_functions[name_def] = function
         else:
             self.functions[name_def] = function
 
-        print(f"Đã định nghĩa hàm: {function}")
+        if self.tracing:
+            self.trace('def_create', function)
 
 
     def execute_def_call(self, args, local_functions=None, class_scope=None):
+        function, local_scope = self._prepare_call(args, local_functions, class_scope)
+
+        memo_key = None
+        if function.memo is not None:
+            memo_key = function.memo.key(local_scope)
+            if memo_key is not None:
+                found, return_value = function.memo.get(memo_key)
+                if found:
+                    self._store_return(args, return_value)
+                    return
+
+        # Thêm phạm vi cục bộ vào ngăn xếp biến và khung vào ngăn xếp lời gọi
+        self.push_scope(local_scope)
+        self.call_stack.append(function.name)
+
+        return_value = None
+        try:
+            if self.profiler is None:
+                # Thân hàm chạy trên máy ảo: các lời gọi lồng bên trong dùng ngăn xếp khung
+                # tường minh, nên độ sâu chỉ bị giới hạn bởi max_call_depth
+                returned = self.run_bytecode(self.lower(function.code), in_function=True,
+                                             local_functions=local_functions, class_scope=class_scope)
+            else:
+                # Profiler đo từng Instruction nên thân hàm được duyệt cây
+                returned = self.execute_block(function.code, in_function=True, local_functions=local_functions,
+                                              class_scope=class_scope)
+            if returned:
+                # Nhận giá trị trả về từ thanh ghi
+                return_value = self.return_value
+                self.return_value = None
+        except RecursionError:
+            # Chỉ lời gọi ngoài cùng chuyển lỗi, khi ngăn xếp Python đã được giải phóng
+            if len(self.call_stack) > 1:
+                raise
+            raise InterpreterError(f"Error: Python recursion limit reached in function '{function.name}' "
+                                   f"while profiling") from None
+        finally:
+            # Loại bỏ phạm vi cục bộ
+            self.call_stack.pop()
+            self.pop_scope()
+
+        if memo_key is not None:
+            function.memo.put(memo_key, return_value)
+        self._store_return(args, return_value)
+
+    def _prepare_call(self, args, local_functions=None, class_scope=None):
+        """
+        Tìm hàm được gọi và tạo phạm vi cục bộ chứa bản sao các tham số.
+        """
         name_def = args.get('name_def')
         inputs = args.get('inputs', [])
-        save_var = args.get('save')
 
         # Tìm kiếm hàm trong phạm vi cục bộ trước
         if local_functions and name_def in local_functions:
@@ -487,30 +1971,31 @@ class Interpreter:
         else:
             raise InterpreterError(f"Error: Function '{name_def}' is not defined")
 
+        if len(self.call_stack) >= self.max_call_depth:
+            raise InterpreterError(f"Error: Maximum call depth {self.max_call_depth} exceeded in function '{name_def}'")
+
         if len(inputs) != len(function.parameters):
             raise InterpreterError(f"Error: Function '{name_def}' expects {len(function.parameters)} arguments, got {len(inputs)}")
 
         # Tạo một ngăn xếp mới cho các biến cục bộ của hàm
         local_scope = {}
         for param, input_var in zip(function.parameters, inputs):
-            var = self.get_variable(input_var, scopes=self.variables + [class_scope] if class_scope else self.variables)
+            # Phạm vi lớp (nếu có) được ưu tiên khi tìm biến đầu vào
+            var = class_scope.get(input_var) if class_scope else None
+            if var is None:
+                var = self.get_variable(input_var)
             if var is None:
                 raise InterpreterError(f"Error: Variable '{input_var}' not defined for function parameter '{param}'")
             # Tạo một bản sao của biến để không ảnh hưởng đến biến gốc
             local_scope[param] = Variable(var.type, param, var.value)
+        return function, local_scope
 
-        # Thêm phạm vi cục bộ vào ngăn xếp biến
-        self.variables.append(local_scope)
-
-        try:
-            # Thực thi mã lệnh của hàm
-            self.interpret('\n'.join(function.code), in_function=True, local_functions=local_functions, class_scope=class_scope)
-        except FunctionReturn as fr:
-            # Nhận giá trị trả về từ hàm
-            return_value = fr.value
-        finally:
-            # Loại bỏ phạm vi cục bộ
-            self.variables.pop()
+    def _store_return(self, args, return_value):
+        """
+        Gán giá trị trả về của hàm vào biến --save.
+        """
+        name_def = args.get('name_def')
+        save_var = args.get('save')
 
         # Gán giá trị trả về vào biến lưu
         if save_var:
@@ -535,8 +2020,8 @@ class Interpreter:
                     raise InterpreterError(f"Error: Cannot cast return value to type '{output_var.type}' for variable '{save_var}'")
 
                 output_var.value = return_value
-            print(f"Function '{name_def}' returned value {return_value} assigned to '{save_var}'")
-
+            if self.tracing:
+                self.trace('def_return', name_def, return_value, save_var)
 
     def execute_return(self, args):
         # Nội dung như trước
@@ -544,8 +2029,7 @@ class Interpreter:
         var = self.get_variable(var_name)
         if var is None:
             raise InterpreterError(f"Error: Variable '{var_name}' not defined for RETURN")
-        # Ném ngoại lệ FunctionReturn với giá trị của biến
-        raise FunctionReturn(var.value)
+        return var.value
 
     def _get_numeric_value(self, var, var_name, command_name):
         # Nội dung như trước
@@ -555,12 +2039,12 @@ class Interpreter:
             raise InterpreterError(f"Error: Variable '{var_name}' is not a number for {command_name} operation")
         return var.value
 
-    def _assign_output(self, output_var_name, value, command_name):
+    def _assign_output(self, output_var_name, value, command_name, default_type='int'):
         # Nội dung như trước
         output_var = self.get_variable(output_var_name)
         if not output_var:
             # Nếu biến chưa tồn tại, tạo nó trong phạm vi hiện tại với kiểu số mặc định là int
-            output_var = Variable('int', output_var_name, None)
+            output_var = Variable(default_type, output_var_name, None)
             self.set_variable(output_var)
 
         if output_var.type not in ['int', 'float']:
@@ -576,171 +2060,431 @@ class Interpreter:
             raise InterpreterError(f"Error: Cannot cast value to type '{output_var.type}' for variable '{output_var_name}'")
 
         output_var.value = value
-        operation = command_name.capitalize()
-        print(f"{operation} result stored in {output_var_name} = {value}")
+        if self.tracing:
+            self.trace('arithmetic', command_name.capitalize(), output_var_name, value)
 
-    def evaluate_condition(self, condition_str):
-        # Nội dung như trước
-        # Thay thế tên biến bằng giá trị của chúng
-        tokens = re.findall(r'\w+|[><=!]=|[><]', condition_str)
-        eval_str = ""
-        for token in tokens:
-            if token in ['>', '<', '>=', '<=', '==', '!=']:
-                eval_str += f' {token} '
+    def evaluate_condition(self, condition):
+        """
+        Đánh giá điều kiện IF/WHILE đã được biên dịch cùng Instruction của nó (parse_line).
+        """
+        try:
+            return condition.evaluate(self.bindings)
+        except TypeError:
+            # Ví dụ: so sánh chuỗi với số bằng '<'
+            raise InterpreterError(f"Error: Invalid condition '{condition.source}'")
+
+    def compile(self, code):
+        """
+        Biên dịch kịch bản thành danh sách Instruction (có lưu đệm theo mã nguồn).
+        Cấu trúc khối FOR/IF/WHILE/DEF được xác định một lần duy nhất tại đây.
+        """
+        instructions = self.compiled.get(code)
+        if instructions is None:
+            if self.profiler is not None:
+                self.profiler.enter_phase('parse')
+            try:
+                instructions = self.compiled[code] = self._compile_source(code)
+            finally:
+                if self.profiler is not None:
+                    self.profiler.leave()
+        return instructions
+
+    def _compile_source(self, code):
+        stripped = code.strip()
+        # Số dòng tuyệt đối tính cả các dòng trống đầu đoạn mã bị strip() bỏ đi
+        first_line = code[:len(code) - len(code.lstrip())].count('\n') + 1
+        return self._compile_lines(stripped.split('\n'), first_line)
+
+    def load_source(self, path, kind):
+        """
+        Đọc và biên dịch tập tin cho IMP ('script') hoặc LOAD ('class').
+        Kết quả được lưu đệm theo đường dẫn thực cùng mtime/kích thước của tập tin,
+        và nếu có cache_dir thì được tuần tự hóa ra đĩa (tương tự .pyc).
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise InterpreterError(f"Error: File '{path}' not found")
+        except OSError:
+            raise InterpreterError(f"Error: Cannot read file '{path}'")
+
+        key = (os.path.realpath(path), kind)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        entry = self.file_cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        if self.profiler is not None:
+            self.profiler.enter_phase('parse')
+        try:
+            payload = self._read_source(path, kind, key, stamp)
+        finally:
+            if self.profiler is not None:
+                self.profiler.leave()
+
+        self.file_cache[key] = (stamp, payload)
+        return payload
+
+    def _read_source(self, path, kind, key, stamp):
+        payload = self._read_disk_cache(key, stamp)
+        if payload is None:
+            try:
+                with open(path, 'r', encoding="utf8") as file:
+                    content = file.read()
+            except FileNotFoundError:
+                raise InterpreterError(f"Error: File '{path}' not found")
+            except IOError:
+                raise InterpreterError(f"Error: Cannot read file '{path}'")
+
+            if kind == 'class':
+                class_def = self.parse_class_definition(content)
+                payload = (class_def,
+                           self._compile_source('\n'.join(class_def.lib_code)),
+                           self._compile_source('\n'.join(class_def.code)))
             else:
-                var = self.get_variable(token)
-                if var:
-                    if var.type in ['int', 'float']:
-                        eval_str += str(var.value)
-                    elif var.type == 'str':
-                        eval_str += f'"{var.value}"'
-                    else:
-                        raise InterpreterError(f"Error: Unsupported variable type '{var.type}' in condition")
-                else:
-                    # Giả sử nó là số hoặc chuỗi
-                    if re.match(r'^-?\d+(\.\d+)?$', token):
-                        eval_str += token
-                    else:
-                        eval_str += f'"{token}"'
+                payload = self._compile_source(content)
+            self._write_disk_cache(key, stamp, payload)
+        return payload
+
+    def _disk_cache_path(self, key):
+        digest = hashlib.sha1(f"{key[1]}:{key[0]}".encode('utf8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + CACHE_SUFFIX)
+
+    def _read_disk_cache(self, key, stamp):
+        """
+        Trả về nội dung đã biên dịch từ cache_dir, hoặc None nếu không có/đã cũ.
+        """
+        if self.cache_dir is None:
+            return None
         try:
-            # Chỉ cho phép các toán tử logic cơ bản
-            allowed_names = {"True": True, "False": False}
-            return eval(eval_str, {"__builtins__": None}, allowed_names)
+            with open(self._disk_cache_path(key), 'rb') as file:
+                version, cached_key, cached_stamp, payload = pickle.load(file)
         except Exception:
-            raise InterpreterError(f"Error: Invalid condition '{condition_str}'")
+            # Tập tin hỏng hoặc được ghi bởi phiên bản khác: coi như không có
+            return None
+        if version != CACHE_VERSION or cached_key != key or cached_stamp != stamp:
+            return None
+        return payload
 
-    def interpret(self, code, in_function=False, local_functions=None, class_scope=None):
+    def _write_disk_cache(self, key, stamp, payload):
         """
-        Xử lý và thực thi toàn bộ kịch bản.
+        Ghi nội dung đã biên dịch vào cache_dir; lỗi ghi được bỏ qua như với .pyc.
         """
-        lines = code.strip().split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
+        if self.cache_dir is None:
+            return
+        path = self._disk_cache_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as file:
+                pickle.dump((CACHE_VERSION, key, stamp, payload), file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _compile_lines(self, lines, first_line=1):
+        """
+        Chuyển danh sách dòng lệnh thành cây Instruction trong một lần duyệt tuyến tính.
+        Ngăn xếp các khối đang mở ghép mỗi FOR/IF/WHILE/DEF với ELSE và END của nó,
+        nên mỗi dòng chỉ được phân tích đúng một lần dù khối lồng sâu đến đâu.
+        Số dòng được đánh theo vị trí trong khối chứa nó (bỏ qua dòng trống và chú thích),
+        riêng cấp ngoài cùng theo vị trí trong đoạn mã, giống như khi thông dịch trực tiếp.
+        """
+        return InstructionList(self._compile_stream(lines, first_line))
+
+    def _compile_stream(self, lines, first_line=1):
+        """
+        Như _compile_lines nhưng nhận dòng từ một iterator bất kỳ và trả về (yield) từng
+        Instruction cấp ngoài cùng ngay khi nó hoàn chỉnh: lệnh thường ngay sau khi đọc,
+        khối FOR/IF/WHILE/DEF sau END của nó. Chỉ khối đang mở được giữ trong bộ nhớ.
+        """
+        # Khối đang mở: [Instruction, danh sách đích, vị trí bắt đầu, khối con thuộc phần ELSE?]
+        stack = []
+        position = 0  # Số thứ tự của dòng có nội dung (không trống, không phải chú thích)
+        count = 0     # Số dòng đã đọc
+
+        def lineno_at(i, frame):
+            # Số dòng của dòng thứ i (vị trí position) trong danh sách của khối frame
+            return i + 1 if frame is None else position - frame[2] + 1
+
+        for i, raw in enumerate(lines):
+            count = i + 1
+            line = raw.strip()
             if not line or line.startswith('#'):
-                i += 1
                 continue
-
+            frame = stack[-1] if stack else None
+            lineno = lineno_at(i, frame)
+            source_line = first_line + i
             try:
                 command, args = self.parse_line(line)
             except InterpreterError as e:
-                raise InterpreterError(f"Line {i+1}: {e}")
+                # Lỗi cú pháp chỉ được báo khi dòng lệnh thực sự được thực thi
+                instruction = Instruction('PARSE_ERROR', {'message': f"Line {lineno}: {e}"}, lineno,
+                                          source_line=source_line)
+                position += 1
+                if frame is None:
+                    yield instruction
+                else:
+                    frame[1].append(instruction)
+                continue
 
-            if command in ['FOR', 'IF', 'WHILE', 'DEF_CREATE',]:
-                # Xác định khối lệnh bên trong cấu trúc điều khiển
-                block_commands = []
-                else_commands = []
-                i += 1
-                nested = 1  # Để xử lý các khối lồng nhau
-                while i < len(lines):
-                    current_line = lines[i].strip()
-                    if not current_line or current_line.startswith('#'):
-                        i += 1
-                        continue
-                    if re.match(self.command_patterns['FOR'], current_line):
-                        nested += 1
-                    elif re.match(self.command_patterns['IF'], current_line) or re.match(self.command_patterns['WHILE'], current_line) or re.match(self.command_patterns['DEF_CREATE'], current_line):
-                        nested += 1
-                    elif re.match(self.command_patterns['END'], current_line):
-                        nested -= 1
-                        if nested == 0:
-                            break
-                    elif re.match(self.command_patterns['ELSE'], current_line) and nested == 1 and command == 'IF':
-                        i += 1
-                        while i < len(lines):
-                            else_line = lines[i].strip()
-                            if not else_line or else_line.startswith('#'):
-                                i += 1
-                                continue
-                            if re.match(self.command_patterns['FOR'], else_line):
-                                nested += 1
-                            elif re.match(self.command_patterns['IF'], else_line) or re.match(self.command_patterns['WHILE'], else_line) or re.match(self.command_patterns['DEF_CREATE'], else_line):
-                                nested += 1
-                            elif re.match(self.command_patterns['END'], else_line):
-                                nested -= 1
-                                if nested == 0:
-                                    break
-                            else_commands.append(else_line)
-                            i += 1
-                        break
-                    block_commands.append(current_line)
-                    i += 1
+            if command == 'END' and frame is not None:
+                stack.pop()
+                parent = stack[-1] if stack else None
+                frame[0].end_lineno = lineno_at(i, parent)
+                if parent is None:
+                    position += 1
+                    yield frame[0]
+                    continue
+            elif command == 'ELSE' and frame is not None and frame[0].command == 'IF' and not frame[3]:
+                # Phần ELSE bắt đầu một danh sách mới, đánh số lại từ dòng kế tiếp
+                frame[1] = frame[0].else_body
+                frame[2] = position + 1
+                frame[3] = True
+            elif command in BLOCK_COMMANDS:
+                instruction = Instruction(command, args, lineno, body=InstructionList(),
+                                          else_body=InstructionList(), source_line=source_line)
+                if frame is not None:
+                    frame[1].append(instruction)
+                stack.append([instruction, instruction.body, position + 1, False])
+            elif frame is None:
+                position += 1
+                yield Instruction(command, args, lineno, source_line=source_line)
+                continue
+            else:
+                frame[1].append(Instruction(command, args, lineno, source_line=source_line))
+            position += 1
+
+        # Các khối thiếu END kết thúc ở cuối đoạn mã
+        while stack:
+            frame = stack.pop()
+            parent = stack[-1] if stack else None
+            frame[0].end_lineno = count + 1 if parent is None else position - parent[2] + 1
+            if parent is None:
+                yield frame[0]
+
+    def interpret(self, code, in_function=False, local_functions=None, class_scope=None):
+        """
+        Xử lý và thực thi toàn bộ kịch bản.
+        """
+        self.run(self.compile(code), in_function=in_function,
+                 local_functions=local_functions, class_scope=class_scope)
+
+    def interpret_stream(self, stream, stop_on_error=True):
+        """
+        Thực thi kịch bản theo dòng chảy từ một đối tượng tập tin (hoặc socket.makefile(),
+        hay bất kỳ iterator nào trả về các dòng): mỗi lệnh chạy ngay khi đọc xong,
+        khối chỉ được giữ lại đến END của nó, nên bộ nhớ không tăng theo độ dài kịch bản.
+        Với stop_on_error=False, lỗi được ghi ra output và dòng tiếp theo vẫn được thực thi (REPL).
+        Đầu ra được đẩy sau mỗi lệnh; tập tin FILE --open giữ bộ đệm tới cuối dòng chảy
+        (hoặc tới MEM --release).
+        """
+        # Giữ running trong suốt dòng chảy để run() của từng lệnh không flush_files()
+        self.running += 1
+        profiler = self.profiler if self.running == 1 else None
+        if profiler is not None:
+            profiler.enter_phase('exec')
+        try:
+            for instruction in self._compile_stream(stream):
+                try:
+                    # Danh sách thường, không phải InstructionList: máy ảo hạ lệnh mà không lưu
+                    # bytecode lại, nên không có gì tích lũy theo số lệnh đã chạy
+                    self.run([instruction])
+                except InterpreterError as e:
+                    if not stop_on_error or (self.running == 1 and self.verbosity == 'errors'):
+                        self.output.write(f"{e}\n")
+                    if stop_on_error:
+                        raise
+                finally:
+                    self.flush_trace()
+                    self.output.flush()
+        finally:
+            if profiler is not None:
+                profiler.leave()
+            self.running -= 1
+            if not self.running:
+                self.flush()
+
+    async def interpret_async(self, code, yield_every=1000, max_instructions=None, timeout=None):
+        """
+        Thực thi kịch bản trên máy ảo mà không chặn vòng lặp sự kiện: nhường quyền điều khiển
+        sau mỗi yield_every lệnh, chạy FILE --read/--save bằng asyncio.to_thread và báo
+        InterpreterError khi vượt max_instructions lệnh hoặc timeout giây.
+        IMP/LOAD lồng bên trong chạy trên cùng generator nên cũng nhường quyền và bị giới hạn;
+        các lớp của LOAD --parallel chạy đồng bộ.
+        """
+        if self.running:
+            raise InterpreterError("Error: Interpreter is already running")
+        instructions = self.compile(code)
+        self.limits = ExecutionLimits(yield_every, max_instructions, timeout)
+        self.running += 1
+        steps = self._bytecode_steps(self.lower(instructions), resumable=True)
+        finished = object()
+        try:
+            request = next(steps, finished)
+            while request is not finished:
+                try:
+                    if request is None:
+                        await asyncio.sleep(0)
+                    else:
+                        handler, args = request
+                        await asyncio.to_thread(handler, args)
+                except InterpreterError as e:
+                    request = steps.throw(e)
+                    continue
+                request = next(steps, finished)
+        except InterpreterError as e:
+            if self.verbosity == 'errors':
+                self.output.write(f"{e}\n")
+            raise
+        finally:
+            # Hủy (cancel) giữa chừng: đóng generator để giải phóng các phạm vi còn mở
+            steps.close()
+            self.limits = None
+            self.running -= 1
+            self.flush()
+
+    def run(self, instructions, in_function=False, local_functions=None, class_scope=None):
+        """
+        Thực thi danh sách Instruction đã biên dịch bằng bộ máy được chọn.
+        """
+        self.running += 1
+        profiler = self.profiler if self.running == 1 else None
+        if profiler is not None:
+            profiler.enter_phase('exec')
+        try:
+            if (self.use_vm or self.limits is not None) and self.profiler is None:
+                returned = self.run_bytecode(self.lower(instructions), in_function=in_function,
+                                             local_functions=local_functions, class_scope=class_scope)
+            else:
+                returned = self.execute_block(instructions, in_function=in_function,
+                                              local_functions=local_functions, class_scope=class_scope)
+            if returned:
+                # RETURN ở cấp ngoài cùng của interpret(in_function=True): chuyển giá trị cho nơi gọi
+                return_value, self.return_value = self.return_value, None
+                raise FunctionReturn(return_value)
+        except InterpreterError as e:
+            if self.running == 1 and self.verbosity == 'errors':
+                self.output.write(f"{e}\n")
+            raise
+        finally:
+            if profiler is not None:
+                profiler.leave()
+            self.running -= 1
+            if not self.running:
+                self.flush()
+
+    def trace(self, event, *values):
+        """
+        Ghi một sự kiện trạng thái (chỉ gọi khi self.tracing).
+        """
+        if self.trace_handler is not None:
+            self.trace_records.append((event, values))
+            if len(self.trace_records) >= self.trace_batch_size:
+                self.flush_trace()
+        else:
+            self.output.write(TRACE_MESSAGES[event].format(*values) + "\n")
 
+    def flush_trace(self):
+        """
+        Gửi lô bản ghi trạng thái đang chờ tới trace_handler.
+        """
+        if self.trace_records:
+            records = self.trace_records
+            self.trace_records = []
+            self.trace_handler(records)
+
+    def flush(self):
+        """
+        Đẩy toàn bộ đầu ra và bản ghi trạng thái còn trong bộ đệm.
+        """
+        self.flush_trace()
+        self.output.flush()
+        self.flush_files()
+
+    def execute_block(self, instructions, in_function=False, local_functions=None, class_scope=None):
+        """
+        Thực thi một danh sách Instruction đã biên dịch.
+        Trả về True nếu gặp RETURN (giá trị nằm trong self.return_value).
+        """
+        handlers = self.handlers
+        for instruction in instructions:
+            command = instruction.command
+            args = instruction.args
+
+            handler = handlers.get(command)
+            if handler is not None:
+                # Thực thi các lệnh đơn
+                try:
+                    handler(args)
+                except InterpreterError as e:
+                    raise InterpreterError(f"Line {instruction.lineno}: {e}")
+            elif command in BLOCK_COMMANDS:
                 # Thực thi cấu trúc điều khiển
+                returned = False
                 try:
                     if command == 'FOR':
-                        self.execute_for(args, block_commands)
+                        returned = self.execute_for(args, instruction.body, in_function, local_functions, class_scope)
+                    elif command == 'FOR_LINES':
+                        returned = self.execute_for_lines(args, instruction.body, in_function, local_functions,
+                                                          class_scope)
                     elif command == 'IF':
-                        self.execute_if(args, block_commands, else_commands)
+                        returned = self.execute_if(args, instruction.body, instruction.else_body,
+                                                   in_function, local_functions, class_scope)
                     elif command == 'WHILE':
-                        self.execute_while(args, block_commands)
+                        returned = self.execute_while(args, instruction.body, in_function, local_functions,
+                                                      class_scope)
                     elif command == 'DEF_CREATE':
-                        # Xác định mã lệnh của hàm
-                        func_code = block_commands
-                        self.execute_def_create(args, func_code, local_functions)
+                        self.execute_def_create(args, instruction.body, local_functions)
+                    elif command == 'LOAD_PARALLEL':
+                        self.execute_load_parallel(args, instruction.body)
                 except InterpreterError as e:
-                    raise InterpreterError(f"Line {i+1}: {e}")
-                except FunctionReturn as fr:
-                    if in_function:
-                        raise fr  # Cho phép RETURN trả về giá trị từ hàm
-                    else:
-                        raise InterpreterError("Error: RETURN statement outside of function")
-                i += 1  # Bỏ qua 'END'
+                    raise InterpreterError(f"Line {instruction.end_lineno}: {e}")
+                if returned:
+                    return True  # RETURN trong khối: thoát tới lời gọi hàm
             elif command == 'RETURN':
-                var_name = args.get('var')
-                var = self.get_variable(var_name)
-                if var is None:
-                    raise InterpreterError(f"Error: Variable '{var_name}' not defined for RETURN")
-                # Ném ngoại lệ FunctionReturn với giá trị của biến
-                raise FunctionReturn(var.value)
+                if not in_function:
+                    raise InterpreterError("Error: RETURN statement outside of function")
+                # Giá trị trả về được đặt vào thanh ghi return_value, không dùng ngoại lệ
+                self.return_value = self.execute_return(args)
+                return True
             elif command == 'DEF_CALL':
-                # Thực thi DEF --call
                 self.execute_def_call(args, local_functions, class_scope=class_scope)
-                i += 1
             elif command == 'IMP':
                 self.execute_imp(args, local_functions=local_functions)
-                i += 1
             elif command == 'LOAD':
                 self.execute_load(args)
-                i += 1
             elif command == 'END':
-                # 'END' đã được xử lý trong khi phân tích
+                # 'END' đã được xử lý trong khi biên dịch
                 raise InterpreterError("Error: 'END' without matching block")
+            elif command == 'PARSE_ERROR':
+                raise InterpreterError(args['message'])
             else:
-                # Thực thi các lệnh đơn
-                try:
-                    if command == 'VAR':
-                        self.execute_var(args)
-                    elif command == 'SUM':
-                        self.execute_sum(args)
-                    elif command == 'SUBTRACT':
-                        self.execute_subtract(args)
-                    elif command == 'MULTIPLY':
-                        self.execute_multiply(args)
-                    elif command == 'DIVIDE':
-                        self.execute_divide(args)
-                    elif command == 'MEM_RELEASE':
-                        self.execute_mem_release(args)
-                    elif command == 'PRI_PRINT':
-                        self.execute_print(args)
-                    elif command == 'FILE_READ':
-                        self.execute_file_read(args)
-                    elif command == 'FILE_SAVE':
-                        self.execute_file_save(args)
-                    elif command == 'ARR_CREATE':
-                        self.execute_array_create(args)
-                    elif command == 'ARR_SET_DATA':
-                        self.execute_array_set_data(args)
-                    elif command == 'ARR_GET_DATA':
-                        self.execute_array_get_data(args)
-                    else:
-                        raise InterpreterError(f"Error: Unknown command '{command}'")
-                except InterpreterError as e:
-                    raise InterpreterError(f"Line {i+1}: {e}")
-                i += 1
+                raise InterpreterError(f"Line {instruction.lineno}: Error: Unknown command '{command}'")
+        return False
 
-    def execute_for(self, args, block_commands):
-        # Nội dung như trước
+    def _execute_block_profiled(self, instructions, in_function=False, local_functions=None, class_scope=None):
+        """
+        execute_block khi bật profile: mỗi Instruction được thực thi và đo riêng.
+        """
+        profiler = self.profiler
+        execute_block = type(self).execute_block
+        for instruction in instructions:
+            frames = profiler.enter_line(instruction)
+            try:
+                if execute_block(self, (instruction,), in_function, local_functions, class_scope):
+                    return True
+            finally:
+                profiler.leave_line(frames)
+        return False
+
+    def _for_range(self, args):
+        """
+        Trả về (biến lặp, start, end, step) của lệnh FOR.
+        """
         loop_var = args.get('var') or 'i'  # Biến lặp mặc định là 'i' nếu không chỉ định
 
         # Lấy giá trị từ biến đã khai báo hoặc giá trị trực tiếp
@@ -752,65 +2496,311 @@ class Interpreter:
 
         step_var = self.get_variable(args.get('step'))
         step = step_var.value if step_var else int(args.get('step'))
+        return loop_var, start, end, step
 
-        # Thêm một phạm vi mới cho vòng lặp
-        self.variables.append({})
-
-        # Khởi tạo biến lặp trong phạm vi mới
-        loop_variable = Variable('int', loop_var, start)
-        self.set_variable(loop_variable)
-
-        # Xác định điều kiện lặp dựa trên bước lặp
-        if step > 0:
-            condition = lambda x: x <= end
-        else:
-            condition = lambda x: x >= end
+    def execute_for(self, args, block_commands, in_function=False, local_functions=None, class_scope=None):
+        # Nội dung như trước
+        loop_var, start, end, step = self._for_range(args)
 
-        while condition(self.get_variable(loop_var).value):
-            # Thực thi các lệnh trong block_commands
-            self.interpret('\n'.join(block_commands), in_function=False)
-            # Tăng biến lặp
-            self.get_variable(loop_var).value += step
+        # Thêm một phạm vi mới cho vòng lặp
+        self.push_scope()
+        try:
+            # Khởi tạo biến lặp trong phạm vi mới
+            loop_variable = Variable('int', loop_var, start)
+            self.set_variable(loop_variable)
 
-        # Loại bỏ phạm vi của vòng lặp
-        self.variables.pop()
+            # Xác định điều kiện lặp dựa trên bước lặp
+            if step > 0:
+                condition = lambda x: x <= end
+            else:
+                condition = lambda x: x >= end
+
+            while condition(self.get_variable(loop_var).value):
+                # Thực thi các lệnh đã biên dịch trong khối; dừng ngay khi gặp RETURN
+                if self.execute_block(block_commands, in_function, local_functions, class_scope):
+                    return True
+                # Tăng biến lặp
+                self.get_variable(loop_var).value += step
+        finally:
+            # Loại bỏ phạm vi của vòng lặp
+            self.pop_scope()
+        return False
 
-    def execute_if(self, args, block_commands, else_commands):
+    def execute_if(self, args, block_commands, else_commands, in_function=False, local_functions=None, class_scope=None):
         # Nội dung như trước
-        condition_str = args.get('condition')
-        condition_result = self.evaluate_condition(condition_str)
-
-        if condition_result:
-            # Thêm một phạm vi mới cho khối IF
-            self.variables.append({})
-            self.interpret('\n'.join(block_commands), in_function=False)
-            self.variables.pop()
-        else:
-            if else_commands:
-                # Thêm một phạm vi mới cho khối ELSE
-                self.variables.append({})
-                self.interpret('\n'.join(else_commands), in_function=False)
-                self.variables.pop()
+        condition_result = self.evaluate_condition(args['test'])
 
-    def execute_while(self, args, block_commands):
+        commands = block_commands if condition_result else else_commands
+        if condition_result or commands:
+            # Thêm một phạm vi mới cho khối IF/ELSE
+            self.push_scope()
+            try:
+                return self.execute_block(commands, in_function, local_functions, class_scope)
+            finally:
+                self.pop_scope()
+        return False
+
+    def execute_while(self, args, block_commands, in_function=False, local_functions=None, class_scope=None):
         # Nội dung như trước
-        condition_str = args.get('condition')
+        condition = args['test']
 
         # Thêm một phạm vi mới cho vòng lặp WHILE
-        self.variables.append({})
-
+        self.push_scope()
         try:
-            while self.evaluate_condition(condition_str):
-                # Thực thi các lệnh trong block_commands
-                try:
-                    self.interpret('\n'.join(block_commands), in_function=True)  # in_function=True để hỗ trợ RETURN trong hàm
-                except FunctionReturn as fr:
-                    # Nếu gặp RETURN, thoát khỏi vòng lặp
-                    self.variables.pop()
-                    raise fr  # Đẩy ngoại lệ ra ngoài để được xử lý ở cấp độ hàm
+            while self.evaluate_condition(condition):
+                # Thực thi các lệnh trong khối; RETURN được đẩy ra ngoài để hàm xử lý
+                if self.execute_block(block_commands, in_function, local_functions, class_scope):
+                    return True
         finally:
             # Loại bỏ phạm vi của vòng lặp
-            self.variables.pop()
+            self.pop_scope()
+        return False
+
+    def lower(self, instructions):
+        """
+        Hạ danh sách Instruction thành bytecode phẳng cho máy ảo.
+        Mỗi phần tử là (opcode, toán hạng, Instruction, tiền tố thông báo lỗi).
+        Bytecode được lưu trên chính InstructionList; danh sách thường (như lệnh của
+        interpret_stream) được hạ lại mỗi lần và không giữ lại gì.
+        """
+        code = getattr(instructions, 'bytecode', None)
+        if code is None:
+            code = []
+            self._lower_into(code, instructions, "")
+            if isinstance(instructions, InstructionList):
+                instructions.bytecode = code
+        return code
+
+    def _lower_into(self, code, instructions, prefix):
+        for instruction in instructions:
+            command = instruction.command
+            if command in self.handlers:
+                # Handler được tra theo tên lúc thực thi, trên Interpreter đang chạy
+                op = OP_EXEC_IO if command in BLOCKING_COMMANDS else OP_EXEC
+                code.append((op, command, instruction, f"{prefix}Line {instruction.lineno}: "))
+            elif command in BLOCK_COMMANDS:
+                # Lỗi bên trong khối được gắn số dòng END của khối, giống execute_block
+                inner = f"{prefix}Line {instruction.end_lineno}: "
+                if command == 'FOR':
+                    code.append((OP_FOR_INIT, None, instruction, inner))
+                    head = len(code)
+                    code.append(None)
+                    self._lower_into(code, instruction.body, inner)
+                    code.append((OP_FOR_STEP, head, instruction, inner))
+                    code[head] = (OP_FOR_TEST, len(code), instruction, inner)
+                elif command == 'FOR_LINES':
+                    code.append((OP_LINES_INIT, None, instruction, inner))
+                    head = len(code)
+                    code.append(None)
+                    self._lower_into(code, instruction.body, inner)
+                    code.append((OP_JUMP, head, instruction, inner))
+                    code[head] = (OP_LINES_NEXT, len(code), instruction, inner)
+                elif command == 'IF':
+                    test = len(code)
+                    code.append(None)
+                    self._lower_into(code, instruction.body, inner)
+                    code.append((OP_POP_SCOPE, None, instruction, inner))
+                    if instruction.else_body:
+                        jump = len(code)
+                        code.append(None)
+                        code[test] = (OP_IF_TEST, len(code), instruction, inner)
+                        code.append((OP_PUSH_SCOPE, None, instruction, inner))
+                        self._lower_into(code, instruction.else_body, inner)
+                        code.append((OP_POP_SCOPE, None, instruction, inner))
+                        code[jump] = (OP_JUMP, len(code), instruction, inner)
+                    else:
+                        code[test] = (OP_IF_TEST, len(code), instruction, inner)
+                elif command == 'WHILE':
+                    code.append((OP_PUSH_SCOPE, None, instruction, inner))
+                    head = len(code)
+                    code.append(None)
+                    self._lower_into(code, instruction.body, inner)
+                    code.append((OP_JUMP, head, instruction, inner))
+                    code[head] = (OP_WHILE_TEST, len(code), instruction, inner)
+                    code.append((OP_POP_SCOPE, None, instruction, inner))
+                elif command == 'DEF_CREATE':
+                    code.append((OP_DEF, None, instruction, inner))
+                elif command == 'LOAD_PARALLEL':
+                    code.append((OP_LOAD_PARALLEL, None, instruction, inner))
+            elif command == 'RETURN':
+                code.append((OP_RETURN, None, instruction, prefix))
+            elif command == 'DEF_CALL':
+                code.append((OP_CALL, None, instruction, prefix))
+            elif command == 'IMP':
+                code.append((OP_IMP, None, instruction, prefix))
+            elif command == 'LOAD':
+                code.append((OP_LOAD, None, instruction, prefix))
+            elif command == 'END':
+                code.append((OP_RAISE, "Error: 'END' without matching block", instruction, prefix))
+            elif command == 'PARSE_ERROR':
+                code.append((OP_RAISE, instruction.args['message'], instruction, prefix))
+            else:
+                code.append((OP_RAISE, f"Error: Unknown command '{command}'", instruction,
+                             f"{prefix}Line {instruction.lineno}: "))
+
+    def run_bytecode(self, code, in_function=False, local_functions=None, class_scope=None):
+        """
+        Thực thi bytecode tới khi kết thúc (không nhường quyền điều khiển).
+        Trả về True nếu gặp RETURN ở khung ngoài cùng (giá trị nằm trong self.return_value).
+        """
+        steps = self._bytecode_steps(code, in_function, local_functions, class_scope, resumable=False)
+        try:
+            while True:
+                next(steps)
+        except StopIteration as stop:
+            # Giá trị return của generator
+            return stop.value
+
+    def _bytecode_steps(self, code, in_function=False, local_functions=None, class_scope=None, resumable=False):
+        """
+        Vòng lặp thực thi bytecode. Lời gọi hàm dùng ngăn xếp khung (frame) tường minh
+        thay cho đệ quy interpret(); RETURN là một opcode, không phải ngoại lệ.
+        Là generator để có thể tạm dừng: khi resumable, nhường None sau mỗi cửa sổ lệnh
+        của self.limits và nhường (handler, args) cho các lệnh I/O chặn.
+        Kết thúc với True nếu RETURN thoát khỏi khung ngoài cùng (giá trị trong self.return_value).
+        """
+        limits = self.limits
+        countdown = limits.countdown if limits is not None else -1  # -1: không bao giờ kiểm tra
+        variables = self.variables
+        handlers = self.handlers
+        base_depth = len(variables)
+        base_calls = len(self.call_stack)
+        # (code, pc, in_function, local_functions, class_scope, độ sâu phạm vi, độ sâu vòng lặp, args,
+        #  (MemoCache, khóa) hoặc None, tiền tố)
+        frames = []
+        loops = []   # (biến lặp, end, tăng dần?, step) của các vòng FOR, (biến lặp, iterator) của FOR --in
+        pc = 0
+        try:
+            while True:
+                if pc < len(code):
+                    op, arg, instruction, prefix = code[pc]
+                    pc += 1
+                elif frames:
+                    # Hàm kết thúc mà không có RETURN
+                    op, arg, instruction = OP_RETURN, None, None
+                else:
+                    return False
+
+                countdown -= 1
+                if not countdown:
+                    countdown = limits.tick()
+                    if resumable:
+                        yield None
+
+                if op == OP_EXEC:
+                    handlers[arg](instruction.args)
+                elif op == OP_FOR_TEST:
+                    loop_var, end, ascending, step = loops[-1]
+                    value = self.get_variable(loop_var).value
+                    if not (value <= end if ascending else value >= end):
+                        loops.pop()
+                        self.pop_scope()
+                        pc = arg
+                elif op == OP_FOR_STEP:
+                    loop = loops[-1]
+                    self.get_variable(loop[0]).value += loop[3]
+                    pc = arg
+                elif op == OP_JUMP:
+                    pc = arg
+                elif op == OP_IF_TEST:
+                    if self.evaluate_condition(instruction.args['test']):
+                        self.push_scope()
+                    else:
+                        pc = arg
+                elif op == OP_WHILE_TEST:
+                    if not self.evaluate_condition(instruction.args['test']):
+                        pc = arg
+                elif op == OP_PUSH_SCOPE:
+                    self.push_scope()
+                elif op == OP_POP_SCOPE:
+                    self.pop_scope()
+                elif op == OP_FOR_INIT:
+                    loop_var, start, end, step = self._for_range(instruction.args)
+                    self.push_scope()
+                    self.set_variable(Variable('int', loop_var, start))
+                    loops.append((loop_var, end, step > 0, step))
+                elif op == OP_LINES_NEXT:
+                    loop_var, lines = loops[-1]
+                    line = next(lines, None)
+                    if line is None:
+                        loops.pop()
+                        self.pop_scope()
+                        pc = arg
+                    else:
+                        self.set_variable(Variable('str', loop_var, line.rstrip('\r\n')))
+                elif op == OP_LINES_INIT:
+                    handle = self._get_file(instruction.args.get('handle'), 'read')
+                    self.push_scope()
+                    loops.append((instruction.args.get('var'), iter(handle.file)))
+                elif op == OP_CALL:
+                    function, local_scope = self._prepare_call(instruction.args, local_functions, class_scope)
+                    memo = None
+                    if function.memo is not None:
+                        memo_key = function.memo.key(local_scope)
+                        if memo_key is not None:
+                            found, return_value = function.memo.get(memo_key)
+                            if found:
+                                self._store_return(instruction.args, return_value)
+                                continue
+                            memo = (function.memo, memo_key)
+                    frames.append((code, pc, in_function, local_functions, class_scope,
+                                   len(variables), len(loops), instruction.args, memo, prefix))
+                    self.push_scope(local_scope)
+                    self.call_stack.append(function.name)
+                    code = self.lower(function.code)
+                    pc = 0
+                    in_function = True
+                elif op == OP_RETURN:
+                    return_value = None
+                    if instruction is not None:
+                        if not in_function:
+                            raise InterpreterError("Error: RETURN statement outside of function")
+                        return_value = self.execute_return(instruction.args)
+                        if not frames:
+                            # Thân hàm của DEF --call (bộ duyệt cây) hoặc interpret(in_function=True):
+                            # chuyển giá trị cho nơi gọi qua thanh ghi
+                            self.return_value = return_value
+                            return True
+                    (code, pc, in_function, local_functions, class_scope,
+                     depth, loop_depth, call_args, memo, _) = frames.pop()
+                    self.pop_scopes(depth)
+                    del loops[loop_depth:]
+                    self.call_stack.pop()
+                    if memo is not None:
+                        memo[0].put(memo[1], return_value)
+                    self._store_return(call_args, return_value)
+                elif op == OP_DEF:
+                    self.execute_def_create(instruction.args, instruction.body, local_functions)
+                elif op == OP_IMP or op == OP_LOAD or op == OP_LOAD_PARALLEL:
+                    # Lần chạy lồng bên trong tiếp tục đếm trên cửa sổ lệnh hiện tại
+                    if limits is not None:
+                        limits.countdown = countdown
+                    if op == OP_IMP:
+                        yield from self._imp_steps(instruction.args, local_functions, resumable)
+                    elif op == OP_LOAD:
+                        yield from self._load_steps(instruction.args, resumable)
+                    else:
+                        self.execute_load_parallel(instruction.args, instruction.body)
+                    if limits is not None:
+                        countdown = limits.countdown
+                elif op == OP_EXEC_IO:
+                    if resumable:
+                        # Lỗi của handler được ném lại tại đây (generator.throw) để có số dòng
+                        yield (handlers[arg], instruction.args)
+                    else:
+                        handlers[arg](instruction.args)
+                elif op == OP_RAISE:
+                    raise InterpreterError(arg)
+        except InterpreterError as e:
+            # Ghép số dòng của các khối và lời gọi hàm đang mở, như khi thông dịch đệ quy
+            prefix = ''.join(frame[-1] for frame in frames) + code[pc - 1][3]
+            raise InterpreterError(f"{prefix}{e}")
+        finally:
+            # Loại bỏ các phạm vi và khung lời gọi còn mở khi có lỗi
+            self.pop_scopes(base_depth)
+            del self.call_stack[base_calls:]
+            if limits is not None:
+                limits.countdown = countdown
 
     def parse_class_definition(self, content):
         lines = content.strip().split('\n')
@@ -909,27 +2899,50 @@ class Interpreter:
 
 
     def execute_load(self, args):
+        for _ in self._load_steps(args):
+            pass
+
+    def _load_steps(self, args, resumable=False):
+        class_def, lib_instructions, code_instructions, class_scope = self._prepare_load(args)
+        yield from self._class_steps(class_def, lib_instructions, code_instructions, class_scope, resumable)
+        self._store_outputs(class_def, class_scope, args.get('saves', []))
+
+    def _nested_steps(self, instructions, resumable, local_functions=None, class_scope=None):
+        """
+        Chạy mã của IMP/LOAD. Như run() nếu không resumable; trong interpret_async, mã được chạy
+        trên cùng generator của máy ảo (yield from) nên vẫn nhường vòng lặp sự kiện theo nhịp
+        thường và dùng chung cửa sổ lệnh của self.limits.
+        """
+        if not resumable:
+            self.run(instructions, local_functions=local_functions, class_scope=class_scope)
+            return
+        self.running += 1
+        try:
+            yield from self._bytecode_steps(self.lower(instructions), local_functions=local_functions,
+                                            class_scope=class_scope, resumable=True)
+        finally:
+            self.running -= 1
+
+    def _prepare_load(self, args):
+        """
+        Đọc lớp của LOAD và tạo phạm vi lớp chứa bản sao các biến đầu vào.
+        """
         path = args.get('path')
         inputs = args.get('inputs', [])
-        saves = args.get('saves', [])
 
         if not path:
             raise InterpreterError("Error: LOAD command requires --from argument")
 
-        # Read class file
-        try:
-            with open(path, 'r', encoding="utf8") as f:
-                content = f.read()
-        except FileNotFoundError:
-            raise InterpreterError(f"Error: File '{path}' not found")
-        except IOError:
-            raise InterpreterError(f"Error: Cannot read file '{path}'")
+        # Read and parse class file (cached until the file changes)
+        parsed, lib_instructions, code_instructions = self.load_source(path, 'class')
 
-        # Parse class definition
-        class_def = self.parse_class_definition(content)
+        # Mỗi lần LOAD dùng một ClassDefinition mới để các hàm trong LIB không bị giữ lại
+        class_def = ClassDefinition(parsed.name, parsed.inputs, parsed.outputs, parsed.code,
+                                    lib_code=parsed.lib_code)
 
         # Hiển thị thông tin ClassDefinition
-        print(f"Loaded ClassDefinition: {repr(class_def)}")
+        if self.tracing:
+            self.trace('load_class', class_def)
 
         # Validate inputs
         if len(inputs) != len(class_def.inputs):
@@ -945,22 +2958,37 @@ class Interpreter:
             if var.type != var_type:
                 raise InterpreterError(f"Error: Variable '{input_var_name}' type '{var.type}' does not match expected type '{var_type}' for class input '{var_name}'")
             class_scope[var_name] = Variable(var_type, var_name, var.value)
+        return class_def, lib_instructions, code_instructions, class_scope
+
+    def _execute_class(self, class_def, lib_instructions, code_instructions, class_scope):
+        for _ in self._class_steps(class_def, lib_instructions, code_instructions, class_scope):
+            pass
 
+    def _class_steps(self, class_def, lib_instructions, code_instructions, class_scope, resumable=False):
+        """
+        Thực thi LIB và ENV CAL của lớp trong phạm vi lớp (xem _nested_steps).
+        """
         # Add class scope to variables stack
-        self.variables.append(class_scope)
+        self.push_scope(class_scope)
 
         # Execute LIB code with local functions
         try:
             if class_def.lib_code:
-                self.interpret('\n'.join(class_def.lib_code), in_function=False, local_functions=class_def.functions, class_scope=class_scope)
+                yield from self._nested_steps(lib_instructions, resumable, local_functions=class_def.functions,
+                                              class_scope=class_scope)
             # Execute class code with local functions
-            self.interpret('\n'.join(class_def.code), in_function=False, local_functions=class_def.functions, class_scope=class_scope)
+            yield from self._nested_steps(code_instructions, resumable, local_functions=class_def.functions,
+                                          class_scope=class_scope)
         except InterpreterError as e:
             raise InterpreterError(f"Error executing class '{class_def.name}': {e}")
         finally:
             # Remove class scope
-            self.variables.pop()
+            self.pop_scope()
 
+    def _store_outputs(self, class_def, class_scope, saves):
+        """
+        Gán các biến đầu ra của lớp vào các biến --save.
+        """
         # Validate outputs
         if len(saves) != len(class_def.outputs):
             raise InterpreterError(f"Error: Class '{class_def.name}' produces {len(class_def.outputs)} outputs, but {len(saves)} --save arguments provided")
@@ -979,20 +3007,196 @@ class Interpreter:
                 new_var = Variable(var_type, save_var_name, output_var.value)
                 self.set_variable(new_var)
 
-        print(f"Class '{class_def.name}' executed and outputs saved to variables: {', '.join(saves)}")
+        if self.tracing:
+            self.trace('load_done', class_def.name, ', '.join(saves))
+
+    def execute_load_parallel(self, args, block_commands):
+        """
+        Khối LOAD --parallel: các LOAD bên trong được chạy song song bằng run_many.
+        """
+        loads = []
+        for instruction in block_commands:
+            if instruction.command != 'LOAD':
+                raise InterpreterError(f"Line {instruction.lineno}: Error: LOAD --parallel block may only contain LOAD commands")
+            loads.append(instruction.args)
+        workers = args.get('workers')
+        self.run_many(loads, workers=int(workers) if workers else None)
+
+    def run_many(self, loads, workers=None):
+        """
+        Chạy nhiều lời gọi lớp độc lập trong một nhóm tiến trình.
+        loads: danh sách dict {'path', 'inputs', 'saves'} như đối số của LOAD.
+        Mọi biến đầu vào được đọc trước khi ghi bất kỳ đầu ra nào; đầu ra, PRI và trạng thái
+        được ghép lại theo đúng thứ tự của loads. Mã lớp chỉ thấy bản sao biến toàn cục và hàm
+        toàn cục; các thay đổi ngoài biến đầu ra khai báo không được đưa về.
+        Trả về danh sách dict tên biến --save -> giá trị.
+        """
+        loads = [{'path': load.get('path'), 'inputs': load.get('inputs') or [], 'saves': load.get('saves') or []}
+                 for load in loads]
+        prepared = [self._prepare_load(load) for load in loads]
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(loads))
+        # Tiến trình con dùng cùng các tùy chọn (kể cả memory_limit); profiler và trace_handler
+        # không chuyển sang được, bản ghi trạng thái được gom qua collect_trace
+        options = {name: value for name, value in self.options.items() if name not in ('profile', 'trace_handler')}
+        # Biến tập tin không chuyển được sang tiến trình con
+        global_variables = [var for var in self.global_variables.values() if var.type != 'file']
+        if workers <= 1:
+            # Không cần nhóm tiến trình: chạy tuần tự trong tiến trình hiện tại, nhưng trên một
+            # Interpreter riêng như tiến trình con, để kết quả không phụ thuộc số tiến trình
+            worker = _make_class_worker(options, self.trace_handler is not None, global_variables,
+                                        self.functions, (self.compiled, self.file_cache))
+            worker.limits = self.limits
+            results = [_run_class_worker(load['path'], class_scope, worker)
+                       for load, (*_, class_scope) in zip(loads, prepared)]
+            return self._merge_results(prepared, loads, results)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_class_worker,
+                                 initargs=(options, self.trace_handler is not None,
+                                           global_variables, self.functions)) as executor:
+            results = executor.map(_run_class_worker, [load['path'] for load in loads],
+                                   [class_scope for *_, class_scope in prepared],
+                                   chunksize=max(1, len(loads) // (workers * 4)))
+            return self._merge_results(prepared, loads, results)
+
+    def _merge_results(self, prepared, loads, results):
+        """
+        Ghép kết quả của run_many theo thứ tự loads (results có thể là iterator của nhóm tiến trình).
+        """
+        merged = []
+        for (class_def, *_), load, (outputs, text, records) in zip(prepared, loads, results):
+            if text:
+                self.output.write(text)
+            if records:
+                self.trace_records.extend(records)
+                if len(self.trace_records) >= self.trace_batch_size:
+                    self.flush_trace()
+            self._store_outputs(class_def, outputs, load['saves'])
+            merged.append({save: self.get_variable(save).value for save in load['saves']})
+        return merged
 
     def display_variables(self):
         """
         Hiển thị tất cả biến toàn cục và biến trong phạm vi hiện tại.
         """
-        print(self.functions)
-        print("\nFinal Global Variables:")
+        write = self.output.write
+        write(f"{self.functions}\n")
+        write("\nFinal Global Variables:\n")
         for var in self.global_variables.values():
-            print(var)
+            write(f"{var}\n")
         if len(self.variables) > 1:
-            print("\nFinal Variables in Current Scope:")
+            write("\nFinal Variables in Current Scope:\n")
             for var in self.variables[-1].values():
-                print(var)
+                write(f"{var}\n")
+        memo_stats = self.memo_stats()
+        if memo_stats:
+            write("\nMemo Cache:\n")
+            for name, stats in memo_stats.items():
+                write(f"{name}: hits={stats['hits']} misses={stats['misses']} "
+                      f"size={stats['size']}/{stats['maxsize']}\n")
+        self.flush()
+
+    def snapshot(self):
+        """
+        Chụp trạng thái hiện tại (chỉ khi không có kịch bản đang chạy).
+        Biến kiểu tập tin không được đưa vào snapshot.
+        """
+        if self.running or len(self.variables) > 1:
+            raise InterpreterError("Error: Cannot snapshot a running interpreter")
+        variables = [var for var in self.global_variables.values() if var.type != 'file']
+        return Snapshot(dict(self.options), Snapshot.copy_variables(variables),
+                        Snapshot.copy_functions(self.functions), dict(self.classes),
+                        (self.compiled, self.file_cache))
+
+    def restore(self, snapshot):
+        """
+        Đưa Interpreter về trạng thái của snapshot; snapshot có thể được dùng lại nhiều lần.
+        """
+        if self.running:
+            raise InterpreterError("Error: Cannot restore a running interpreter")
+        self.global_variables = {}
+        self.variables = [self.global_variables]
+        self.bindings = {}
+        self.memory_used = 0
+        self.memory_vars = {}
+        self.memory_values = {}
+        for var in Snapshot.copy_variables(snapshot.global_variables):
+            self.set_variable(var)
+        self.functions = Snapshot.copy_functions(snapshot.functions)
+        self.classes = dict(snapshot.classes)
+        # Bộ nhớ đệm biên dịch không chứa trạng thái của Interpreter nào, nên dùng chung được giữa các bản sao
+        self.compiled, self.file_cache = snapshot.caches
+        self.call_stack = []
+        self.return_value = None
+
+    @classmethod
+    def from_snapshot(cls, snapshot, **options):
+        interpreter = cls(**{**snapshot.options, **options})
+        interpreter.restore(snapshot)
+        return interpreter
+
+    def fork(self, **options):
+        """
+        Tạo Interpreter mới có cùng trạng thái và cấu hình; options ghi đè đối số khởi tạo.
+        """
+        return type(self).from_snapshot(self.snapshot(), **options)
+
+    def memo_stats(self):
+        """
+        Thống kê bộ nhớ đệm của các hàm DEF --memo toàn cục: tên -> hits/misses/size/maxsize.
+        """
+        return {name: function.memo.stats() for name, function in self.functions.items()
+                if function.memo is not None}
+
+# Trình thông dịch của tiến trình con trong LOAD --parallel / Interpreter.run_many
+_class_worker = None
+
+def _make_class_worker(options, collect_trace, global_variables, functions, caches=None):
+    """
+    Interpreter chạy lớp của run_many: biến toàn cục và hàm của Interpreter cha, cùng snapshot
+    của trạng thái đó để mỗi lớp bắt đầu từ cùng một trạng thái.
+    """
+    interpreter = Interpreter(**options)
+    if caches is not None:
+        interpreter.compiled, interpreter.file_cache = caches
+    for var in global_variables:
+        interpreter.set_variable(var)
+    interpreter.functions.update(functions)
+    interpreter.collect_trace = collect_trace
+    interpreter.initial_state = interpreter.snapshot()
+    return interpreter
+
+def _init_class_worker(options, collect_trace, global_variables, functions):
+    """
+    Khởi tạo tiến trình con: một Interpreter với biến toàn cục và hàm của tiến trình cha.
+    """
+    global _class_worker
+    _class_worker = _make_class_worker(options, collect_trace, global_variables, functions)
+
+def _run_class_worker(path, class_scope, interpreter=None):
+    """
+    Thực thi một lớp trong tiến trình con (hoặc trên interpreter cho trước); trả về
+    (biến đầu ra, đầu ra đã ghi, bản ghi trạng thái).
+    """
+    if interpreter is None:
+        interpreter = _class_worker
+    # Các thay đổi của lớp trước (biến toàn cục, hàm, bộ nhớ đệm DEF --memo) không được giữ lại
+    interpreter.restore(interpreter.initial_state)
+    stream = io.StringIO()
+    interpreter.output = OutputBuffer(stream)
+    records = []
+    interpreter.trace_handler = records.extend if interpreter.collect_trace else None
+    parsed, lib_instructions, code_instructions = interpreter.load_source(path, 'class')
+    class_def = ClassDefinition(parsed.name, parsed.inputs, parsed.outputs, parsed.code,
+                                lib_code=parsed.lib_code)
+    try:
+        interpreter._execute_class(class_def, lib_instructions, code_instructions, class_scope)
+    finally:
+        interpreter.flush()
+    outputs = {name: class_scope[name] for _, name in class_def.outputs if name in class_scope}
+    return outputs, stream.getvalue(), records
 
 def main():
     """
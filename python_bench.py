@@ -0,0 +1,343 @@
+"""
+python_bench.py
+
+Micro-benchmarks for the scripting language interpreter in python.py.
+
+Usage:
+    python python_bench.py parse [--lines 100000]
+    python python_bench.py while [--iterations 100000]
+    python python_bench.py suite [--scale 1.0] [--vm] [--json out.json] [--baseline base.json]
+
+The suite runs each case in a fresh process and reports ops/sec and peak RSS
+as JSON; with --baseline it compares against a saved run and exits with
+status 1 if any case is slower than the tolerance.
+"""
+
+import sys, os, re, argparse, time, contextlib, json, platform, subprocess, tempfile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from python import Interpreter, InterpreterError, Condition, INPUT_PATTERN, SAVE_PATTERN
+
+# lines used to build synthetic straight-line scripts
+SAMPLE_LINES = [
+    "VAR --type int --name a{n} --set {n}",
+    "VAR --type float --name f{n} --set 1.5",
+    "SUM --input a{n} --input b --input c --output total",
+    "SUBTRACT --input a{n} --input b --output diff",
+    "MULTIPLY --input f{n} --input b --output prod",
+    "DIVIDE --input a{n} --input b --output ratio",
+    "ARR --array --name arr --set_data a{n} --pos 3",
+    "ARR --array --name arr --get_data 3 --save item",
+    "DEF --call add --input a{n} --input b --save r",
+    "LOAD --from lib.cls --input a{n} --input b --save x --save y",
+    "PRI --print total",
+    "MEM --release a{n}",
+]
+
+def makeScript(nLines):
+    """returns a straight-line script with nLines commands"""
+    return '\n'.join(SAMPLE_LINES[n % len(SAMPLE_LINES)].format(n=n)
+                     for n in range(nLines))
+
+def parseLineLinear(interpreter, line):
+    """parse_line as it was before keyword dispatch: try every pattern in turn"""
+    line = line.split('#')[0].strip()
+    if not line:
+        return None, {}
+    for command, pattern in interpreter.command_patterns.items():
+        match = pattern.match(line)
+        if match:
+            args = match.groupdict()
+            if 'input' in args and args['input'] is not None:
+                args['input'] = INPUT_PATTERN.findall(line)
+            elif 'inputs' in args and args['inputs'] is not None:
+                args['inputs'] = INPUT_PATTERN.findall(line)
+            if 'saves' in args and args['saves'] is not None:
+                args['saves'] = SAVE_PATTERN.findall(line)
+            return command, args
+    raise InterpreterError(f"Error: Unable to parse line: '{line}'")
+
+class EvalConditionInterpreter(Interpreter):
+    """Interpreter using the old tokenize + eval() condition evaluator"""
+    def evaluate_condition(self, condition):
+        # the old evaluator re-tokenizes the source text on every check
+        condition_str = condition.source
+        tokens = re.findall(r'\w+|[><=!]=|[><]', condition_str)
+        eval_str = ""
+        for token in tokens:
+            if token in ['>', '<', '>=', '<=', '==', '!=']:
+                eval_str += f' {token} '
+            else:
+                var = self.get_variable(token)
+                if var:
+                    if var.type in ['int', 'float']:
+                        eval_str += str(var.value)
+                    elif var.type == 'str':
+                        eval_str += f'"{var.value}"'
+                    else:
+                        raise InterpreterError(f"Error: Unsupported variable type '{var.type}' in condition")
+                elif re.match(r'^-?\d+(\.\d+)?$', token):
+                    eval_str += token
+                else:
+                    eval_str += f'"{token}"'
+        try:
+            return eval(eval_str, {"__builtins__": None}, {"True": True, "False": False})
+        except Exception:
+            raise InterpreterError(f"Error: Invalid condition '{condition_str}'")
+
+def whileScript(iterations, condition="n < limit"):
+    """returns a script with a WHILE loop of the given number of iterations"""
+    return f"""
+    VAR --type int --name n --set 0
+    VAR --type int --name one --set 1
+    VAR --type int --name limit --set {iterations}
+    WHILE {condition}
+      SUM --input n --input one --output n
+    END
+    """
+
+def timeIt(func, *args):
+    """returns elapsed seconds for func(*args)"""
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def benchParse(nLines):
+    """reports lines/sec for linear-scan vs keyword-dispatch parsing"""
+    interpreter = Interpreter()
+    lines = makeScript(nLines).split('\n')
+
+    def runLinear():
+        for line in lines:
+            parseLineLinear(interpreter, line)
+
+    def runKeyword():
+        for line in lines:
+            interpreter.parse_line(line)
+
+    before = timeIt(runLinear)
+    after = timeIt(runKeyword)
+    print(f"parse {nLines} lines")
+    print(f"  linear scan      : {nLines/before:12.0f} lines/sec")
+    print(f"  keyword dispatch : {nLines/after:12.0f} lines/sec ({before/after:.2f}x)")
+
+def benchWhile(iterations):
+    """reports WHILE iterations/sec and condition checks/sec, eval() vs compiled"""
+    print(f"WHILE loop, {iterations} iterations")
+    runs = [("eval() condition        ", EvalConditionInterpreter, "n < limit"),
+            ("compiled condition      ", Interpreter, "n < limit"),
+            ("compiled AND/NOT        ", Interpreter, "n < limit AND NOT n < 0")]
+    for label, interpreterClass, condition in runs:
+        interpreter = interpreterClass()
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            elapsed = timeIt(interpreter.interpret, whileScript(iterations, condition))
+        compiled = Condition(condition)
+        checkTime = timeIt(lambda: [interpreter.evaluate_condition(compiled) for _ in range(iterations)])
+        print(f"  {label}: {iterations/elapsed:12.0f} iterations/sec, "
+              f"{iterations/checkTime:12.0f} conditions/sec")
+
+# benchmark suite cases: name -> function(scale, workDir) returning (script, ops)
+def forCase(scale, workDir):
+    """tight FOR loop with arithmetic"""
+    n = int(200000 * scale)
+    script = f"""
+    VAR --type int --name a --set 3
+    VAR --type int --name b --set 0
+    FOR --var i --start 1 --end {n} --step 1
+      SUM --input a --input i --output b
+      MULTIPLY --input b --input a --output b
+    END
+    """
+    return script, n
+
+def whileCase(scale, workDir):
+    """WHILE loop with a compound condition"""
+    n = int(100000 * scale)
+    return whileScript(n, "n < limit AND NOT n < 0"), n
+
+def recursionCase(scale, workDir):
+    """deep recursion through DEF --call"""
+    depth = 150
+    reps = max(1, int(200 * scale))
+    script = f"""
+    VAR --type int --name one --set 1
+    VAR --type int --name depth --set {depth}
+    DEF --create down --input n
+      IF n > 0
+        SUBTRACT --input n --input one --output m
+        DEF --call down --input m --save r
+      END
+      RETURN n
+    END
+    FOR --var k --start 1 --end {reps} --step 1
+      DEF --call down --input depth --save out
+    END
+    """
+    return script, reps * (depth + 1)
+
+def arrayCase(scale, workDir):
+    """ARR set/get sweeps over a typed array"""
+    size = 256
+    reps = max(1, int(200 * scale))
+    body = '\n'.join(f"      ARR --array --name arr --set_data k --pos {pos}\n"
+                     f"      ARR --array --name arr --get_data {pos} --save item"
+                     for pos in range(size))
+    script = f"""
+    ARR --array --create arr --max {size} --type int
+    FOR --var k --start 1 --end {reps} --step 1
+{body}
+    END
+    """
+    return script, 2 * size * reps
+
+CLASS_SOURCE = """Class Bench
+BEGIN
+IN :
+_int: a, b
+LIB
+DEF --create add --input x --input y
+SUM --input x --input y --output r
+RETURN r
+END
+ENV CAL
+DEF --call add --input a --input b --save sum_out
+MULTIPLY --input a --input b --output product_out
+OUT
+_int: sum_out, product_out
+END Bench
+"""
+
+def loadCase(scale, workDir):
+    """repeated LOAD of a .cls class file"""
+    path = os.path.join(workDir, 'bench.cls')
+    with open(path, 'w') as f:
+        f.write(CLASS_SOURCE)
+    n = max(1, int(5000 * scale))
+    script = f"""
+    VAR --type int --name x --set 7
+    VAR --type int --name y --set 3
+    FOR --var k --start 1 --end {n} --step 1
+      LOAD --from {path} --input x --input y --save s --save p
+    END
+    """
+    return script, n
+
+def impCase(scale, workDir):
+    """IMP of a large function library"""
+    nFunctions = 500
+    path = os.path.join(workDir, 'bench_lib.txt')
+    with open(path, 'w') as f:
+        for k in range(nFunctions):
+            f.write(f"DEF --create f{k} --input a --input b\n"
+                    f"SUM --input a --input b --output r\n"
+                    f"RETURN r\nEND\n")
+    n = max(1, int(200 * scale))
+    script = '\n'.join(f"IMP --from {path} --import f{k % nFunctions}" for k in range(n))
+    return script, n
+
+SUITE = {
+    'for_arithmetic': forCase,
+    'while_condition': whileCase,
+    'def_recursion': recursionCase,
+    'arr_sweep': arrayCase,
+    'load_class': loadCase,
+    'imp_library': impCase,
+}
+
+def peakRss():
+    """returns the peak resident set size of this process in KiB (None if unknown)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def runCase(name, scale, repeat, useVm):
+    """runs one suite case in this process, returns its result dict"""
+    with tempfile.TemporaryDirectory() as workDir:
+        script, ops = SUITE[name](scale, workDir)
+        best = None
+        for _ in range(repeat):
+            interpreter = Interpreter(use_vm=useVm, verbosity='silent')
+            elapsed = timeIt(interpreter.interpret, script)
+            best = elapsed if best is None else min(best, elapsed)
+    return {'ops': ops, 'seconds': best, 'ops_per_sec': ops / best, 'peak_rss_kb': peakRss()}
+
+def runSuite(names, scale, repeat, useVm):
+    """runs each case in a fresh interpreter process so peak RSS is per case"""
+    results = {}
+    for name in names:
+        command = [sys.executable, os.path.abspath(__file__), 'suite', '--case', name,
+                   '--scale', str(scale), '--repeat', str(repeat)]
+        if useVm:
+            command.append('--vm')
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results[name] = json.loads(output)
+    return {'python': platform.python_version(), 'vm': useVm, 'scale': scale, 'cases': results}
+
+def compareBaseline(report, baseline, tolerance):
+    """prints ops/sec ratios against a baseline, returns True if a case regressed"""
+    regressed = False
+    print(f"{'case':<18}{'baseline':>14}{'current':>14}{'ratio':>8}")
+    for name, result in report['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            print(f"{name:<18}{'-':>14}{result['ops_per_sec']:>14.0f}")
+            continue
+        ratio = result['ops_per_sec'] / base['ops_per_sec']
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  SLOWER'
+            regressed = True
+        print(f"{name:<18}{base['ops_per_sec']:>14.0f}{result['ops_per_sec']:>14.0f}{ratio:>8.2f}{flag}")
+    return regressed
+
+def benchSuite(args):
+    """runs the suite (or one case with --case) and writes/compares JSON results"""
+    if args.case:
+        print(json.dumps(runCase(args.case, args.scale, args.repeat, args.vm)))
+        return 0
+    names = args.only.split(',') if args.only else list(SUITE)
+    report = runSuite(names, args.scale, args.repeat, args.vm)
+    text = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return 1 if compareBaseline(report, baseline, args.tolerance) else 0
+    print(text)
+    return 0
+
+# main() function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the python.py interpreter.")
+    parser.add_argument('bench', choices=['parse', 'while', 'suite'])
+    parser.add_argument('--lines', dest='lines', type=int, default=100000, required=False)
+    parser.add_argument('--iterations', dest='iterations', type=int, default=100000, required=False)
+    # suite options
+    parser.add_argument('--scale', dest='scale', type=float, default=1.0, required=False)
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3, required=False)
+    parser.add_argument('--vm', dest='vm', action='store_true', required=False)
+    parser.add_argument('--only', dest='only', required=False, help="comma-separated case names")
+    parser.add_argument('--case', dest='case', choices=list(SUITE), required=False, help=argparse.SUPPRESS)
+    parser.add_argument('--json', dest='json', required=False)
+    parser.add_argument('--baseline', dest='baseline', required=False)
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=0.05, required=False)
+    args = parser.parse_args()
+
+    if args.bench == 'parse':
+        benchParse(args.lines)
+    elif args.bench == 'while':
+        benchWhile(args.iterations)
+    elif args.bench == 'suite':
+        sys.exit(benchSuite(args))
+
+# call main
+if __name__ == '__main__':
+    main()
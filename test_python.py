@@ -0,0 +1,1186 @@
+"""
+test_python.py
+
+Kiểm thử hồi quy cho python.py: mỗi kịch bản trong CORPUS được chạy bằng cả bộ duyệt cây
+lẫn máy ảo (use_vm=True) và so với kết quả mong đợi. Kết quả mong đợi giống trình thông dịch
+ban đầu, trừ các trường hợp mà bản gốc bị lỗi Python (RETURN ở cấp ngoài cùng, hàm không có
+RETURN, hàm không tham số).
+
+Chạy: python -m pytest -q test_python.py (hoặc python -m unittest test_python)
+"""
+
+import array
+import asyncio
+import contextlib
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+import python
+from python import Interpreter, InterpreterError
+
+FIXTURES = {
+    'Math.cls': """\
+Class MathOperations
+BEGIN
+IN :
+_int: a, b
+LIB
+DEF --create add --input x --input y
+SUM --input x --input y --output r
+RETURN r
+END
+ENV CAL
+DEF --call add --input a --input b --save sum_out
+MULTIPLY --input a --input b --output product_out
+OUT
+_int: sum_out, product_out
+END MathOperations
+""",
+    'lib.txt': """\
+DEF --create sq --input x
+MULTIPLY --input x --input x --output r
+RETURN r
+END
+DEF --create add3 --input a --input b --input c
+SUM --input a --input b --input c --output r
+RETURN r
+END
+""",
+    'Big.cls': """\
+Class Big
+BEGIN
+IN :
+_int: n
+LIB
+ENV CAL
+ARR --array --create big --max 100000 --type int
+VAR --type int --name out --set 1
+OUT
+_int: out
+END Big
+""",
+    'Step.cls': """\
+Class Step
+BEGIN
+IN :
+_int: n
+LIB
+ENV CAL
+VAR --type int --name one --set 1
+SUM --input seen --input one --output seen
+SUM --input n --input one --output r
+SUM --input r --input seen --input base --output s
+OUT
+_int: r, s
+END Step
+""",
+    'Spin.cls': """\
+Class Spin
+BEGIN
+IN :
+_int: n
+LIB
+ENV CAL
+WHILE n > 0
+  VAR --type int --name k --set 1
+END
+OUT
+_int: n
+END Spin
+""",
+    'in.txt': "hello file\n",
+    'lines.txt': "alpha\nbeta\ngamma\n",
+}
+
+# tên -> (kịch bản, đầu ra của PRI, thông báo lỗi hoặc None)
+CORPUS = {
+    'arith': ("""
+VAR --type int --name a --set 7
+VAR --type int --name b --set 3
+VAR --type float --name f --set 2.5
+SUM --input a --input b --output c
+SUBTRACT --input a --input b --input b --output d
+MULTIPLY --input a --input f --output e
+DIVIDE --input a --input b --output g
+VAR --type float --name h
+DIVIDE --input a --input b --output h
+SUM --input f --input f --output a
+PRI --print c
+PRI --print h
+""", 'c: 10\nh: 2.3333333333333335\n', None),
+    'for': ("""
+VAR --type int --name total --set 0
+VAR --type int --name n --set 5
+FOR --var k --start 1 --end n --step 1
+  SUM --input total --input k --output total
+  VAR --type int --name inner --set 3
+END
+FOR --start 10 --end 0 --step -5
+  SUM --input total --input i --output total
+END
+PRI --print total
+""", '', "Line 7: Error: Unable to parse line: 'FOR --start 10 --end 0 --step -5'"),
+    'nested': ("""
+VAR --type int --name acc --set 0
+FOR --var x --start 1 --end 3 --step 1
+  FOR --var y --start 1 --end 3 --step 1
+    IF x == y
+      SUM --input acc --input x --output acc
+    ELSE
+      IF x > y
+        SUBTRACT --input acc --input y --output acc
+      END
+    END
+  END
+END
+PRI --print acc
+""", 'acc: 2\n', None),
+    'while': ("""
+VAR --type int --name n --set 0
+VAR --type int --name one --set 1
+WHILE n < 10
+  SUM --input n --input one --output n
+END
+VAR --type str --name s --set abc
+IF s == abc
+  PRI --print s
+END
+IF n != 10
+  PRI --print n
+ELSE
+  PRI --print one
+END
+""", 's: abc\none: 1\n', None),
+    'func': ("""
+DEF --create add --input x --input y
+SUM --input x --input y --output r
+RETURN r
+END
+VAR --type int --name a --set 2
+VAR --type int --name b --set 40
+DEF --call add --input a --input b --save c
+VAR --type float --name d
+DEF --call add --input a --input a --save d
+PRI --print c
+PRI --print d
+""", 'c: 42\nd: 4.0\n', None),
+    'dynscope': ("""
+VAR --type int --name g --set 5
+DEF --create useg --input x
+SUM --input x --input g --output r
+RETURN r
+END
+VAR --type int --name a --set 1
+DEF --call useg --input a --save out
+PRI --print out
+""", 'out: 6\n', None),
+    'arrays': ("""
+ARR --array --create arr --max 5
+VAR --type int --name v --set 9
+ARR --array --name arr --set_data v --pos 2
+ARR --array --name arr --get_data 2 --save w
+PRI --print w
+PRI --print arr
+""", 'w: 9\narr: [0, 0, 9, 0, 0]\n', None),
+    'files': ("""
+FILE --read in.txt --save content
+PRI --print content
+FILE --save content --to out_tmp.txt
+FILE --read out_tmp.txt --save c2
+PRI --print c2
+""", 'content: hello file\n\nc2: hello file\n\n', None),
+    'imp': ("""
+IMP --from lib.txt --import sq
+VAR --type int --name z --set 6
+DEF --call sq --input z --save zz
+PRI --print zz
+""", 'zz: 36\n', None),
+    'load': ("""
+VAR --type int --name num1 --set 7
+VAR --type int --name num2 --set 3
+LOAD --from Math.cls --input num1 --input num2 --save sum_out --save product_out
+LOAD --from Math.cls --input num1 --input product_out --save sum_out --save product_out
+PRI --print sum_out
+PRI --print product_out
+""", '', "Error: Output variable 'sum_out' not defined in class 'MathOperations'"),
+    'mem': ("""
+VAR --type int --name a --set 1
+MEM --release a
+PRI --print a
+""", '', "Line 3: Lỗi: Biến 'a' không tồn tại."),
+    'err_parse': ("""
+VAR --type int --name a --set 1
+BOGUS line
+""", '', "Line 2: Error: Unable to parse line: 'BOGUS line'"),
+    'err_undef': ("""
+VAR --type int --name a --set 1
+SUM --input a --input q --output z
+""", '', "Line 2: Error: Variable 'q' not defined"),
+    'err_inblock': ("""
+VAR --type int --name a --set 1
+FOR --start 1 --end 2 --step 1
+  VAR --type int --name b --set 1
+  SUM --input a --input q --output z
+END
+""", '', "Line 5: Line 2: Error: Variable 'q' not defined"),
+    'err_divzero': ("""
+VAR --type int --name a --set 1
+VAR --type int --name z --set 0
+DIVIDE --input a --input z --output q
+""", '', 'Line 3: Error: Division by zero'),
+    'err_end': ("""
+VAR --type int --name a --set 1
+END
+""", '', "Error: 'END' without matching block"),
+    'err_cond': ("""
+VAR --type int --name a --set 1
+IF a > > 2
+PRI --print a
+END
+""", '', "Line 4: Error: Invalid condition 'a > > 2'"),
+    'return_top': ("""
+DEF --create f --input x
+IF x > 0
+ RETURN x
+END
+RETURN x
+END
+VAR --type int --name q --set 3
+DEF --call f --input q --save r
+PRI --print r
+""", 'r: 3\n', None),
+    'unparsed_dead': ("""
+VAR --type int --name a --set 1
+IF a > 5
+  TOTALLY BOGUS
+END
+PRI --print a
+""", 'a: 1\n', None),
+    'arg_count': ("""
+DEF --create f --input x
+RETURN x
+END
+VAR --type int --name a --set 1
+DEF --call f --input a --input a --save r
+""", '', "Error: Function 'f' expects 1 arguments, got 2"),
+    'fib_iter': ("""
+VAR --type int --name a --set 0
+VAR --type int --name b --set 1
+FOR --start 1 --end 20 --step 1
+  SUM --input a --input b --output t
+  VAR --type int --name a2 --set 0
+  SUM --input b --input a2 --output a
+  SUM --input t --input a2 --output b
+END
+PRI --print a
+""", 'a: 6765\n', None),
+    'fib_rec': ("""
+VAR --type int --name one --set 1
+VAR --type int --name two --set 2
+DEF --create fib --input n
+IF n < 2
+  RETURN n
+END
+VAR --type int --name fa
+VAR --type int --name fb
+VAR --type int --name a
+VAR --type int --name b
+SUBTRACT --input n --input one --output a
+SUBTRACT --input n --input two --output b
+DEF --call fib --input a --save fa
+DEF --call fib --input b --save fb
+SUM --input fa --input fb --output r
+RETURN r
+END
+VAR --type int --name x --set 15
+DEF --call fib --input x --save out
+PRI --print out
+""", 'out: 610\n', None),
+    'ret_while': ("""
+VAR --type int --name one --set 1
+DEF --create f --input n
+VAR --type int --name k --set 0
+WHILE k < 100
+  SUM --input k --input one --output k
+  IF k == n
+    FOR --start 1 --end 3 --step 1
+      RETURN k
+    END
+  END
+END
+RETURN one
+END
+VAR --type int --name q --set 7
+DEF --call f --input q --save r
+PRI --print r
+""", 'r: 7\n', None),
+    'ret_top': ("""
+VAR --type int --name q --set 7
+RETURN q
+""", '', 'Error: RETURN statement outside of function'),
+    'err_in_func_in_for': ("""
+DEF --create f --input x
+IF x > 2
+  SUM --input x --input nope --output y
+END
+RETURN x
+END
+FOR --var k --start 1 --end 5 --step 1
+  VAR --type int --name t
+  DEF --call f --input k --save t
+END
+""", '', "Line 10: Line 3: Line 1: Error: Variable 'nope' not defined"),
+    'err_else_stray': ("""
+VAR --type int --name a --set 1
+FOR --start 1 --end 2 --step 1
+ELSE
+END
+""", '', "Line 4: Line 1: Error: Unknown command 'ELSE'"),
+    'err_parse_nested': ("""
+VAR --type int --name a --set 1
+WHILE a < 3
+  IF a == 1
+    WHAT
+  ELSE
+    PRI --print a
+  END
+  SUM --input a --input a --output a
+END
+""", '', "Line 9: Line 5: Line 1: Error: Unable to parse line: 'WHAT'"),
+    'noreturn': ("""
+DEF --create f --input x
+VAR --type int --name y --set 1
+END
+VAR --type int --name a --set 1
+DEF --call f --input a --save r
+PRI --print r
+""", 'r: None\n', None),
+    'missing_end': ("""
+VAR --type int --name a --set 1
+IF a == 1
+PRI --print a
+""", 'a: 1\n', None),
+    'class_for': ("""
+VAR --type int --name num1 --set 2
+VAR --type int --name num2 --set 5
+FOR --start 1 --end 3 --step 1
+  LOAD --from Math.cls --input num1 --input num2 --save sum_out --save product_out
+END
+PRI --print product_out
+""", '', "Line 5: Error: Output variable 'sum_out' not defined in class 'MathOperations'"),
+    'imp_in_func': ("""
+DEF --create g --input x
+IMP --from lib.txt --import sq
+DEF --call sq --input x --save r
+RETURN r
+END
+VAR --type int --name a --set 9
+DEF --call g --input a --save o
+PRI --print o
+""", 'o: 81\n', None),
+    'zero_args': ("""
+DEF --create k
+VAR --type int --name v --set 42
+RETURN v
+END
+DEF --call k --save o
+PRI --print o
+""", 'o: 42\n', None),
+    'calc': ("""
+VAR --type int --name a --set 7
+VAR --type float --name x --set 2.5
+CALC --expr "(a + 3) * x - a / 2" --output r
+PRI --print r
+""", 'r: 21.5\n', None),
+    'memo_fib': ("""
+VAR --type int --name one --set 1
+VAR --type int --name two --set 2
+DEF --create fib --input n --memo 64
+IF n < 2
+  RETURN n
+END
+VAR --type int --name p
+VAR --type int --name q
+CALC --expr "n - one" --output p
+CALC --expr "n - two" --output q
+DEF --call fib --input p --save p
+DEF --call fib --input q --save q
+CALC --expr "p + q" --output r
+RETURN r
+END
+VAR --type int --name x --set 20
+DEF --call fib --input x --save out
+PRI --print out
+""", 'out: 6765\n', None),
+    'typed_arrays': ("""
+ARR --array --create xs --max 4 --type int
+ARR --array --create ys --max 4 --type int
+ARR --array --name xs --fill 3
+ARR --array --name ys --fill 4
+SUM --input xs --input ys --output zs
+ARR --array --name zs --reduce sum --save total
+PRI --print total
+ARR --array --name zs --sort --reverse
+PRI --print zs
+""", "total: 28\nzs: array('q', [7, 7, 7, 7])\n", None),
+    'for_lines': ("""
+FILE --open lines.txt --mode read --save fh
+VAR --type int --name n --set 0
+VAR --type int --name one --set 1
+FOR --var line --in fh
+  SUM --input n --input one --output n
+  PRI --print line
+END
+PRI --print n
+""", 'line: alpha\nline: beta\nline: gamma\nn: 3\n', None),
+    'file_handles': ("""
+FILE --open out_h.txt --mode write --save w
+VAR --type str --name s --set hi
+FILE --write s --to w --newline
+FILE --write s --to w
+MEM --release w
+FILE --open out_h.txt --mode read --save r
+FILE --read_line r --save l1 --eof e
+FILE --read_line r --save l2 --eof e
+PRI --print l1
+PRI --print l2
+PRI --print e
+""", 'l1: hi\nl2: hi\ne: 0\n', None),
+    'deep_block_error': ("""
+VAR --type int --name a --set 1
+FOR --var i --start 1 --end 2 --step 1
+  WHILE a < 3
+    IF a == 2
+      DEF --call nope --save z
+    END
+    SUM --input a --input i --output a
+  END
+END
+""", '', "Line 9: Line 6: Line 3: Error: Function 'nope' is not defined"),
+}
+
+ENGINES = {'tree': {}, 'vm': {'use_vm': True}}
+
+
+def run_script(code, **options):
+    """
+    Chạy kịch bản ở chế độ 'silent', trả về (đầu ra, thông báo lỗi, Interpreter).
+    """
+    output = io.StringIO()
+    interpreter = Interpreter(verbosity='silent', output=output, **options)
+    error = None
+    try:
+        interpreter.interpret(code)
+    except InterpreterError as e:
+        error = str(e)
+    return output.getvalue(), error, interpreter
+
+
+class FixtureTestCase(unittest.TestCase):
+    """
+    Chạy mỗi kiểm thử trong một thư mục tạm chứa các tập tin của FIXTURES.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        for name, content in FIXTURES.items():
+            with open(os.path.join(self.tmpdir, name), 'w', encoding='utf8') as file:
+                file.write(content)
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+
+class CorpusTest(FixtureTestCase):
+    def test_expected_output(self):
+        for engine, options in ENGINES.items():
+            for name, (code, output, error) in CORPUS.items():
+                with self.subTest(engine=engine, case=name):
+                    self.assertEqual(run_script(code, **options)[:2], (output, error))
+
+    def test_vm_matches_tree(self):
+        # Cả vết thực thi ('trace') và biến toàn cục phải giống nhau giữa hai bộ máy
+        for name, (code, _, _) in CORPUS.items():
+            with self.subTest(case=name):
+                results = []
+                for options in ENGINES.values():
+                    output = io.StringIO()
+                    interpreter = Interpreter(output=output, **options)
+                    try:
+                        interpreter.interpret(code)
+                    except InterpreterError as e:
+                        output.write(f"{e}\n")
+                    variables = {name: repr(var) for name, var in interpreter.global_variables.items()}
+                    results.append((output.getvalue(), variables, len(interpreter.variables)))
+                self.assertEqual(results[0], results[1])
+
+
+class ArrayOverflowTest(unittest.TestCase):
+    def test_values_outside_int64_raise_interpreter_error(self):
+        scripts = {
+            "VAR --type int --name v --set 99999999999999999999\nARR --array --name a --set_data v --pos 0":
+                "Line 3: Lỗi: Giá trị '99999999999999999999' vượt quá phạm vi int64 của mảng 'a'",
+            "ARR --array --name a --fill 99999999999999999999":
+                "Line 2: Lỗi: Giá trị '99999999999999999999' vượt quá phạm vi int64 của mảng 'a'",
+            "VAR --type float --name v --set inf\nARR --array --name a --set_data v --pos 0":
+                "Line 3: Lỗi: Giá trị 'inf' không phù hợp với kiểu phần tử của mảng 'a'",
+            "VAR --type float --name v --set 1e300\nARR --array --name a --set_data v --pos 0":
+                "Line 3: Lỗi: Giá trị '1e+300' vượt quá phạm vi int64 của mảng 'a'",
+            "ARR --array --name a --fill 9223372036854775807\nSUM --input a --input a --output b":
+                "Line 3: Error: SUM result does not fit in a 64-bit integer array",
+        }
+        for engine, options in ENGINES.items():
+            for script, error in scripts.items():
+                with self.subTest(engine=engine, script=script):
+                    code = "ARR --array --create a --max 2 --type int\n" + script
+                    self.assertEqual(run_script(code, **options)[1], error)
+
+
+class ListArrayTest(unittest.TestCase):
+    def test_elementwise_on_mixed_list_array(self):
+        code = """
+ARR --array --create a --max 3
+VAR --type float --name f --set 1.5
+VAR --type int --name k --set 2
+ARR --array --name a --set_data f --pos 0
+ARR --array --name a --set_data k --pos 1
+SUM --input a --input a --output b
+MULTIPLY --input a --input k --output c
+PRI --print b
+PRI --print c
+"""
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                self.assertEqual(run_script(code, **options)[:2],
+                                 ("b: array('d', [3.0, 4.0, 0.0])\nc: array('d', [3.0, 4.0, 0.0])\n", None))
+
+
+class AsyncLimitsTest(FixtureTestCase):
+    SCRIPT = "VAR --type int --name a --set 1\nVAR --type int --name b --set 2\nVAR --type int --name c --set 3"
+
+    def test_instruction_budget_boundary(self):
+        interpreter = Interpreter(verbosity='silent')
+        asyncio.run(interpreter.interpret_async(self.SCRIPT, max_instructions=3))
+        self.assertEqual(interpreter.get_variable('c').value, 3)
+
+        interpreter = Interpreter(verbosity='silent')
+        with self.assertRaises(InterpreterError) as raised:
+            asyncio.run(interpreter.interpret_async(self.SCRIPT, max_instructions=2))
+        self.assertEqual(str(raised.exception), "Line 3: Error: Instruction budget of 2 exceeded")
+        self.assertEqual(interpreter.get_variable('b').value, 2)
+        self.assertIsNone(interpreter.get_variable('c'))
+
+    def test_budget_with_small_yield_window(self):
+        for budget, executed in ((3, True), (2, False)):
+            interpreter = Interpreter(verbosity='silent')
+            try:
+                asyncio.run(interpreter.interpret_async(self.SCRIPT, yield_every=1, max_instructions=budget))
+            except InterpreterError:
+                pass
+            self.assertEqual(interpreter.get_variable('c') is not None, executed)
+
+    def test_runaway_loaded_class_can_be_cancelled(self):
+        # Vòng lặp vô hạn trong lớp được LOAD vẫn nhường vòng lặp sự kiện
+        code = "VAR --type int --name n --set 1\nLOAD --from Spin.cls --input n --save m"
+        interpreter = Interpreter(verbosity='silent')
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(interpreter.interpret_async(code, yield_every=100), timeout=0.2))
+        self.assertEqual((interpreter.running, len(interpreter.variables)), (0, 1))
+        self.assertIsNone(interpreter.get_variable('m'))
+
+        interpreter = Interpreter(verbosity='silent')
+        with self.assertRaises(InterpreterError) as raised:
+            asyncio.run(interpreter.interpret_async(code, yield_every=100, timeout=0.1))
+        self.assertIn("Time budget of 0.1s exceeded", str(raised.exception))
+        self.assertEqual((interpreter.running, len(interpreter.variables)), (0, 1))
+
+    def test_nested_imports_share_the_budget(self):
+        # Mỗi IMP tốn 1 lệnh cộng 2 lệnh DEF của lib.txt: tổng cộng 7 lệnh
+        code = "IMP --from lib.txt --import sq\nIMP --from lib.txt --import sq\nVAR --type int --name d --set 4"
+        for yield_every in (1000, 3, 2):
+            for budget, executed in ((7, True), (6, False), (5, False)):
+                with self.subTest(yield_every=yield_every, budget=budget):
+                    interpreter = Interpreter(verbosity='silent')
+                    try:
+                        asyncio.run(interpreter.interpret_async(code, yield_every=yield_every,
+                                                                max_instructions=budget))
+                    except InterpreterError as e:
+                        self.assertIn(f"Instruction budget of {budget} exceeded", str(e))
+                    self.assertEqual(interpreter.get_variable('d') is not None, executed)
+
+
+class CallDepthTest(unittest.TestCase):
+    SCRIPT = """
+VAR --type int --name one --set 1
+DEF --create down --input n
+IF n < 1
+  RETURN n
+END
+VAR --type int --name m
+SUBTRACT --input n --input one --output m
+DEF --call down --input m --save m
+RETURN m
+END
+VAR --type int --name x --set {depth}
+DEF --call down --input x --save out
+PRI --print out
+"""
+
+    def test_default_max_call_depth_is_reachable(self):
+        # Không phụ thuộc sys.getrecursionlimit(): cả 1000 lời gọi lồng nhau đều chạy được
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                self.assertEqual(run_script(self.SCRIPT.format(depth=999), **options)[:2], ("out: 0\n", None))
+                self.assertEqual(run_script(self.SCRIPT.format(depth=1000), **options)[1],
+                                 "Error: Maximum call depth 1000 exceeded in function 'down'")
+
+    def test_return_does_not_raise(self):
+        # RETURN trả giá trị qua thanh ghi return_value, không qua FunctionReturn
+        def fail(exception, value):
+            raise AssertionError("FunctionReturn raised")
+        original = python.FunctionReturn.__init__
+        python.FunctionReturn.__init__ = fail
+        try:
+            for engine, options in ENGINES.items():
+                with self.subTest(engine=engine):
+                    self.assertEqual(run_script(self.SCRIPT.format(depth=5), **options)[:2], ("out: 0\n", None))
+        finally:
+            python.FunctionReturn.__init__ = original
+
+    def test_deeper_recursion_with_higher_limit(self):
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                output, error, _ = run_script(self.SCRIPT.format(depth=20000), max_call_depth=50000, **options)
+                self.assertEqual((output, error), ("out: 0\n", None))
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_forks_share_code_but_not_state(self):
+        # Bytecode đã lưu đệm được dùng chung nên không được gắn với Interpreter đã hạ nó
+        for options in ENGINES.values():
+            original = Interpreter(verbosity='silent', **options)
+            original.interpret("VAR --type int --name x --set 1")
+            snapshot = original.snapshot()
+            first = Interpreter.from_snapshot(snapshot)
+            first.interpret("VAR --type int --name x --set 99")
+            second = original.fork()
+            second.interpret("VAR --type int --name x --set 99")
+            second.interpret("VAR --type int --name y --set 5")
+            self.assertEqual(original.get_variable('x').value, 1)
+            self.assertEqual(first.get_variable('x').value, 99)
+            self.assertEqual(second.get_variable('x').value, 99)
+            self.assertIsNone(first.get_variable('y'))
+
+    def test_memoized_functions_are_copied(self):
+        # Mỗi bản fork/restore có bộ nhớ đệm DEF --memo riêng
+        for options in ENGINES.values():
+            original = Interpreter(verbosity='silent', **options)
+            original.interpret("""
+DEF --create sq --input x --memo
+MULTIPLY --input x --input x --output r
+RETURN r
+END
+VAR --type int --name a --set 3
+DEF --call sq --input a --save b
+""")
+            snapshot = original.snapshot()
+            fork = original.fork()
+            fork.interpret("DEF --call sq --input a --save b\nVAR --type int --name a --set 4\nDEF --call sq --input a --save b")
+            restored = Interpreter(verbosity='silent', **options)
+            restored.restore(snapshot)
+            self.assertEqual(fork.get_variable('b').value, 16)
+            self.assertEqual(fork.functions['sq'].memo.stats(), {'hits': 1, 'misses': 2, 'size': 2, 'maxsize': 128})
+            self.assertEqual(original.functions['sq'].memo.stats(), {'hits': 0, 'misses': 1, 'size': 1, 'maxsize': 128})
+            self.assertEqual(restored.functions['sq'].memo.stats(), original.functions['sq'].memo.stats())
+            restored.functions['sq'].memo.clear()
+            self.assertEqual(restored.functions['sq'].memo.stats()['size'], 0)
+            self.assertEqual(len(original.functions['sq'].memo.entries), 1)
+
+    def test_shared_caches_are_bounded(self):
+        interpreter = Interpreter(use_vm=True, verbosity='silent', code_cache_size=16)
+        fork = interpreter.fork()
+        for i in range(200):
+            fork.interpret(f"VAR --type int --name x --set {i}\nIF x > {i}\nEND")
+        self.assertIs(fork.compiled, interpreter.compiled)
+        self.assertEqual(len(interpreter.compiled), 16)
+        self.assertEqual(fork.get_variable('x').value, 199)
+
+
+class ParallelLoadTest(FixtureTestCase):
+    SETUP = "VAR --type int --name base --set 0\nVAR --type int --name seen --set 0\n" + "".join(
+        f"VAR --type int --name n{k} --set {k}\n" for k in range(1, 7))
+    LOADS = "".join(f"LOAD --from Step.cls --input n{k} --save r{k} --save s{k}\n" for k in range(1, 7))
+
+    def results(self, interpreter):
+        return [(interpreter.get_variable(f'r{k}').value, interpreter.get_variable(f's{k}').value)
+                for k in range(1, 7)]
+
+    def test_parallel_matches_sequential_load(self):
+        _, error, sequential = run_script(self.SETUP + self.LOADS)
+        self.assertIsNone(error)
+        self.assertEqual([r for r, _ in self.results(sequential)], [2, 3, 4, 5, 6, 7])
+        for engine, options in ENGINES.items():
+            for workers in (1, 2):
+                with self.subTest(engine=engine, workers=workers):
+                    code = f"{self.SETUP}LOAD --parallel --workers {workers}\n{self.LOADS}END\n"
+                    for _ in range(3):
+                        _, error, interpreter = run_script(code, **options)
+                        self.assertIsNone(error)
+                        results = self.results(interpreter)
+                        self.assertEqual([r for r, _ in results], [r for r, _ in self.results(sequential)])
+                        # Mỗi lớp thấy biến toàn cục ban đầu; thay đổi của lớp không được đưa về
+                        self.assertEqual([s for _, s in results], [k + 2 for k in range(1, 7)])
+                        self.assertEqual(interpreter.get_variable('seen').value, 0)
+
+
+class FileCacheTest(FixtureTestCase):
+    CODE = "IMP --from mod.txt --import f\nDEF --call f --save r\nPRI --print r\n"
+
+    def write_module(self, value, mtime_ns=None):
+        with open('mod.txt', 'w', encoding='utf8') as file:
+            file.write(f"DEF --create f\nVAR --type int --name x --set {value}\nRETURN x\nEND\n")
+        if mtime_ns is not None:
+            os.utime('mod.txt', ns=(mtime_ns, mtime_ns))
+
+    def run_on(self, interpreter):
+        interpreter.output = io.StringIO()
+        interpreter.interpret(self.CODE)
+        return interpreter.output.getvalue()
+
+    def test_rewritten_import_runs_new_code(self):
+        for engine, options in ENGINES.items():
+            for cache_dir in (None, 'cache'):
+                with self.subTest(engine=engine, cache_dir=cache_dir):
+                    interpreter = Interpreter(verbosity='silent', cache_dir=cache_dir, **options)
+                    self.write_module(1, mtime_ns=10**18)
+                    self.assertEqual(self.run_on(interpreter), 'r: 1\n')
+                    # Kích thước thay đổi, mtime giữ nguyên
+                    self.write_module(22, mtime_ns=10**18)
+                    self.assertEqual(self.run_on(interpreter), 'r: 22\n')
+                    # Cùng kích thước, chỉ mtime thay đổi
+                    self.write_module(33, mtime_ns=10**18 + 1)
+                    self.assertEqual(self.run_on(interpreter), 'r: 33\n')
+                    # Một Interpreter mới không dùng lại bản cũ trên đĩa
+                    fresh = Interpreter(verbosity='silent', cache_dir=cache_dir, **options)
+                    self.assertEqual(self.run_on(fresh), 'r: 33\n')
+
+    def test_stale_or_corrupt_disk_cache_is_ignored(self):
+        self.write_module(1)
+        self.assertEqual(self.run_on(Interpreter(verbosity='silent', cache_dir='cache')), 'r: 1\n')
+        [name] = os.listdir('cache')
+        path = os.path.join('cache', name)
+        self.assertTrue(name.endswith(python.CACHE_SUFFIX))
+
+        stat = os.stat('mod.txt')
+        key = (os.path.realpath('mod.txt'), 'script')
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        other = Interpreter(verbosity='silent')._compile_source(
+            "DEF --create f\nVAR --type int --name x --set 9\nRETURN x\nEND\n")
+
+        def cached(version, payload):
+            with open(path, 'wb') as file:
+                pickle.dump((version, key, stamp, payload), file)
+            return self.run_on(Interpreter(verbosity='silent', cache_dir='cache'))
+
+        # Bản đệm hợp lệ được dùng thay cho mã nguồn
+        self.assertEqual(cached(python.CACHE_VERSION, other), 'r: 9\n')
+        # Bản đệm của phiên bản khác bị bỏ qua và được ghi lại
+        self.assertEqual(cached(python.CACHE_VERSION - 1, other), 'r: 1\n')
+        with open(path, 'rb') as file:
+            self.assertEqual(pickle.load(file)[0], python.CACHE_VERSION)
+        # Tập tin hỏng bị bỏ qua
+        for content in (b'', b'not a pickle', b'\x80\x05garbage'):
+            with self.subTest(content=content):
+                with open(path, 'wb') as file:
+                    file.write(content)
+                self.assertEqual(self.run_on(Interpreter(verbosity='silent', cache_dir='cache')), 'r: 1\n')
+
+
+class VerbosityTest(FixtureTestCase):
+    CODE = """\
+VAR --type int --name a --set 1
+PRI --print a
+SUM --input a --input a --output a
+DEF --call nope --save z
+PRI --print a
+"""
+    ERROR = "Error: Function 'nope' is not defined"
+    EXPECTED = {
+        'silent': "a: 1\n",
+        'errors': f"a: 1\n{ERROR}\n",
+        'trace': "Declared variable: int a = 1\na: 1\nSum result stored in a = 2\n",
+    }
+
+    def run_modes(self, verbosity, **options):
+        """
+        Chạy CODE bằng interpret, interpret_stream và interpret_async; trả về {cách chạy: (đầu ra, lỗi)}.
+        """
+        runners = {
+            'interpret': lambda interpreter: interpreter.interpret(self.CODE),
+            'stream': lambda interpreter: interpreter.interpret_stream(iter(self.CODE.splitlines(True))),
+            'async': lambda interpreter: asyncio.run(interpreter.interpret_async(self.CODE)),
+        }
+        results = {}
+        for name, runner in runners.items():
+            output = io.StringIO()
+            interpreter = Interpreter(verbosity=verbosity, output=output, **options)
+            with self.assertRaises(InterpreterError) as caught:
+                runner(interpreter)
+            results[name] = (output.getvalue(), str(caught.exception))
+        return results
+
+    def test_output_for_failing_script(self):
+        for engine, options in ENGINES.items():
+            for verbosity, expected in self.EXPECTED.items():
+                for name, result in self.run_modes(verbosity, **options).items():
+                    with self.subTest(engine=engine, verbosity=verbosity, mode=name):
+                        # Lỗi luôn được ném ra; chỉ 'errors' ghi nó ra đầu ra
+                        self.assertEqual(result, (expected, self.ERROR))
+
+    def test_nested_error_is_written_once(self):
+        with open('bad.txt', 'w', encoding='utf8') as file:
+            file.write("VAR --type int --name b --set 1\nDEF --call nope --save z\n")
+        code = "FOR --var i --start 1 --end 2 --step 1\n  IMP --from bad.txt --import f\nEND\n"
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                output = io.StringIO()
+                interpreter = Interpreter(verbosity='errors', output=output, **options)
+                with self.assertRaises(InterpreterError) as caught:
+                    interpreter.interpret(code)
+                # Chỉ lần chạy ngoài cùng ghi lỗi, không lặp lại ở mỗi cấp lồng nhau
+                self.assertEqual(str(caught.exception), f"Line 3: {self.ERROR}")
+                self.assertEqual(output.getvalue(), f"Line 3: {self.ERROR}\n")
+
+    def test_trace_handler_receives_records(self):
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                output, batches = io.StringIO(), []
+                interpreter = Interpreter(verbosity='trace', output=output, trace_handler=batches.append,
+                                          **options)
+                with self.assertRaises(InterpreterError):
+                    interpreter.interpret(self.CODE)
+                # Trạng thái được gửi tới trace_handler (kể cả khi lỗi), đầu ra chỉ còn PRI
+                self.assertEqual(output.getvalue(), "a: 1\n")
+                self.assertEqual([event for batch in batches for event, _ in batch], ['var', 'arithmetic'])
+
+    def test_unknown_verbosity(self):
+        with self.assertRaises(InterpreterError):
+            Interpreter(verbosity='debug')
+
+
+class ReadChunkTest(FixtureTestCase):
+    # 11 ký tự; 'đ' chiếm hai byte nên ranh giới khối được tính theo ký tự
+    CONTENT = "abcđefghijk"
+
+    def chunks(self, size, reads, **options):
+        with open('data.txt', 'w', encoding='utf8') as file:
+            file.write(self.CONTENT)
+        code = "FILE --open data.txt --mode read --save fh\n" + \
+            f"FILE --read_chunk fh --size {size} --save c\nPRI --print c\n" * reads
+        output, error, _ = run_script(code, **options)
+        self.assertIsNone(error)
+        return [line[len('c: '):] for line in output.split('\n')[:-1]]
+
+    def test_chunk_boundaries(self):
+        for engine, options in ENGINES.items():
+            for size in (1, 3, 4, 10, 11, 12, 50):
+                with self.subTest(engine=engine, size=size):
+                    full = -(-len(self.CONTENT) // size)
+                    chunks = self.chunks(size, full + 2, **options)
+                    expected = [self.CONTENT[i:i + size] for i in range(0, len(self.CONTENT), size)]
+                    self.assertEqual(chunks[:full], expected)
+                    # Khối cuối có thể ngắn hơn size; sau đó là chuỗi rỗng (hết tập tin)
+                    self.assertEqual(len(chunks[full - 1]), len(self.CONTENT) - (full - 1) * size)
+                    self.assertEqual(chunks[full:], ['', ''])
+
+    def test_size_from_variable(self):
+        with open('data.txt', 'w', encoding='utf8') as file:
+            file.write(self.CONTENT)
+        code = ("VAR --type int --name n --set 4\nFILE --open data.txt --mode read --save fh\n"
+                "FILE --read_chunk fh --size n --save c\nFILE --read_chunk fh --size n --save d\n"
+                "PRI --print c\nPRI --print d\n")
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                self.assertEqual(run_script(code, **options)[:2], ("c: abcđ\nd: efgh\n", None))
+
+    def test_invalid_size(self):
+        for engine, options in ENGINES.items():
+            for size in (0, -1):
+                with self.subTest(engine=engine, size=size):
+                    code = (f"VAR --type int --name n --set {size}\nFILE --open lines.txt --mode read --save fh\n"
+                            "FILE --read_chunk fh --size n --save c\n")
+                    self.assertEqual(run_script(code, **options)[:2],
+                                     ('', "Line 3: Lỗi: Lệnh FILE --read_chunk cần kích thước lớn hơn 0"))
+
+
+class MemoryLimitTest(FixtureTestCase):
+    def test_elementwise_result_is_reserved_first(self):
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                code = "ARR --array --create a --max 1000 --type int\nSUM --input a --input a --output b"
+                output, error, interpreter = run_script(code, memory_limit=12000, **options)
+                self.assertEqual(error, "Line 2: Error: Memory limit of 12000 bytes exceeded by SUM b (16080 bytes)")
+                self.assertIsNone(interpreter.get_variable('b'))
+
+    def test_mem_stats(self):
+        code = """
+VAR --type int --name a --set 1000
+VAR --type str --name s --set hello
+ARR --array --create arr --max 10 --type int
+FOR --var i --start 5000 --end 5000 --step 1
+  MEM --stats
+END
+"""
+        sizes = {'a': sys.getsizeof(1000), 's': sys.getsizeof('hello'),
+                 'arr': sys.getsizeof(array.array('q', [0] * 10)), 'i': sys.getsizeof(5000)}
+        total = sum(sizes.values())
+        expected = (f"Memory: 4 variables, {total} bytes (limit 100000)\n"
+                    f"  global: 3 variables, {total - sizes['i']} bytes\n"
+                    f"  scope 1: 1 variables, {sizes['i']} bytes\n"
+                    f"  array: 1 variables, {sizes['arr']} bytes\n"
+                    f"  int: 2 variables, {sizes['a'] + sizes['i']} bytes\n"
+                    f"  str: 1 variables, {sizes['s']} bytes\n")
+        largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)
+        types = {'a': 'int', 's': 'str', 'arr': 'array', 'i': 'int'}
+        expected += "".join(f"  largest: {name} ({types[name]}) {size} bytes\n" for name, size in largest)
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                self.assertEqual(run_script(code, memory_limit=100000, **options)[:2], (expected, None))
+
+    def test_running_total_matches_variables(self):
+        # Tổng cập nhật dần phải bằng tổng tính lại từ đầu sau lời gọi hàm, khối và MEM --release
+        code = """
+DEF --create f --input x --input y
+ARR --array --create tmp --max 50 --type int
+VAR --type str --name t --set scratch
+RETURN y
+END
+ARR --array --create arr --max 100 --type float
+VAR --type int --name n --set 123456
+FOR --var i --start 1 --end 3 --step 1
+  DEF --call f --input arr --input n --save m
+  VAR --type str --name inner --set abc
+END
+VAR --type str --name gone --set released
+MEM --release gone
+FILE --open lines.txt --mode read --save fh
+FILE --read_line fh --save line
+"""
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                _, error, interpreter = run_script(code, memory_limit=10 ** 7, **options)
+                self.assertIsNone(error)
+                self.assertEqual(interpreter.memory_used, interpreter.memory_stats()['bytes'])
+
+    def test_read_line_is_bounded_before_reading(self):
+        with open('long.txt', 'w', encoding='utf8') as file:
+            file.write('x' * 100000 + '\nshort\n')
+        code = "FILE --open long.txt --mode read --save fh\nFILE --read_line fh --save line"
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                _, error, interpreter = run_script(code, memory_limit=20000, **options)
+                self.assertIn("Memory limit of 20000 bytes exceeded by FILE --read_line fh", error)
+                # Chỉ phần vừa với giới hạn (cộng một ký tự) được đọc
+                self.assertLessEqual(interpreter.get_variable('fh').value.file.tell(), 20000)
+                interpreter.get_variable('fh').value.close()
+
+    def test_reservation_does_not_walk_variables(self):
+        code = "".join(f"VAR --type int --name v{k} --set {k + 1000}\n" for k in range(300))
+        code += "FILE --open lines.txt --mode read --save fh\n"
+        code += "FOR --var k --start 1 --end 200 --step 1\n  FILE --read_line fh --save line\nEND\n"
+        calls = []
+        original = Interpreter._variable_size
+
+        def counting(var, seen):
+            calls.append(var.name)
+            return original(var, seen)
+        Interpreter._variable_size = staticmethod(counting)
+        try:
+            self.assertIsNone(run_script(code, memory_limit=10 ** 7)[1])
+        finally:
+            Interpreter._variable_size = staticmethod(original)
+        self.assertLess(len(calls), 2000)
+
+    def test_parallel_workers_keep_memory_limit(self):
+        interpreter = Interpreter(verbosity='silent', memory_limit=100000)
+        interpreter.interpret("VAR --type int --name n --set 1")
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                with self.assertRaises(InterpreterError) as raised:
+                    interpreter.run_many([{'path': 'Big.cls', 'inputs': ['n'], 'saves': ['o']}] * 2, workers=workers)
+                self.assertIn("Memory limit of 100000 bytes exceeded by ARR --create big", str(raised.exception))
+
+
+class ConditionTest(unittest.TestCase):
+    def test_conditions_compile_once_per_instruction(self):
+        # Số điều kiện trong thân vòng lặp vượt quá code_cache_size không làm biên dịch lại
+        body = "".join(f"  IF k == {i}\n    SUM --input n --input one --output n\n  END\n" for i in range(40))
+        code = ("VAR --type int --name n --set 0\nVAR --type int --name one --set 1\n"
+                f"FOR --var k --start 0 --end 49 --step 1\n{body}END\nPRI --print n\n")
+        compiled = []
+        original = python.Condition.__init__
+
+        def counting_init(condition, source):
+            compiled.append(source)
+            original(condition, source)
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                del compiled[:]
+                python.Condition.__init__ = counting_init
+                try:
+                    result = run_script(code, code_cache_size=8, **options)
+                finally:
+                    python.Condition.__init__ = original
+                self.assertEqual(result[:2], ("n: 40\n", None))
+                self.assertEqual(len(compiled), 40)
+
+    SETUP = "VAR --type int --name a --set 1\nVAR --type int --name b --set 2\nVAR --type str --name s --set abc\n"
+
+    def run_condition(self, condition, **options):
+        code = f"{self.SETUP}IF {condition}\n  PRI --print a\nELSE\n  PRI --print b\nEND\n"
+        output, error, _ = run_script(code, **options)
+        return {'a: 1\n': True, 'b: 2\n': False}.get(output, output), error
+
+    def test_logical_operators(self):
+        cases = {
+            'a == 1 AND b == 2': True,
+            'a == 1 AND b == 3': False,
+            'a == 2 OR b == 2': True,
+            'a == 2 OR b == 3': False,
+            'NOT a == 2': True,
+            'NOT NOT a == 1': True,
+            'NOT (a == 1 OR b == 2)': False,
+            '(a == 2 OR b == 2) AND s == abc': True,
+            'a < b < 3': True,
+            'a < b < 2': False,
+            # Ngắn mạch: vế phải (so sánh chuỗi với số) không được đánh giá
+            'a == 2 AND s < 1': False,
+            'a == 1 OR s < 1': True,
+        }
+        for engine, options in ENGINES.items():
+            for condition, expected in cases.items():
+                with self.subTest(engine=engine, condition=condition):
+                    self.assertEqual(self.run_condition(condition, **options), (expected, None))
+
+    def test_precedence(self):
+        # NOT gắn chặt hơn AND, AND gắn chặt hơn OR
+        cases = {
+            'a == 2 AND b == 2 OR a == 1': True,       # (F AND T) OR T
+            'a == 1 OR b == 3 AND a == 2': True,       # T OR (F AND F)
+            'NOT a == 1 OR b == 2': True,              # (NOT T) OR T
+            'NOT a == 2 AND b == 3': False,            # (NOT F) AND F
+            '(a == 1 OR b == 3) AND a == 2': False,
+        }
+        for engine, options in ENGINES.items():
+            for condition, expected in cases.items():
+                with self.subTest(engine=engine, condition=condition):
+                    self.assertEqual(self.run_condition(condition, **options), (expected, None))
+
+    def test_invalid_conditions(self):
+        conditions = ['a == 1 AND', 'a == 1 OR OR b == 2', '(a == 1', 'a == 1)', 'NOT', 'AND a == 1',
+                      'a > > 2', 's < 1']
+        for engine, options in ENGINES.items():
+            for condition in conditions:
+                with self.subTest(engine=engine, condition=condition):
+                    self.assertEqual(self.run_condition(condition, **options),
+                                     ('', f"Line 8: Error: Invalid condition '{condition}'"))
+
+
+class BenchTest(unittest.TestCase):
+    def test_bench_while_runs(self):
+        # Bộ đo hiệu năng dùng API nội bộ (evaluate_condition) nên phải chạy được sau mỗi thay đổi
+        import python_bench
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            python_bench.benchWhile(50)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "WHILE loop, 50 iterations")
+        self.assertEqual(len(lines), 4)
+
+
+class StreamTest(unittest.TestCase):
+    def test_stream_runs_statements_as_they_arrive(self):
+        for options in ENGINES.values():
+            output = io.StringIO()
+            interpreter = Interpreter(verbosity='silent', output=output, **options)
+            lines = iter(["VAR --type int --name a --set 2\n", "PRI --print a\n",
+                          "FOR --var i --start 1 --end 2 --step 1\n", "PRI --print i\n"])
+            stream = interpreter._compile_stream(lines)
+            interpreter.run([next(stream)])
+            interpreter.run([next(stream)])
+            self.assertEqual(output.getvalue(), "a: 2\n")
+            # Khối chưa có END thì chưa được chạy
+            interpreter.interpret_stream(iter(["VAR --type int --name b --set 1\n", "bad\n",
+                                               "PRI --print b\n"]), stop_on_error=False)
+            self.assertEqual(output.getvalue(), "a: 2\nLine 2: Error: Unable to parse line: 'bad'\nb: 1\n")
+
+    def test_stream_keeps_file_buffers(self):
+        # Sau mỗi lệnh chỉ đầu ra được đẩy; tập tin ghi được flush ở cuối dòng chảy
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'out.txt')
+        try:
+            for options in ENGINES.values():
+                stream = io.StringIO()
+                interpreter = Interpreter(verbosity='silent', output=python.OutputBuffer(stream), **options)
+                seen = []
+
+                def script():
+                    yield f"FILE --open {path} --mode write --save w\n"
+                    yield "VAR --type str --name s --set hi\n"
+                    for _ in range(3):
+                        yield "FILE --write s --to w --newline\n"
+                    yield "PRI --print s\n"
+                    seen.append((stream.getvalue(), os.path.getsize(path)))
+                    yield "VAR --type int --name done --set 1\n"
+                interpreter.interpret_stream(script())
+                self.assertEqual(seen, [("s: hi\n", 0)])
+                with open(path, encoding='utf8') as file:
+                    self.assertEqual(file.read(), "hi\n" * 3)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_stream_memory_is_constant(self):
+        def script(count):
+            for k in range(count):
+                yield f"VAR --type int --name v --set {k}\n"
+        for options in ENGINES.values():
+            interpreter = Interpreter(verbosity='silent', **options)
+            interpreter.interpret_stream(script(1000))
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                interpreter.interpret_stream(script(20000))
+                retained = tracemalloc.get_traced_memory()[0] - before
+            finally:
+                tracemalloc.stop()
+            self.assertLess(retained, 64 * 1024)
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_lines_are_keyed_by_source_line(self):
+        interpreter = Interpreter(verbosity='silent', profile=True)
+        interpreter.interpret("""
+VAR --type int --name a --set 0
+FOR --var i --start 1 --end 10 --step 1
+  SUM --input a --input i --output a
+END
+FOR --var j --start 1 --end 1000 --step 1
+  SUM --input a --input j --output a
+END
+""")
+        counts = {(row['line'], row['command']): row['count']
+                  for row in interpreter.profiler.to_dict()['lines']}
+        self.assertEqual(counts[(4, 'SUM')], 10)
+        self.assertEqual(counts[(7, 'SUM')], 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()